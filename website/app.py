@@ -12,6 +12,10 @@ import csrf
 from database import db, get_engine
 from database import bdb
 from database import bdb_refseq
+from database import sequence_store
+from database import response_cache
+from database import search_index
+from helpers.filters import FilterManager
 from assets import bundles
 from assets import DependencyManager
 from flask_celery import Celery
@@ -94,6 +98,26 @@ def create_app(config_filename='config.py', config_override={}):
     bdb.open(app.config['BDB_DNA_TO_PROTEIN_PATH'], mode=mode)
     bdb_refseq.open(app.config['BDB_GENE_TO_ISOFORM_PATH'], mode=mode)
 
+    if app.config.get('SEQUENCE_STORE_PATH'):
+        sequence_store.open(app.config['SEQUENCE_STORE_PATH'])
+    else:
+        sequence_store.close()
+
+    if app.config.get('RESPONSE_CACHE_ENABLED'):
+        response_cache.open(
+            app.config.get('RESPONSE_CACHE_PATH'),
+            app.config.get('RESPONSE_CACHE_CAPACITY')
+        )
+    else:
+        response_cache.close()
+
+    FilterManager.clear_parsed_states()
+
+    if app.config.get('SEARCH_INDEX_PATH'):
+        search_index.open(app.config['SEARCH_INDEX_PATH'])
+    else:
+        search_index.close()
+
     if app.config['USE_LEVENSTHEIN_MYSQL_UDF']:
         with app.app_context():
             for bind_key in ['bio', 'cms']:
@@ -140,6 +164,15 @@ def create_app(config_filename='config.py', config_override={}):
         for view in views:
             view.register(app)
 
+        # gene lists might differ between databases (e.g. in tests)
+        from website.views.search import gene_lists_names
+        gene_lists_names.clear()
+
+    # answer conditional requests to JSON endpoints with 304 Not Modified
+    # when the biological data did not change (see helpers.views.conditional_get)
+    from helpers.views import register_conditional_get
+    register_conditional_get(app)
+
     #
     # Register functions for Jinja
     #
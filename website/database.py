@@ -12,10 +12,16 @@ from berkley_db import BerkleyHashSet
 from flask_sqlalchemy import SQLAlchemy
 from genomic_mappings import GenomicMappings
 from helpers.parsers import chunked_list
+from response_cache import ResponseCache
+from search.index import SearchIndex, fuzzy_index_name
+from sequence_store import SequenceStore
 
 db = SQLAlchemy()
 bdb = GenomicMappings()
 bdb_refseq = BerkleyHashSet()
+sequence_store = SequenceStore()
+response_cache = ResponseCache()
+search_index = SearchIndex()
 
 
 def get_engine(bind_key, app=None):
@@ -106,9 +112,42 @@ def get_autoincrement(model):
     ).scalar()
 
 
-def levenshtein_sorted(sql_query, column, query):
+def levenshtein_sorted(sql_query, column, query, max_filtered=10000):
+    """Order the query by similarity of column values to given phrase.
+
+    If the fuzzy index of the column was built (see search.index.TrigramIndex)
+    the most similar entities are ranked in-process and the query is ordered
+    by their ranks; otherwise the levenshtein_ratio SQL function is used
+    (if SQL_LEVENSTHEIN is set).
+
+    The ranked entities are chosen among the ones selected by the query
+    (unless there are more than max_filtered of these), so that these
+    are not crowded out by similar entities which were filtered out.
+    """
     from flask import current_app
-    from sqlalchemy import desc
+    from sqlalchemy import desc, case
+
+    model = column.class_
+    allowed_ids = None
+
+    if fuzzy_index_name(column) in search_index:
+        # ids of entities selected by the query, whatever the selected columns
+        filtered = sql_query.add_columns(model.id.label('ranked_id')).order_by(None).subquery()
+        allowed_ids = {
+            entity_id
+            for entity_id, in db.session.query(filtered.c.ranked_id).limit(max_filtered + 1)
+        }
+        if len(allowed_ids) > max_filtered:
+            allowed_ids = None
+
+    ranked_ids = search_index.fuzzy_ranking(column, query, allowed_ids=allowed_ids)
+
+    if ranked_ids:
+        ranks = {entity_id: rank for rank, entity_id in enumerate(ranked_ids)}
+        return sql_query.order_by(
+            case(ranks, value=model.id, else_=len(ranks))
+        )
+
     if current_app.config['SQL_LEVENSTHEIN']:
         sql_query = sql_query.order_by(
             desc(
@@ -19,8 +19,9 @@ DEFAULT_HOST = '0.0.0.0'
 DEFAULT_PORT = 5000
 JSONIFY_PRETTYPRINT_REGULAR = False
 JSON_SORT_KEYS = False
-# Maximum allowed upload file is 25MB
-MAX_CONTENT_LENGTH = 25 * 1024 * 1024
+# Maximum allowed upload file is 250MB (VCF files can be uploaded
+# compressed; those are streamed from the disk, never read into memory)
+MAX_CONTENT_LENGTH = 250 * 1024 * 1024
 
 # -Relational database settings
 SQLALCHEMY_BINDS = {
@@ -33,6 +34,24 @@ SQLALCHEMY_TRACK_MODIFICATIONS = True
 BDB_DNA_TO_PROTEIN_PATH = 'databases/berkley_hash.db'
 BDB_GENE_TO_ISOFORM_PATH = 'databases/berkley_hash_refseq.db'
 
+# -Memory-mapped store of protein sequences and disorder data
+# (rebuilt by sequences and disorder importers; comment out to
+# read the sequences from the relational database instead)
+SEQUENCE_STORE_PATH = 'databases/sequences.store'
+
+# -Cache of JSON responses of protein, sequence and network views;
+# entries are kept in memory of each worker (up to RESPONSE_CACHE_CAPACITY)
+# and in a directory shared by all the workers (if the path is given).
+# Cached responses are invalidated when manage.py changes biological data.
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_PATH = 'databases/responses_cache'
+RESPONSE_CACHE_CAPACITY = 128
+
+# -In-memory index of gene symbols, names, RefSeq ids, protein names and UniProt
+# accessions, answering the search bar look-ups without the database; rebuilt
+# by manage.py after changes of biological data (comment out to disable).
+SEARCH_INDEX_PATH = 'databases/search.index'
+
 # -Application settings
 # counting everything in the database in order to prepare statistics might be
 # quite slow. It is helpful to turn stats generation off to speed up debugging.
@@ -45,13 +64,29 @@ USE_CONTENT_DELIVERY_NETWORK = True
 FORBID_CONTENT_DELIVERY_NETWORK = False
 
 UPLOAD_FOLDER = 'static/uploaded/'
+# uploaded VCF files are kept there until searched (Celery workers need access to it)
+VCF_UPLOAD_FOLDER = 'uploads/vcf'
+# number of query lines (with mutations found) shown on a page of a saved dataset
+DATASET_PAGE_SIZE = 500
 UPLOAD_ALLOWED_EXTENSIONS = ['png', 'pdf', 'jpg', 'jpeg', 'gif']
 
-# Requires PostgresSQL or Levenshtein-MySQL-UDF
+# Requires PostgresSQL or Levenshtein-MySQL-UDF; not needed when the search
+# index (SEARCH_INDEX_PATH) is built: the similarity is then ranked in-process
 SQL_LEVENSTHEIN = False
 # Note: Levenshtein-MySQL-UDF must be installed in plugin_dir to use it
 USE_LEVENSTHEIN_MYSQL_UDF = False
 
+# Suggestions in the search bar (genes, mutations, pathways, diseases, cancers)
+# can be looked up concurrently, on a pool of that many threads in each web
+# worker process (so the total is this times the number of workers; keep it
+# no lower than the number of providers, i.e. 5); set to 0 to look them up
+# one after another.
+AUTOCOMPLETE_WORKERS = 5
+# Suggestions taking longer than that (in seconds) are skipped; with MySQL
+# their queries are also interrupted then, releasing the threads of the pool
+# (running providers cannot be stopped otherwise)
+AUTOCOMPLETE_DEADLINE = 2
+
 # - ReCaptcha - to activate set it to true and provide required keys
 RECAPTCHA_ENABLED = False
 RECAPTCHA_SITE_KEY = 'put_your_public_key_here'
@@ -71,6 +106,12 @@ JOBS = [
         'func': 'jobs:hard_delete_expired_datasets',
         'trigger': 'interval',
         'hours': 6
+    },
+    {
+        'id': 'convert_legacy_datasets',
+        'func': 'jobs:convert_legacy_datasets',
+        'trigger': 'interval',
+        'hours': 1
     }
 ]
 
@@ -86,3 +127,5 @@ CELERY_IGNORE_RESULT = False
 CELERY_SECURITY_KEY = 'celery/worker.key'
 CELERY_SECURITY_CERTIFICATE = 'celery/worker.key.pub'
 CELERY_SECURITY_CERT_STORE = 'celery/*.pub'
+# searches of more mutations (lines) than that are split into chunks for many workers
+SEARCH_CHUNK_SIZE = 1000
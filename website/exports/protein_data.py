@@ -52,7 +52,7 @@ def sequences_ac(f):
         if not gene.preferred_isoform:
             continue
         f.write('>' + gene.name + '\n')
-        f.write(gene.preferred_isoform.sequence + '\n')
+        f.write(gene.preferred_isoform.sequence_fragment(0) + '\n')
 
 
 @file_exporter(default_path='exported/preferred_isoforms_disorder.fa')
@@ -74,7 +74,7 @@ def sites_ac(f):
     header = ['gene', 'position', 'residue', 'kinase', 'pmid']
 
     f.write('\t'.join(header) + '\n')
-    for site in tqdm(Site.query.all()):
+    for site in tqdm(Site.query.options(*Site.loading_options('export')).all()):
         if not site.protein or not site.protein.is_preferred_isoform:
             continue
         data = [
@@ -98,7 +98,8 @@ def site_specific_network_of_kinases_and_targets(f):
     ]
 
     f.write('\t'.join(header) + '\n')
-    for protein in tqdm(Protein.query, total=fast_count(Protein.query)):
+    query = Protein.query.options(*Protein.loading_options('export'))
+    for protein in tqdm(query, total=fast_count(Protein.query)):
         for site in protein.sites:
             for kinase in site.kinases:
 
@@ -132,7 +133,8 @@ def mutations_affecting_ptm_sites(f, sources):
         # mutation_details_model = Mutation.get_source_model(source)
         mutation_details_model = source
 
-        for mut_details in tqdm(yield_objects(mutation_details_model.query), total=fast_count(mutation_details_model.query)):
+        query = mutation_details_model.query.options(*mutation_details_model.loading_options('export'))
+        for mut_details in tqdm(yield_objects(query), total=fast_count(mutation_details_model.query)):
             mutation = mut_details.mutation
             if mutation.is_ptm():
                 for site in mutation.get_affected_ptm_sites():
@@ -87,10 +87,10 @@ def is_sequence_broken(protein, test_pos, test_res, test_alt=None):
 
     TODO: use test_alt to detect those ref -> alt transitions which are not possible?
     """
-    if len(protein.sequence) <= int(test_pos):
+    if protein.sequence_length <= int(test_pos):
         return protein.refseq, '-', test_res, str(test_pos), test_alt
     else:
-        ref_in_db = protein.sequence[int(test_pos) - 1]
+        ref_in_db = protein.residue(int(test_pos))
         if test_res == ref_in_db:
             return False
         return protein.refseq, ref_in_db, test_res, str(test_pos), test_alt
@@ -19,6 +19,13 @@ def command(func):
     return method
 
 
+def changes_bio_data(func):
+    """Mark a command which modifies the biological database,
+    so manage.py knows that the cached responses are outdated."""
+    func.changes_bio_data = True
+    return func
+
+
 def command_argument(command_func):
     def argument_closure(func):
         func.commands = [command_func]
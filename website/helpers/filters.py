@@ -1,11 +1,13 @@
 """Implementation of filters to be used with Ajax and URL based queries"""
 import operator
 import re
+from collections import OrderedDict
 from collections import namedtuple
 from collections import defaultdict
 from collections import Iterable
 from sqlalchemy import and_
 from sqlalchemy import or_
+from threading import Lock
 
 
 def is_iterable_but_not_str(obj):
@@ -20,6 +22,10 @@ class InitializationError(Exception):
     pass
 
 
+def copy_value(value):
+    return list(value) if type(value) is list else value
+
+
 def quote_if_needed(value):
     if type(value) is not str:
         return value
@@ -90,6 +96,7 @@ class Filter:
 
         self.allowed_comparators = comparators
         self.choices = choices
+        self._choices_set = None
         self.targets = (
             targets
             if is_iterable_but_not_str(targets)
@@ -216,6 +223,19 @@ class Filter:
     def id(self):
         return self.primary_target.__name__ + '.' + self.attribute
 
+    def is_allowed(self, value):
+        """Check if a (sub-)value is one of choices, in constant time."""
+        if self._choices_set is None:
+            try:
+                self._choices_set = frozenset(self.choices)
+            except TypeError:
+                # unhashable choices can only be scanned
+                return value in self.choices
+        try:
+            return value in self._choices_set
+        except TypeError:
+            return value in self.choices
+
     def _verify_value(self, value, raise_on_forbidden=True):
         if not (
                 self.nullable or
@@ -229,13 +249,13 @@ class Filter:
                 (
                     is_iterable_but_not_str(value) and
                     all(
-                        sub_value in self.choices
+                        self.is_allowed(sub_value)
                         for sub_value in value
                     )
                 ) or
                 (
                     not is_iterable_but_not_str(value) and
-                    value in self.choices
+                    self.is_allowed(value)
                 )
         ):
             if raise_on_forbidden:
@@ -329,6 +349,51 @@ class Filter:
 
         return compare
 
+    def compile(self):
+        """Create a predicate testing if an element passes this filter.
+
+        The attribute getter, the comparator and the value are resolved
+        once, so the predicate is much cheaper to call than test().
+        Values which cannot be compared at all (e.g. x in None) are
+        let through, as in get_compare_func; whether a type is comparable
+        is checked once per type, rather than for every element.
+        """
+        attr_get = self.attr_getter()
+        comparator_function = self.possible_comparators[self.comparator]
+        multiple_test = self.get_multiple_function()
+        value = self.value
+        comparable_types = {}
+
+        if multiple_test:
+            values = list(value)
+
+            def compare(obj_value):
+                return multiple_test(
+                    comparator_function(obj_value, sub_value)
+                    for sub_value in values
+                )
+        else:
+            def compare(obj_value):
+                return comparator_function(obj_value, value)
+
+        def predicate(element):
+            obj_value = attr_get(element)
+            value_type = type(obj_value)
+            try:
+                is_comparable = comparable_types[value_type]
+            except KeyError:
+                try:
+                    comparator_function(obj_value, obj_value)
+                    is_comparable = True
+                except TypeError:
+                    is_comparable = False
+                comparable_types[value_type] = is_comparable
+            if not is_comparable:
+                return True
+            return compare(obj_value)
+
+        return predicate
+
     def attr_getter(self):
         """Attrgetter that passes a value to an method-attribute if needed"""
 
@@ -373,26 +438,16 @@ class Filter:
         if not elements:
             return []
 
-        attr_get = self.attr_getter()
-        if itemgetter:
-            old_attr_get = attr_get
-
-            def attr_get(element):
-                element = itemgetter(element)
-                return old_attr_get(element)
-
-        comparator_function = self.possible_comparators[self.comparator]
-        multiple_test = self.get_multiple_function()
-
-        compare = self.get_compare_func(comparator_function, multiple_test)
+        predicate = self.compile()
 
-        return (
-            elem
-            for elem in elements
-            if compare(
-                attr_get(elem)
+        if itemgetter:
+            return (
+                elem
+                for elem in elements
+                if predicate(itemgetter(elem))
             )
-        )
+
+        return filter(predicate, elements)
 
     @property
     def is_active(self):    # TODO rename to 'is_applicable' or so
@@ -465,7 +520,21 @@ class FilterManager:
     # a shorthand for structure to update filters
     UpdateTuple = namedtuple('UpdateTuple', ['id', 'comparator', 'value'])
 
-    def __init__(self, filters):
+    # states of filters parsed & validated from requests, shared by all
+    # instances: (class, scope, arguments) -> (state, skipped, rejected)
+    parsed_states = OrderedDict()
+    parsed_states_lock = Lock()
+    max_parsed_states = 1024
+
+    def __init__(self, filters, state_scope=None):
+        """
+        Args:
+            filters: filters to be managed
+            state_scope: hashable identifier of everything that the
+                filters (their choices and defaults) depend on, e.g.
+                a protein; if given, the states parsed from requests
+                are cached (see update_from_request)
+        """
         # let each filter know where to seek data about other filters
         # (so one filter can relay on state of other filters,
         # eg. be active conditionally, if another filter is set).
@@ -479,6 +548,11 @@ class FilterManager:
             for filter in filters
         }
 
+        # compiled predicates by target type and state of applied filters
+        self._compiled = {}
+
+        self.state_scope = state_scope
+
     def get_active(self):
         """Return a list of active filters"""
         return [f for f in self.filters.values() if f.is_active]
@@ -570,15 +644,72 @@ class FilterManager:
             # investigate the type of targeted objects
             return []
 
+        predicate = self.compile(target_type, filters_subset)
+
+        if predicate is None:
+            return list(elements)
+
+        if itemgetter:
+            return [elem for elem in elements if predicate(itemgetter(elem))]
+
+        return [elem for elem in elements if predicate(elem)]
+
+    max_compiled = 64
+
+    def compile(self, target_type=None, filters_subset=None):
+        """Combine active filters targeting given type into a single predicate.
+
+        Predicates are cached by state (value and comparator) of the
+        combined filters, so a change of any value invalidates them
+        (also when the value was modified directly, bypassing update).
+
+        Returns:
+            predicate function or None if there is nothing to filter by
+        """
         if filters_subset is not None:
             filters = filters_subset
         else:
             filters = self._get_non_trivial_active(target_type)
 
-        for filter_ in filters:
-            elements = filter_.apply(elements, itemgetter)
+        if not filters:
+            return None
+
+        key = (
+            target_type,
+            tuple(
+                (
+                    id(filter_), filter_.comparator,
+                    tuple(filter_.value) if is_iterable_but_not_str(filter_.value) else filter_.value
+                )
+                for filter_ in filters
+            )
+        )
+
+        try:
+            return self._compiled[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable value; compile without caching
+            key = None
 
-        return list(elements)
+        predicates = [filter_.compile() for filter_ in filters]
+
+        if len(predicates) == 1:
+            predicate = predicates[0]
+        else:
+            def predicate(element):
+                for test in predicates:
+                    if not test(element):
+                        return False
+                return True
+
+        if key is not None:
+            if len(self._compiled) >= self.max_compiled:
+                self._compiled.clear()
+            self._compiled[key] = predicate
+
+        return predicate
 
     def _get_non_trivial_active(self, target=None):
         non_trivial_filters = []
@@ -611,12 +742,33 @@ class FilterManager:
 
         For details see _parse_request() method in this class.
 
+        If the manager has a state_scope, the outcome (the state of the
+        updated filters) is cached by the class of the manager, the scope
+        and the filters' arguments, so the following requests with the
+        same filters do not need to be parsed & validated again.
+
         Returns:
             tuple: skipped, rejected
 
             skipped: updates skipped, from unrecognized filters
             rejected: updates skipped, from forbidden values (if raise_on_forbidden was False)
         """
+        key = self._parsed_state_key(request, raise_on_forbidden)
+
+        if key is not None:
+            with self.parsed_states_lock:
+                cached = self.parsed_states.get(key)
+                if cached:
+                    self.parsed_states.move_to_end(key)
+
+            if cached:
+                state, skipped, rejected = cached
+                self._restore_state(state)
+                return list(skipped), defaultdict(list, {
+                    filter_id: list(values)
+                    for filter_id, values in rejected.items()
+                })
+
         filter_updates = self._parse_request(request)
 
         skipped = []
@@ -636,8 +788,48 @@ class FilterManager:
             if rejected_updates:
                 rejected[update.id].extend(rejected_updates)
 
+        if key is not None:
+            updated = {update.id for update in filter_updates} - {update.id for update in skipped}
+            state = tuple(
+                (filter_id, copy_value(self.filters[filter_id]._value), self.filters[filter_id]._comparator)
+                for filter_id in updated
+            )
+            with self.parsed_states_lock:
+                self.parsed_states[key] = (state, tuple(skipped), dict(rejected))
+                while len(self.parsed_states) > self.max_parsed_states:
+                    self.parsed_states.popitem(last=False)
+
         return skipped, rejected
 
+    def _parsed_state_key(self, request, raise_on_forbidden):
+        if self.state_scope is None:
+            return None
+
+        args = request.args if request.method == 'GET' else request.form
+
+        # the fallback format is used by forms only, and gets redirected
+        if args.get('fallback'):
+            return None
+
+        return (
+            type(self), self.state_scope, raise_on_forbidden,
+            bool(args.get('clear_filters')), args.get('filters', '')
+        )
+
+    def _restore_state(self, state):
+        """Set values and comparators of filters, as remembered by update_from_request."""
+        for filter_id, value, comparator in state:
+            the_filter = self.filters[filter_id]
+            # values are shared among managers, never hand over the same list
+            the_filter._value = copy_value(value)
+            the_filter._comparator = comparator
+
+    @classmethod
+    def clear_parsed_states(cls):
+        """Forget cached states; needed when choices of the filters change."""
+        with cls.parsed_states_lock:
+            cls.parsed_states.clear()
+
     def _parse_fallback_query(self, args):
         """Parse query in fallback format."""
 
@@ -762,7 +954,7 @@ class FilterManager:
 
         return str(value)
 
-    def url_string(self, expanded=False):
+    def url_string(self, expanded=False, canonical=False):
         """String representation of filters from the set for use in URL address.
 
         Produced string is ready to be included as a query argument in Flask's
@@ -772,14 +964,23 @@ class FilterManager:
             expanded:
                 should all active filters be included
                 (also those with value set to default)
+            canonical:
+                should values of multi-value filters be sorted, so the
+                string does not depend on the order in which these were
+                given (useful when the string is a part of a cache key)
         """
+        def value_of(f):
+            if canonical and is_iterable_but_not_str(f.value):
+                return sorted(f.value, key=str)
+            return f.value
+
         return self.filters_separator.join(
             [
                 self.field_separator.join(
                     map(str, [
                         f.id,
                         f.comparator,
-                        self._repr_value(f.value)
+                        self._repr_value(value_of(f))
                     ])
                 )
                 for f in self.filters.values()
@@ -36,3 +36,25 @@ def association_table_super_factory(bind=None):
             info={'bind_key': bind}
         )
     return make_association_table
+
+
+def masks_with_bits(bits, all_bits, require_all=True):
+    """All masks composed of all_bits, having all (or any) of given bits set.
+
+    Enumerating masks allows to express bitwise conditions as IN clauses,
+    which (unlike bitwise operations) can be resolved with an index.
+    """
+    return [
+        mask
+        for mask in range(all_bits + 1)
+        if not mask & ~all_bits and (
+            mask & bits == bits if require_all else mask & bits
+        )
+    ]
+
+
+def chunks(elements, size):
+    """Split elements into lists of at most given size (e.g. to keep IN clauses short)."""
+    elements = list(elements)
+    for i in range(0, len(elements), size):
+        yield elements[i:i + size]
@@ -4,6 +4,7 @@ from glob import glob
 import gzip
 from tqdm import tqdm
 import subprocess
+from uuid import uuid4
 
 
 class ParsingError(Exception):
@@ -177,3 +178,97 @@ def chunked_list(full_list, chunk_size=10000):
             element_buffer = []
     if element_buffer:
         yield element_buffer
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_maybe_gzipped(path):
+    """Open a file for reading bytes, decompressing it if it is gzipped.
+
+    Files compressed with bgzip (BGZF) are read as well, as these
+    are just series of gzip members.
+    """
+    with open(path, 'rb') as f:
+        is_gzipped = f.read(2) == GZIP_MAGIC
+
+    if is_gzipped:
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+class UploadedVCF:
+    """Reference to a VCF file (plain or gzipped) stored on the disk.
+
+    Iteration yields lines (bytes) read lazily from the file, so even very
+    large files do not need to be held in memory. Only the path is pickled,
+    therefore it can be passed to Celery tasks instead of the content (as
+    long as the workers have access to the same directory).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._length = None
+
+    @classmethod
+    def save(cls, file_storage, directory):
+        """Spool an uploaded file (werkzeug FileStorage) to given directory."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, uuid4().hex + '.vcf')
+        file_storage.save(path)
+        return cls(path)
+
+    def __iter__(self):
+        with open_maybe_gzipped(self.path) as f:
+            yield from f
+
+    def __bool__(self):
+        """Check if the file has any content (without reading it, unlike len)."""
+        try:
+            return os.path.getsize(self.path) > 0
+        except FileNotFoundError:
+            return False
+
+    def __len__(self):
+        """Number of lines (counted on first use, unless known from split)."""
+        if self._length is None:
+            self._length = sum(1 for _ in self)
+        return self._length
+
+    def split(self, chunk_size):
+        """Write consecutive chunks of at most chunk_size lines into separate files.
+
+        As MutationSearch stops reading VCF at the first empty line,
+        the lines after it are skipped. The file is read only once;
+        the lengths of the chunks are counted on the way.
+
+        Returns:
+            list of UploadedVCF, one for each chunk
+        """
+        chunks = []
+        chunk_file = None
+
+        try:
+            for i, line in enumerate(self):
+                if not line.decode('latin1').strip():
+                    break
+                if i % chunk_size == 0:
+                    if chunk_file:
+                        chunk_file.close()
+                    chunk = UploadedVCF('%s.%s' % (self.path, len(chunks)))
+                    chunk._length = 0
+                    chunks.append(chunk)
+                    chunk_file = open(chunk.path, 'wb')
+                chunk_file.write(line)
+                chunk._length += 1
+        finally:
+            if chunk_file:
+                chunk_file.close()
+
+        return chunks
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
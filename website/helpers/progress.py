@@ -0,0 +1,82 @@
+from time import time
+
+
+class ProgressReporter:
+    """Counts processed items, publishing the progress now and then.
+
+    The state is published at most once every `every` items or `interval`
+    seconds (whichever comes first), and when the last item is done;
+    publishing on each item (e.g. writing the state of a Celery task to
+    the result backend) could take longer than processing the item.
+
+    Published state is a dict with: progress (fraction of total, if known),
+    done, total, rate (items per second) and eta (seconds, if total is known).
+    """
+
+    def __init__(self, total=None, publish=None, every=100, interval=1, clock=time):
+        self.total = total
+        self.publish = publish
+        self.every = every
+        self.interval = interval
+        self.clock = clock
+
+        self.done = 0
+        self.start = clock()
+        self.published_done = 0
+        self.published_time = self.start
+
+    def state(self):
+        elapsed = self.clock() - self.start
+        rate = self.done / elapsed if elapsed else 0
+
+        state = {
+            'done': self.done,
+            'total': self.total,
+            'rate': rate,
+            'progress': self.done / self.total if self.total else 0,
+            'eta': None
+        }
+        if self.total and rate:
+            state['eta'] = (self.total - self.done) / rate
+        return state
+
+    def update(self, count=1):
+        self.done += count
+
+        now = self.clock()
+
+        if (
+            self.done - self.published_done >= self.every or
+            now - self.published_time >= self.interval or
+            self.done == self.total
+        ):
+            self.published_done = self.done
+            self.published_time = now
+            if self.publish:
+                self.publish(self.state())
+
+    def track(self, iterable):
+        """Yield from iterable, counting the items (a replacement of tqdm)."""
+        for element in iterable:
+            yield element
+            self.update()
+
+
+def celery_publisher(task):
+    """Publish progress as the meta of 'PROGRESS' state of given Celery task."""
+    def publish(state):
+        task.update_state(state='PROGRESS', meta=state)
+    return publish
+
+
+def print_publisher(label='', unit='items'):
+    """Publish progress as printed lines (suitable for logs, unlike tqdm bars)."""
+    def publish(state):
+        line = '%s%s' % (label + ': ' if label else '', state['done'])
+        if state['total']:
+            line += '/%s' % state['total']
+        line += ' %s, %.2f %s/s' % (unit, state['rate'], unit)
+        if state['eta'] is not None:
+            line += ', ETA %ds' % state['eta']
+        print(line)
+    return publish
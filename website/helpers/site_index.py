@@ -0,0 +1,145 @@
+"""
+Index of PTM sites of a single protein, allowing to classify
+mutations by their proximity to sites without re-bisecting
+lists of Site objects over and over again.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+
+
+# maximal distance from a site (inclusive) for each class of PTM impact
+PROXIMITY_CLASSES = (
+    (0, 'direct'),
+    (2, 'proximal'),
+    (7, 'distal'),
+)
+
+
+def impact_of_distance(distance):
+    """Translate distance to the closest site into PTM impact class."""
+    if distance is not None:
+        for max_distance, impact in PROXIMITY_CLASSES:
+            if distance <= max_distance:
+                return impact
+    return 'none'
+
+
+class SiteIndex:
+    """Sorted array of positions of PTM sites, with types of the sites.
+
+    Sites are stored ordered by position, so all the lookups are
+    based on bisection of the positions array instead of comparing
+    attributes of ORM objects.
+    """
+
+    def __init__(self, sites):
+        sites = sorted(sites, key=attrgetter('position'))
+        self.sites = sites
+        self.positions = array('i', (site.position for site in sites))
+        self.types = [site.type or '' for site in sites]
+        self._members = frozenset(sites)
+        self._type_indices = {}
+
+    def __len__(self):
+        return len(self.sites)
+
+    def __contains__(self, site):
+        return site in self._members
+
+    def _span(self, start, end):
+        """Indices delimiting sites with positions in <start, end>, inclusive."""
+        return (
+            bisect_left(self.positions, start),
+            bisect_right(self.positions, end)
+        )
+
+    def has_sites_in_range(self, left, right):
+        """Test if there are any sites in range defined as <left, right>, inclusive."""
+        first, last = self._span(left, right)
+        return first < last
+
+    def sites_in_range(self, left, right):
+        first, last = self._span(left, right)
+        return self.sites[first:last]
+
+    def is_close(self, position, left, right):
+        """Check if given position lies in (site_pos - left, site_pos + right)
+        span of any of the sites (bounds are inclusive)."""
+        return self.has_sites_in_range(position - right, position + left)
+
+    def affected_sites(self, position, distance=7):
+        """Sites for which given position lies in the ±distance flank."""
+        return self.sites_in_range(position - distance, position + distance)
+
+    def distance_to_closest(self, position):
+        """Distance to the closest site or None if there are no sites."""
+        positions = self.positions
+        i = bisect_left(positions, position)
+        candidates = []
+        if i < len(positions):
+            candidates.append(positions[i] - position)
+        if i:
+            candidates.append(position - positions[i - 1])
+        return min(candidates) if candidates else None
+
+    def closest_sites(self, position, distance=7):
+        """Sites closest to given position, but not further than distance.
+
+        If there are two sites in the same distance, both are returned.
+        """
+        distance_to_closest = self.distance_to_closest(position)
+        if distance_to_closest is None or distance_to_closest > distance:
+            return []
+        closest = [
+            site
+            for offset in sorted({-distance_to_closest, distance_to_closest})
+            for site in self.sites_in_range(position + offset, position + offset)
+        ]
+        return closest[:2]
+
+    def impact(self, position):
+        """Classify a position as 'direct', 'proximal', 'distal' or 'none'."""
+        return impact_of_distance(self.distance_to_closest(position))
+
+    def classify(self, positions):
+        """Classify a batch of positions at once.
+
+        Positions are processed in sorted order, sweeping through
+        the sites array just once. Returns impacts in the order of
+        the given positions.
+        """
+        sites_positions = self.positions
+        sites_count = len(sites_positions)
+        order = sorted(range(len(positions)), key=positions.__getitem__)
+        impacts = [None] * len(positions)
+
+        i = 0
+        for j in order:
+            position = positions[j]
+            while i < sites_count and sites_positions[i] < position:
+                i += 1
+            candidates = []
+            if i < sites_count:
+                candidates.append(sites_positions[i] - position)
+            if i:
+                candidates.append(position - sites_positions[i - 1])
+            impacts[j] = impact_of_distance(min(candidates) if candidates else None)
+
+        return impacts
+
+    def of_type(self, site_type):
+        """Index restricted to sites of given type (memoized).
+
+        Types of sites are stored as comma separated strings,
+        so the type is tested for inclusion, as in the 'Site.type' filter.
+        """
+        if not site_type:
+            return self
+        if site_type not in self._type_indices:
+            self._type_indices[site_type] = SiteIndex(
+                site
+                for site, types in zip(self.sites, self.types)
+                if site_type in types
+            )
+        return self._type_indices[site_type]
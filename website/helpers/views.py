@@ -1,7 +1,9 @@
 from copy import copy
 
+from flask import g
 from flask import jsonify
 from flask import request
+from flask_login import current_user
 from sqlalchemy import and_
 from sqlalchemy import asc
 from sqlalchemy import desc
@@ -15,6 +17,93 @@ ordering_functions = {
     'asc': asc
 }
 
+# endpoints ('ViewClass:method') which may answer with 304 Not Modified
+conditional_endpoints = set()
+
+
+def conditional_get(view):
+    """Mark a view as answering conditional GET requests (with ETag and
+    Last-Modified headers). Use only for views which response depends
+    exclusively on the arguments (URL and query) and on the biological data.
+    """
+    conditional_endpoints.add(view.__qualname__.replace('.', ':'))
+    return view
+
+
+def data_release_etag():
+    """Strong ETag of the current request (or None if it is not conditional).
+
+    It is computed without touching the biological database: from the data
+    release (stored in CMS), the endpoint and the arguments of the request.
+    """
+    from response_cache import ResponseCache, get_data_release
+
+    if request.endpoint not in conditional_endpoints:
+        return None
+
+    # user's datasets are private and may change or expire at any time
+    if 'UserMutations.sources' in request.args.get('filters', ''):
+        return None
+
+    return ResponseCache.make_key(
+        get_data_release(),
+        # filters widgets list datasets of the user
+        current_user.get_id() if current_user.is_authenticated else None,
+        request.endpoint,
+        sorted((request.view_args or {}).items()),
+        sorted(request.args.items(multi=True))
+    )
+
+
+def register_conditional_get(app):
+    """Answer conditional requests to endpoints marked with @conditional_get
+    with 304 Not Modified (before the views and their before_request hooks
+    query the database) and add ETag and Last-Modified to other responses.
+    """
+    from response_cache import get_data_release_time
+
+    @app.before_request
+    def respond_if_not_modified():
+        etag = data_release_etag()
+        if not etag:
+            return
+
+        # the ETag identifies the user, but the release time cannot: responses
+        # for logged in users are validated with the ETag only (otherwise
+        # a response cached for someone else could be declared as valid)
+        if current_user.is_authenticated:
+            release_time = None
+        else:
+            release_time = get_data_release_time()
+
+        g.conditional_get = etag, release_time
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = (
+                release_time and request.if_modified_since and
+                release_time <= request.if_modified_since
+            )
+
+        if not_modified:
+            response = app.response_class(status=304)
+            set_conditional_headers(response, etag, release_time)
+            return response
+
+    @app.after_request
+    def add_conditional_headers(response):
+        if 'conditional_get' in g and response.status_code == 200:
+            set_conditional_headers(response, *g.conditional_get)
+        return response
+
+
+def set_conditional_headers(response, etag, release_time):
+    response.set_etag(etag)
+    response.vary.add('Cookie')
+    if release_time:
+        response.last_modified = release_time
+
 
 def json_results_mapper(result):
     return result.to_json()
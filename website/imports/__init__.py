@@ -2,6 +2,7 @@ from .protein_data import IMPORTERS
 from .protein_data import get_proteins
 from .mutations import MutationImportManager
 from database import db
+from models import ProteinSummary
 # from flask import current_app
 
 
@@ -28,5 +29,8 @@ def import_all():
     print('Importing mutations...')
     muts_import_manager.perform('load', proteins)
 
+    print('Computing summary counts of proteins...')
+    ProteinSummary.recompute()
+
     db.session.commit()
     print('Done! Full database import complete!')
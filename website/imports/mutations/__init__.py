@@ -5,6 +5,7 @@ from collections import OrderedDict
 from collections import defaultdict
 
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.sql import select
 
 from database import db, yield_objects, remove_model, raw_delete_all
 from database import bulk_ORM_insert
@@ -16,6 +17,9 @@ from helpers.bioinf import is_sequence_broken
 from helpers.parsers import chunked_list
 from imports.protein_data import get_proteins
 from models import Mutation
+from models import MutationSiteImpact
+from models import Protein
+from models import ProteinSummary
 
 
 def make_metadata_ordered_dict(keys, metadata, get_from=None):
@@ -65,6 +69,7 @@ class BaseMutationsImporter:
         # for bulk_inserts it's needed to generate identifiers manually so
         # here the highest id currently in use in the database is retrieved.
         self.highest_base_id = self.get_highest_id()
+        self.first_new_id = self.highest_base_id + 1
 
     def get_highest_id(self):
         return get_highest_id(Mutation)
@@ -167,6 +172,24 @@ class MutationImporter(ABC):
         else:
             self.insert_details(mutation_details)
 
+        # details were (most likely) bulk-inserted, bypassing ORM events
+        Mutation.update_sources_masks([self.model])
+
+        # so were the mutations: compute their impacts on PTM sites, now when
+        # these are confirmed (on update, also the previously novel ones are)
+        MutationSiteImpact.recompute(
+            Mutation.id.in_(select([self.model.mutation_id])) if update
+            else Mutation.id >= self.base_importer.first_new_id
+        )
+
+        # so were the mutations: refresh counts of affected proteins
+        ProteinSummary.recompute(
+            Protein.id.in_(
+                select([Mutation.protein_id])
+                .where(Mutation.id.in_(select([self.model.mutation_id])))
+            )
+        )
+
         self.commit()
 
         if self.broken_seq:
@@ -242,6 +265,11 @@ class MutationImporter(ABC):
     def remove(self, **kwargs):
         """Do not overwrite this function"""
         remove_model(self.model, self.raw_delete_all, self.restart_autoincrement)
+        Mutation.update_sources_masks([self.model])
+        # mutations which are no longer confirmed have no impacts on sites
+        MutationSiteImpact.recompute(Mutation.sources_mask == 0)
+        ProteinSummary.recompute()
+        db.session.commit()
 
     def export_details_headers(self):
         return []
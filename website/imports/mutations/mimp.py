@@ -45,8 +45,8 @@ class Importer(MutationImporter):
             ref, pos, alt = decode_raw_mutation(mut)
 
             try:
-                assert ref == protein.sequence[pos - 1]
-            except (AssertionError, IndexError):
+                assert ref == protein.residue(pos)
+            except AssertionError:
                 self.broken_seq[refseq].append((protein.id, alt))
                 return
 
@@ -1,12 +1,16 @@
 import gzip
 from collections import OrderedDict, defaultdict, namedtuple
+from flask import current_app
+from sqlalchemy.orm import undefer
 from tqdm import tqdm
 from database import db, yield_objects
 from database import get_or_create
+from database import sequence_store
 from helpers.parsers import parse_fasta_file, iterate_tsv_gz_file
 from helpers.parsers import parse_tsv_file
 from helpers.parsers import parse_text_file
 from models import Domain, UniprotEntry, MC3Mutation, InheritedMutation, Mutation, Drug, DrugGroup, DrugType
+from models import MutationSiteImpact
 from models import Gene
 from models import InterproDomain
 from models import Cancer
@@ -16,6 +20,7 @@ from models import Protein
 from models import Site
 from models import Pathway
 from models import BadWord
+from exceptions import ValidationError
 from models import GeneList
 from models import GeneListEntry
 from helpers.commands import register_decorator
@@ -31,11 +36,25 @@ def get_proteins(cached_proteins={}, reload_cache=False):
     if reload_cache:
         cached_proteins.clear()
     if not cached_proteins:
-        for protein in Protein.query:
+        # importers work on sequences, so these should not be loaded one by one
+        query = Protein.query.options(undefer('sequence'), undefer('disorder_map'))
+        for protein in query:
             cached_proteins[protein.refseq] = protein
     return cached_proteins
 
 
+def rebuild_sequence_store():
+    """Write sequences and disorder maps of all proteins into the memory-mapped store."""
+    path = current_app.config.get('SEQUENCE_STORE_PATH')
+    if not path:
+        print('SEQUENCE_STORE_PATH is not set: the sequence store will not be built')
+        return
+
+    print('Building sequence store...')
+    entries = db.session.query(Protein.id, Protein.sequence, Protein.disorder_map)
+    sequence_store.build(path, tqdm(entries, total=Protein.query.count()))
+
+
 IMPORTERS = OrderedDict()
 importer = register_decorator(IMPORTERS)
 # TODO: class with register? Should have fields as "parsed_count", "results"
@@ -204,6 +223,8 @@ def sequences(path='data/all_RefGene_proteins.fa'):
     print('%s sequences overwritten' % overwritten)
     print('%s new sequences saved' % new_count)
 
+    rebuild_sequence_store()
+
 
 @importer
 def protein_summaries(path='data/refseq_summary.tsv.gz'):
@@ -497,6 +518,8 @@ def disorder(path='data/all_RefGene_disorder.fa'):
     for protein in proteins.values():
         assert len(protein.sequence) == protein.length
 
+    rebuild_sequence_store()
+
 
 @importer
 def domains(path='data/biomart_protein_domains_20072016.txt'):
@@ -867,10 +890,23 @@ def sites(path='data/site_table.tsv'):
     known_kinases = create_key_model_dict(Kinase, 'name')
     known_groups = create_key_model_dict(KinaseGroup, 'name')
 
+    # sites of types not listed in Site.types
+    skipped_sites = []
+    skipped_types = defaultdict(int)
+
     def parser(line):
 
         refseq, position, residue, kinases_str, pmid, mod_type = line
 
+        try:
+            Site.types_to_mask(mod_type)
+        except ValidationError:
+            skipped_sites.append(line)
+            for site_type in mod_type.split(','):
+                if site_type not in Site.types:
+                    skipped_types[site_type] += 1
+            return
+
         site_kinase_names = filter(bool, kinases_str.split(','))
 
         site_kinases, site_groups = get_or_create_kinases(
@@ -893,6 +929,14 @@ def sites(path='data/site_table.tsv'):
 
     parse_tsv_file(path, parser, header)
 
+    if skipped_sites:
+        print(
+            'Error: %s sites were skipped as their types are unknown (add these to Site.types first):'
+            % len(skipped_sites)
+        )
+        for site_type, count in sorted(skipped_types.items()):
+            print('\t%s: %s sites' % (site_type, count))
+
     return sites
 
 
@@ -1221,6 +1265,19 @@ def precompute_ptm_mutations():
     return []
 
 
+@importer
+def mutation_site_impacts():
+    """Rebuild the table of mutations' impacts on PTM sites from scratch.
+
+    Sites and mutations added with ORM or by mutation importers are
+    accounted for automatically; use this one after bulk changes of sites.
+    """
+    print('Computing impacts of mutations on PTM sites...')
+    MutationSiteImpact.recompute()
+    print('%s mutation-site pairs stored' % MutationSiteImpact.query.count())
+    return []
+
+
 @importer
 def drugbank(path='data/drugbank/drugbank.tsv'):
 
@@ -1,3 +1,5 @@
+from contextlib import suppress
+
 from sqlalchemy.exc import SQLAlchemyError
 
 from database import db
@@ -20,3 +22,30 @@ def hard_delete_expired_datasets():
         print('Error: Datasets hard delete commit failed')
 
     return removed
+
+
+def convert_legacy_datasets(limit=100):
+    """Convert up to `limit` datasets stored as pickled MutationSearch objects
+    to the compact format (see StoredSearchResults), indexing their mutations
+    (as well as of the datasets saved before UserDatasetMutation was introduced)."""
+    converted = 0
+
+    for dataset in UsersMutationsDataset.query.filter_by(is_expired=False):
+        if converted >= limit:
+            break
+        # both check if anything has to be done before loading the data
+        if dataset.convert_legacy_format() or dataset.index_mutations():
+            converted += 1
+        # do not keep the data of all the datasets in memory
+        with suppress(AttributeError):
+            del dataset._data
+
+    try:
+        db.session.commit()
+        if converted:
+            print('Converted or indexed %s datasets' % converted)
+    except SQLAlchemyError:
+        db.session.rollback()
+        print('Error: Datasets conversion commit failed')
+
+    return converted
@@ -15,6 +15,7 @@ from exports.protein_data import EXPORTERS
 from helpers.commands import CommandTarget
 from helpers.commands import argument
 from helpers.commands import argument_parameters
+from helpers.commands import changes_bio_data
 from helpers.commands import command
 from helpers.commands import create_command_subparsers
 from imports import import_all
@@ -25,6 +26,7 @@ from imports.mutations import get_proteins
 from imports.protein_data import IMPORTERS
 from models import Page
 from models import User
+from response_cache import bump_data_release
 
 muts_import_manager = MutationImportManager()
 database_binds = ('bio', 'cms')
@@ -49,6 +51,64 @@ def calc_statistics(args, app=None):
         db.session.commit()
 
 
+@changes_bio_data
+def recompute_sources_masks(args, app=None):
+    if not app:
+        app = create_app(config_override=CONFIG)
+    with app.app_context():
+        from models import Mutation
+        print('Recomputing sources masks of mutations...')
+        Mutation.update_sources_masks()
+        db.session.commit()
+
+
+@changes_bio_data
+def recompute_protein_summary(args, app=None):
+    if not app:
+        app = create_app(config_override=CONFIG)
+    with app.app_context():
+        from models import ProteinSummary
+        print('Recomputing summary counts of proteins...')
+        ProteinSummary.recompute()
+        db.session.commit()
+
+
+@changes_bio_data
+def build_sequence_store(args, app=None):
+    if not app:
+        app = create_app(config_override=CONFIG)
+    with app.app_context():
+        from imports.protein_data import rebuild_sequence_store
+        rebuild_sequence_store()
+
+
+def build_search_index(args, app=None):
+    if not app:
+        app = create_app(config_override=CONFIG)
+    with app.app_context():
+        from search.gene import rebuild_search_index
+        rebuild_search_index()
+
+
+@changes_bio_data
+def convert_site_types(args, app=None):
+    if not app:
+        app = create_app(config_override=CONFIG)
+    with app.app_context():
+        from models import Site
+        print('Converting types of sites from text to bitmasks...')
+        Site.types_masks_from_text(args.column)
+        db.session.commit()
+
+
+def prerender_representations(args, app=None):
+    if not app:
+        app = create_app(config_override=CONFIG)
+    with app.app_context():
+        from views.prerender import prerender_all
+        prerender_all(args.kinds, args.chunk_size, use_celery=args.celery)
+
+
 def get_all_models(module_name='bio'):
     from models import Model
     from sqlalchemy.ext.declarative.clsregistry import _ModuleMarker
@@ -244,10 +304,12 @@ class ProteinRelated(CommandTarget):
     )
 
     @command
+    @changes_bio_data
     def load_all(args):
         import_all()
 
     @command
+    @changes_bio_data
     def load(args):
         data_importers = IMPORTERS
         for importer_name in args.importers:
@@ -319,10 +381,12 @@ class ProteinRelated(CommandTarget):
         )
 
     @command
+    @changes_bio_data
     def remove_all(args):
         reset_relational_db(current_app, bind='bio')
 
     @command
+    @changes_bio_data
     def remove(args):
         import models.bio as bio_models
         for model_name in args.models:
@@ -404,10 +468,12 @@ class Mutations(CommandTarget):
         )
 
     @command
+    @changes_bio_data
     def load(args):
         Mutations.action('load', args)
 
     @command
+    @changes_bio_data
     def remove(args):
         Mutations.action('remove', args)
 
@@ -416,6 +482,7 @@ class Mutations(CommandTarget):
         Mutations.action('export', args)
 
     @command
+    @changes_bio_data
     def update(args):
         Mutations.action('update', args)
 
@@ -453,6 +520,7 @@ class All(CommandTarget):
     description = 'should everything be {command}ed'
 
     @command
+    @changes_bio_data
     def load(args):
         ProteinRelated.load_all(args)
         Mutations.load(argparse.Namespace(sources='__all__'))
@@ -460,6 +528,7 @@ class All(CommandTarget):
         CMS.load(args)
 
     @command
+    @changes_bio_data
     def remove(args):
         ProteinRelated.remove_all(args)
         Mutations.remove(argparse.Namespace(sources='__all__'))
@@ -528,6 +597,95 @@ def create_parser():
         )
     )
 
+    new_subparser(
+        subparsers,
+        'sources_masks',
+        recompute_sources_masks,
+        help=(
+            'should sources masks of mutations be recomputed'
+            ' (e.g. after migration or manual changes of mutations details)?'
+        )
+    )
+
+    new_subparser(
+        subparsers,
+        'protein_summary',
+        recompute_protein_summary,
+        help=(
+            'should precomputed counts of mutations and sites of proteins be recomputed'
+            ' (e.g. after import of sites or manual changes of mutations)?'
+        )
+    )
+
+    new_subparser(
+        subparsers,
+        'sequence_store',
+        build_sequence_store,
+        help=(
+            'should the memory-mapped store of sequences be rebuilt'
+            ' (e.g. after manual changes of sequences or disorder data)?'
+        )
+    )
+
+    new_subparser(
+        subparsers,
+        'search_index',
+        build_search_index,
+        help=(
+            'should the in-memory index for search bar look-ups be rebuilt?'
+            ' (it is rebuilt automatically after changes of biological data)'
+        )
+    )
+
+    site_types_parser = new_subparser(
+        subparsers,
+        'site_types',
+        convert_site_types,
+        help=(
+            'should types of sites be converted from the legacy text column to bitmasks?'
+            ' Run after migration adding types_mask column and before removal of the old one.'
+        )
+    )
+
+    site_types_parser.add_argument(
+        '--column',
+        default='type',
+        help='name of the legacy text column with comma separated types of sites'
+    )
+
+    prerender_parser = new_subparser(
+        subparsers,
+        'prerender',
+        prerender_representations,
+        help=(
+            'should representations (needle plots, networks) of preferred isoforms'
+            ' be pre-rendered under default filters? Interrupted job resumes'
+            ' from the proteins which were not rendered for current data release yet.'
+        )
+    )
+
+    prerender_parser.add_argument(
+        '-k',
+        '--kinds',
+        nargs='*',
+        choices=['sequence', 'network'],
+        default=['sequence', 'network'],
+        help='which representations should be rendered (by default all)'
+    )
+
+    prerender_parser.add_argument(
+        '--chunk_size',
+        type=int,
+        default=50,
+        help='how many proteins should be rendered (and committed) at once'
+    )
+
+    prerender_parser.add_argument(
+        '--celery',
+        action='store_true',
+        help='distribute the chunks over Celery workers (which have to be running)'
+    )
+
     shell_parser = new_subparser(
         subparsers,
         'shell',
@@ -593,6 +751,14 @@ def run_manage(parsed_args, app=None):
     with app.app_context():
         parsed_args.func(parsed_args)
 
+        if getattr(parsed_args.func, 'changes_bio_data', False):
+            release = bump_data_release()
+            db.session.commit()
+            print('Biological data changed: cached responses invalidated (data release %s).' % release)
+
+            from search.gene import rebuild_search_index
+            rebuild_search_index()
+
     print('Done, all tasks completed.')
 
 
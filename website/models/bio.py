@@ -1,24 +1,38 @@
+import json
+import zlib
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict
 from collections import UserList
+from collections import defaultdict
+from itertools import chain
 
 from sqlalchemy import and_, distinct
 from sqlalchemy import case
 from sqlalchemy import func
+from sqlalchemy import literal
 from sqlalchemy import or_
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.hybrid import hybrid_method, Comparator
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref, synonym
+from sqlalchemy.orm import Load
+from sqlalchemy.sql import column
 from sqlalchemy.sql import exists
 from sqlalchemy.sql import select
 from werkzeug.utils import cached_property
 
 from database import db, count_expression
 from database import fast_count
+from database import sequence_store
+from sequence_store import disorder_intervals
+from database import has_or_any
+from database import get_or_create
 from exceptions import ValidationError
 from helpers.models import generic_aggregator, association_table_super_factory
+from helpers.models import masks_with_bits
+from helpers.models import chunks
+from helpers.site_index import SiteIndex
 from models import Model
 
 
@@ -31,6 +45,14 @@ class BioModel(Model):
     __abstract__ = True
     __bind_key__ = 'bio'
 
+    @classmethod
+    def loading_options(cls, profile):
+        """Query options (loading strategies) of this model in given loading profile.
+
+        See loading_profiles for the list of available profiles.
+        """
+        return loading_profiles[profile].get(cls, [])
+
 
 make_association_table = association_table_super_factory(bind='bio')
 
@@ -390,12 +412,14 @@ class Protein(BioModel):
     # summary from Entrez/RefSeq database as at: https://www.ncbi.nlm.nih.gov/gene/7157
     summary = db.Column(db.Text)
 
-    # sequence of amino acids represented by one-letter IUPAC symbols
-    sequence = db.Column(db.Text, default='')
+    # sequence of amino acids represented by one-letter IUPAC symbols;
+    # deferred, as residues and fragments are usually read from the
+    # memory-mapped sequence store (see sequence_fragment)
+    sequence = db.deferred(db.Column(db.Text, default=''))
 
     # sequence of ones and zeros where ones indicate disorder region
     # should be no longer than the sequence (defined above)
-    disorder_map = db.Column(db.Text, default='')
+    disorder_map = db.deferred(db.Column(db.Text, default=''))
 
     # transcription start/end coordinates
     tx_start = db.Column(db.Integer)
@@ -455,13 +479,9 @@ class Protein(BioModel):
     @classmethod
     def has_ptm_mutations_in_dataset(cls, dataset=None):
         criteria = [
-            Site.protein_id == cls.id,
             Mutation.protein_id == cls.id,
             Mutation.is_confirmed == True,
-            Site.position.between(
-                Mutation.position - 7,
-                Mutation.position + 7
-            )
+            MutationSiteImpact.mutation_id == Mutation.id
         ]
         if dataset:
             from stats import Statistics
@@ -482,8 +502,20 @@ class Protein(BioModel):
             .label('has_ptm_mutations_select')
         )
 
+    def get_summary(self, source='', site_type=''):
+        """Precomputed counts (ProteinSummary) or None if these are not available."""
+        return self.summaries.filter_by(source=source, site_type=site_type).first()
+
+    @cached_property
+    def precomputed_counts(self):
+        """Precomputed counts of all confirmed mutations and all sites (if available)."""
+        return self.get_summary()
+
     @hybrid_property
     def ptm_mutations_count(self):
+        summary = self.precomputed_counts
+        if summary:
+            return summary.ptm_mutations_count
         return sum(1 for mut in self.confirmed_mutations if mut.precomputed_is_ptm)
 
     @ptm_mutations_count.expression
@@ -511,6 +543,9 @@ class Protein(BioModel):
 
     @hybrid_property
     def sites_count(self):
+        summary = self.precomputed_counts
+        if summary:
+            return summary.sites_count
         return len(self.sites)
 
     @sites_count.expression
@@ -529,25 +564,43 @@ class Protein(BioModel):
 
     @hybrid_property
     def confirmed_mutations_count(self):
+        summary = self.precomputed_counts
+        if summary:
+            return summary.mutations_count
         return fast_count(self.confirmed_mutations)
 
     def to_json(self, data_filter=None):
+        data = {
+            'is_preferred': self.is_preferred_isoform,
+            'gene_name': self.gene_name,
+            'refseq': self.refseq
+        }
+
+        # precomputed counts are used unless the data are filtered ad hoc
+        summary = self.precomputed_counts if not data_filter else None
+
+        if summary:
+            data.update({
+                'sites_count': summary.sites_count,
+                'muts_count': summary.mutations_count,
+                'ptm_muts': summary.ptm_mutations_count
+            })
+            return data
+
         if not data_filter:
             data_filter = lambda x: list(x)
 
         filtered_mutations = data_filter(self.confirmed_mutations)
 
-        return {
-            'is_preferred': self.is_preferred_isoform,
-            'gene_name': self.gene_name,
-            'refseq': self.refseq,
+        data.update({
             'sites_count': len(data_filter(self.sites)),
             'muts_count': len(filtered_mutations),
             'ptm_muts': sum(
                 1 for m in filtered_mutations
                 if m.is_ptm()
             )
-        }
+        })
+        return data
 
     @hybrid_property
     def is_preferred_isoform(self):
@@ -572,15 +625,45 @@ class Protein(BioModel):
             .label('is_preferred_isoform_select')
         )
 
+    def _is_stored(self, column):
+        """Should data of given column be read from the sequence store?
+
+        Data which were already loaded (or set) are used directly,
+        so the store serves only to avoid fetching of the Text columns.
+        """
+        return column not in self.__dict__ and self.id in sequence_store
+
+    def sequence_fragment(self, start, end=None):
+        """Fragment of the sequence, as from slicing: sequence[start:end]"""
+        if self._is_stored('sequence'):
+            return sequence_store.fragment(self.id, start, end)
+        return self.sequence[start:end]
+
+    def residue(self, position):
+        """Residue at given (1-based) position or an empty string if out of the sequence."""
+        if position < 1:
+            return ''
+        return self.sequence_fragment(position - 1, position)
+
+    @cached_property
+    def sequence_length(self):
+        """Length of protein's sequence, including the trailing stop (*) character"""
+        if self._is_stored('sequence'):
+            return sequence_store.length(self.id)
+        return len(self.sequence)
+
     @cached_property
     def length(self):
         """Length of protein's sequence, without the trailing stop (*) character"""
-        return len(self.sequence.rstrip('*'))
+        length = self.sequence_length
+        while length and self.residue(length) == '*':
+            length -= 1
+        return length
 
     @cached_property
     def disorder_length(self):
         """How many residues are disordered."""
-        return sum([int(residue) for residue in self.disorder_map])
+        return sum(length for start, length in self.disorder_regions)
 
     @cached_property
     def disorder_regions(self):
@@ -589,22 +672,22 @@ class Protein(BioModel):
         Each span is represented by a tuple: (start, length).
         The coordinates are 1-based.
         """
+        if self._is_stored('disorder_map'):
+            return sequence_store.disorder_regions(self.id)
 
-        disorder_regions = []
-        inside_region = False
+        return [
+            [start, length]
+            for start, length in disorder_intervals(self.disorder_map)
+        ]
 
-        for i in range(len(self.disorder_map)):
-            residue = int(self.disorder_map[i])
-            if inside_region:
-                if not residue:
-                    inside_region = False
-                    disorder_regions[-1][1] = i - disorder_regions[-1][0]
-            else:
-                if residue:
-                    disorder_regions += [[i + 1, 1]]
-                    inside_region = True
+    @cached_property
+    def site_index(self):
+        """Index of positions of all sites of this protein.
 
-        return disorder_regions
+        It is dropped whenever sites of the protein change
+        (see invalidate_site_index).
+        """
+        return SiteIndex(self.sites)
 
     @hybrid_property
     def kinases(self):
@@ -631,26 +714,9 @@ class Protein(BioModel):
         return kinase_groups
 
     def has_sites_in_range(self, left, right):
-        """Test if there are any sites in given range defined as <left, right>, inclusive.
-
-        Algorithm is based on bisection and an assumption,
-        that sites are sorted by position in the database.
-        """
+        """Test if there are any sites in given range defined as <left, right>, inclusive."""
         assert left < right
-
-        sites = self.sites
-
-        for i, site in enumerate(sites):
-            if site.position >= left:
-                start = i
-                break
-        else:
-            return False
-
-        for i, site in enumerate(reversed(sites)):
-            if site.position <= right:
-                return start <= len(sites) - i - 1
-        return False
+        return self.site_index.has_sites_in_range(left, right)
 
     @property
     def disease_names(self):
@@ -689,11 +755,11 @@ def default_residue(context):
     position = params.get('position')
 
     if protein and position:
-        try:
-            return protein.sequence[position]
-        except IndexError:
+        residue = protein.sequence_fragment(position, position + 1)
+        if not residue:
             print('Position of PTM possibly exceeds its protein')
             return
+        return residue
 
 
 class Site(BioModel):
@@ -702,13 +768,9 @@ class Site(BioModel):
 
     residue = db.Column(db.String(1), default=default_residue)
     pmid = db.Column(db.Text)
-    # type is expected to be a spaceless string, one of following:
-    #   phosphorylation acetylation ubiquitination methylation
-    # or comma separated list consisting of such strings. Another
-    # implementation which should be tested would use relationships
-    # to 'site_types' table and it might be faster to query specific
-    # sites when having this implemented that way.
-    type = db.Column(db.Text)
+    # types of the site, stored as a bitwise sum of types_bits;
+    # use 'type' property to get or set types as a string.
+    types_mask = db.Column(db.Integer, default=0, index=True)
     protein_id = db.Column(db.Integer, db.ForeignKey('protein.id'))
     kinases = db.relationship(
         'Kinase',
@@ -732,7 +794,7 @@ class Site(BioModel):
         right = self.position + dst
         return (
             '-' * -min(0, left) +
-            protein.sequence[max(0, left):min(right, protein.length)] +
+            protein.sequence_fragment(max(0, left), min(right, protein.length)) +
             '-' * max(0, right - protein.length)
         )
 
@@ -769,7 +831,7 @@ class Site(BioModel):
     def validate_residue(self):
         residue = self.residue
         if residue and self.protein and self.position:
-            deduced_residue = self.protein.sequence[self.position - 1]
+            deduced_residue = self.protein.residue(self.position)
             if self.residue != deduced_residue:
                 raise ValidationError(
                     'Site residue {0} does not match '
@@ -808,6 +870,130 @@ class Site(BioModel):
         'ubiquitination', 'methylation'
     ]
 
+    # bit of types_mask assigned to each type; the masks have
+    # to be recomputed if the order of types ever changes.
+    types_bits = OrderedDict(
+        (site_type, 1 << i)
+        for i, site_type in enumerate(types)
+    )
+
+    @classmethod
+    def types_to_mask(cls, type_names):
+        """Convert a comma separated string (or a list) of site types to a mask.
+
+        Unknown types raise ValidationError: these have to be added
+        to Site.types first (their bits cannot be made up on the fly).
+        """
+        if not type_names:
+            return 0
+        if isinstance(type_names, str):
+            type_names = type_names.split(',')
+        mask = 0
+        for type_name in type_names:
+            if type_name not in cls.types_bits:
+                raise ValidationError(
+                    'Unknown site type: {0}. Allowed: {1}'.format(
+                        type_name, ', '.join(cls.types)
+                    )
+                )
+            mask |= cls.types_bits[type_name]
+        return mask
+
+    @classmethod
+    def mask_to_types(cls, mask):
+        return [
+            site_type
+            for site_type, bit in cls.types_bits.items()
+            if mask & bit
+        ]
+
+    @classmethod
+    def types_masks_from_text(cls, column_name='type'):
+        """Fill types_mask of all sites in bulk, basing on a legacy text column
+
+        holding comma separated list of types (as the 'type' column used to).
+        """
+        text_column = column(column_name)
+        new_mask = 0
+
+        for site_type, bit in cls.types_bits.items():
+            new_mask = new_mask + case(
+                [(text_column.like('%' + site_type + '%'), bit)],
+                else_=0
+            )
+
+        db.session.execute(
+            cls.__table__.update().values(types_mask=new_mask),
+            mapper=cls.__mapper__
+        )
+
+    @hybrid_property
+    def type(self):
+        """Comma separated list of types of the site (None if no types are known).
+
+        It is expected to consist of following, spaceless strings:
+            phosphorylation acetylation ubiquitination methylation
+        """
+        return ','.join(self.mask_to_types(self.types_mask or 0)) or None
+
+    @type.setter
+    def type(self, type_names):
+        self.types_mask = self.types_to_mask(type_names)
+
+    @type.comparator
+    def type(cls):
+        return SiteTypeComparator(cls)
+
+
+class SiteTypeComparator(Comparator):
+    """Given a site type name (or a list of such names), determine
+    if the site is of this type (i.e. has the type's bit set).
+
+    Conditions are expressed with lists of allowed masks,
+    so that these can be resolved with the index on types_mask.
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+
+    def __eq__(self, type_names):
+        return self.cls.types_mask == self.cls.types_to_mask(type_names)
+
+    def has_types(self, type_names, require_all=True):
+        bits = self.cls.types_to_mask(type_names)
+        all_bits = sum(self.cls.types_bits.values())
+        return self.cls.types_mask.in_(
+            masks_with_bits(bits, all_bits, require_all)
+        )
+
+    def contains(self, type_name):
+        return self.has_types(type_name)
+
+    def in_(self, type_names):
+        return self.has_types(type_names, require_all=False)
+
+
+def invalidate_site_index(protein):
+    protein.__dict__.pop('site_index', None)
+
+
+@db.event.listens_for(Protein.sites, 'append')
+@db.event.listens_for(Protein.sites, 'remove')
+def site_added_or_removed(protein, site, initiator):
+    invalidate_site_index(protein)
+
+
+@db.event.listens_for(Protein.sites, 'set')
+def sites_replaced(protein, sites, old_sites, initiator):
+    invalidate_site_index(protein)
+
+
+@db.event.listens_for(Site.position, 'set')
+@db.event.listens_for(Site.types_mask, 'set')
+def site_changed(site, value, old_value, initiator):
+    if site.protein:
+        invalidate_site_index(site.protein)
+
 
 class Cancer(BioModel):
     code = db.Column(db.String(16), unique=True)
@@ -1548,6 +1734,12 @@ class Mutation(BioModel):
     # is different than None. Be careful with boolean evaluation!
     precomputed_is_ptm = db.Column(db.Boolean)
 
+    # Denormalized information about sources of the mutation: bitwise sum
+    # of sources_bits of all sources having details of this mutation.
+    # Maintained on flush for ORM changes and by update_sources_masks
+    # (used by mutation importers and 'sources_masks' manage.py command).
+    sources_mask = db.Column(db.Integer, default=0, index=True)
+
     types = ('direct', 'network-rewiring', 'proximal', 'distal', 'none')
 
     # order matters (widget's labels will show up in this order)
@@ -1572,12 +1764,74 @@ class Mutation(BioModel):
 
     vars().update(source_data_relationships)
 
+    # bit of sources_mask assigned to each source; user's mutations are never
+    # stored in the database so these do not get one. The masks have to be
+    # recomputed if the order of source_specific_data ever changes.
+    sources_bits = OrderedDict(
+        (model.name, 1 << i)
+        for i, model in enumerate(source_specific_data)
+        if model is not UserUploadedMutation
+    )
+
     @classmethod
     def get_source_model(cls, name):
         for model in cls.source_specific_data:
             if model.name == name:
                 return model
 
+    @classmethod
+    def get_or_create_many(cls, proteins, keys, chunk_size=500):
+        """Bulk equivalent of get_or_create for many mutations.
+
+        Args:
+            proteins: mapping of protein id => Protein, for all the keys
+            keys: (protein id, position, alt) tuples
+
+        Returns:
+            dict: key => Mutation (retrieved from the database or created)
+        """
+        keys = set(keys)
+        mutations = {}
+
+        positions_by_protein = defaultdict(set)
+        for protein_id, pos, alt in keys:
+            positions_by_protein[protein_id].add(pos)
+
+        # positions are matched per protein (not as a cross product of all
+        # proteins and positions), with up to chunk_size parameters per query
+        conditions = [
+            (and_(cls.protein_id == protein_id, cls.position.in_(positions)), len(positions) + 1)
+            for protein_id, protein_positions in positions_by_protein.items()
+            for positions in chunks(sorted(protein_positions), max(chunk_size - 1, 1))
+        ]
+
+        batches = []
+        batch_size = chunk_size
+        for condition, parameters_count in conditions:
+            if batch_size + parameters_count > chunk_size:
+                batches.append([])
+                batch_size = 0
+            batches[-1].append(condition)
+            batch_size += parameters_count
+
+        for batch in batches:
+            query = cls.query.filter(or_(*batch))
+            for mutation in query:
+                key = (mutation.protein_id, mutation.position, mutation.alt)
+                if key in keys:
+                    mutations[key] = mutation
+
+        for key in keys - mutations.keys():
+            protein_id, pos, alt = key
+            mutations[key] = cls(
+                protein=proteins[protein_id],
+                protein_id=protein_id,
+                position=pos,
+                alt=alt
+            )
+
+        return mutations
+
     @classmethod
     def get_relationship(cls, mutation_class, class_relation_map={}):
         if not class_relation_map:
@@ -1651,11 +1905,92 @@ class Mutation(BioModel):
     @is_confirmed.expression
     def is_confirmed(cls):
         """SQL expression for is_confirmed"""
-        return or_(
-            relationship_field.any()
-            if relationship_field.prop.uselist
-            else relationship_field.has()
-            for relationship_field in cls.confirmed_fields
+        return cls.sources_mask_filter(
+            [name for name in cls.source_fields if name != 'user'],
+            require_all=False
+        )
+
+    @classmethod
+    def sources_mask_filter(cls, sources, require_all=True, target=None):
+        """SQL clause selecting mutations having details from all (or any) of given sources.
+
+        The clause is expressed as a list of allowed mask values (rather than as
+        a bitwise operation) so it can be resolved with the index on sources_mask.
+        Sources without a bit (user's mutations) are tested with relationships.
+
+        Args:
+            sources: names of sources
+            target: Mutation or an alias of Mutation
+        """
+        target = target or cls
+        bits = 0
+        other_clauses = []
+
+        for name in sources:
+            if name in cls.sources_bits:
+                bits |= cls.sources_bits[name]
+            else:
+                other_clauses.append(has_or_any(getattr(target, cls.source_fields[name])))
+
+        if bits:
+            all_bits = sum(cls.sources_bits.values())
+            masks = masks_with_bits(bits, all_bits, require_all)
+            other_clauses.append(target.sources_mask.in_(masks))
+
+        combine = and_ if require_all else or_
+        return combine(*other_clauses)
+
+    def compute_sources_mask(self, ignored=()):
+        """Compute sources_mask from source-specific details of this mutation.
+
+        Args:
+            ignored: details which should not be taken into account
+                (e.g. those which are about to be deleted)
+        """
+        mask = 0
+        for name, bit in self.sources_bits.items():
+            details = getattr(self, self.source_data_field(name))
+            if details is None:
+                continue
+            if not isinstance(details, MutationDetailsManager):
+                details = [details]
+            if any(entry not in ignored for entry in details):
+                mask |= bit
+        return mask
+
+    @classmethod
+    def source_data_field(cls, name):
+        return 'meta_' + name
+
+    @classmethod
+    def update_sources_masks(cls, models=None):
+        """Recompute (in bulk, with a single SQL update) bits of sources_mask
+
+        corresponding to given source models (by default: to all sources).
+        """
+        if models is None:
+            models = [cls.get_source_model(name) for name in cls.sources_bits]
+        else:
+            # e.g. TCGAMutation is not a source (and has no bit)
+            models = [model for model in models if model.name in cls.sources_bits]
+
+        if not models:
+            return
+
+        updated_bits = sum(cls.sources_bits[model.name] for model in models)
+        kept_bits = sum(cls.sources_bits.values()) & ~updated_bits
+
+        new_mask = func.coalesce(cls.sources_mask, 0).op('&')(kept_bits)
+
+        for model in models:
+            new_mask = new_mask + case(
+                [(exists().where(model.mutation_id == cls.id), cls.sources_bits[model.name])],
+                else_=0
+            )
+
+        db.session.execute(
+            cls.__table__.update().values(sources_mask=new_mask),
+            mapper=cls.__mapper__
         )
 
     @property
@@ -1671,15 +2006,12 @@ class Mutation(BioModel):
 
         This method works very similarly to is_ptm_distal property.
         """
-        sites = self.protein.sites
-        if filter_manager:
-            sites = filter_manager.apply(sites)
-        return self.is_close_to_some_site(7, 7, sites)
+        site_filter = filter_manager.apply if filter_manager else None
+        return self.get_site_index(site_filter).is_close(self.position, 7, 7)
 
     @hybrid_property
     def ref(self):
-        sequence = self.protein.sequence
-        return sequence[self.position - 1]
+        return self.protein.residue(self.position)
 
     @hybrid_property
     def is_ptm_direct(self):
@@ -1709,51 +2041,35 @@ class Mutation(BioModel):
         # otherwise it's a novel mutation - let's check proximity
         return self.is_close_to_some_site(7, 7)
 
-    def get_affected_ptm_sites(self, site_filter=lambda x: x):
-        """Get PTM sites that might be affected by this mutation,
-
-        when taking into account -7 to +7 spans of each PTM site.
-        """
-        sites = site_filter(self.protein.sites)
-        pos = self.position
-        a = 0
-        b = len(sites)
-        sites_affected = set()
-
-        while a != b:
-            pivot = (b - a) // 2 + a
-            site_pos = sites[pivot].position
-            if site_pos - 7 <= pos <= site_pos + 7:
-                hit = pivot
-                sites_affected.add(sites[pivot])
-                break
-            if pos > site_pos:
-                a = pivot + 1
-            else:
-                b = pivot
-        else:
-            return tuple()
+    @is_ptm_distal.expression
+    def is_ptm_distal(cls):
+        """SQL expression for is_ptm_distal"""
+        return or_(
+            cls.precomputed_is_ptm == True,
+            and_(
+                cls.precomputed_is_ptm.is_(None),
+                cls.is_close_to_some_site(7, 7)
+            )
+        )
 
-        def cond():
-            try:
-                site_pos = sites[pivot].position
-                return site_pos - 7 <= pos <= site_pos + 7
-            except IndexError:
-                return tuple()
+    def get_site_index(self, site_filter=None):
+        """Index of sites of the mutated protein, optionally restricted by site_filter.
 
-        # go to right from found site, check if there is more overlapping sites
-        pivot = hit + 1
-        while cond():
-            sites_affected.add(sites[pivot])
-            pivot += 1
+        Unfiltered index is cached on the protein; for filtered one consider
+        creating the index once and passing it to the methods as site_index.
+        """
+        if site_filter is None:
+            return self.protein.site_index
+        return SiteIndex(site_filter(self.protein.sites))
 
-        # and then go to the left
-        pivot = hit - 1
-        while cond():
-            sites_affected.add(sites[pivot])
-            pivot -= 1
+    def get_affected_ptm_sites(self, site_filter=None, site_index=None):
+        """Get PTM sites that might be affected by this mutation,
 
-        return list(sites_affected)
+        when taking into account -7 to +7 spans of each PTM site.
+        """
+        if site_index is None:
+            site_index = self.get_site_index(site_filter)
+        return site_index.affected_sites(self.position)
 
     def impact_on_specific_ptm(self, site, ignore_mimp=False):
         if self.position == site.position:
@@ -1767,42 +2083,40 @@ class Mutation(BioModel):
         else:
             return 'none'
 
-    def impact_on_ptm(self, site_filter=lambda x: x):
+    def impact_on_ptm(self, site_filter=None, site_index=None):
         """How intense might be an impact of the mutation on a PTM site.
 
         It describes impact on the closest PTM site or on a site chosen by
         MIMP algorithm (so it applies only when 'network-rewiring' is returned)
         """
-        sites = site_filter(self.protein.sites)
+        if site_index is None:
+            site_index = self.get_site_index(site_filter)
 
-        if self.is_close_to_some_site(0, 0, sites):
-            return 'direct'
-        elif any(site in sites for site in self.meta_MIMP.sites):
-            return 'network-rewiring'
-        elif self.is_close_to_some_site(2, 2, sites):
-            return 'proximal'
-        elif self.is_close_to_some_site(7, 7, sites):
-            return 'distal'
-        return 'none'
+        return self._rewiring_or(site_index.impact(self.position), site_index)
 
-    def find_closest_sites(self, distance=7, site_filter=lambda x: x):
-        # TODO: implement site type filter
-        pos = self.position
+    @staticmethod
+    def impacts_on_ptm(mutations, site_index):
+        """impact_on_ptm of many mutations of a single protein at once.
 
-        sites = Site.query.filter(
-            and_(
-                Site.protein_id == self.protein_id,
-                Site.position.between(pos - distance, pos + distance)
-            )
-        ).order_by(func.abs(Site.position - pos)).limit(2).all()
+        Positions are classified in a single sweep through the site_index.
+        """
+        impacts = site_index.classify([mutation.position for mutation in mutations])
+        return [
+            mutation._rewiring_or(impact, site_index)
+            for mutation, impact in zip(mutations, impacts)
+        ]
 
-        if(
-                        len(sites) == 2 and
-                        abs(sites[0].position - pos) != abs(sites[1].position - pos)
-        ):
-            return sites[:1]
-        else:
-            return sites
+    def _rewiring_or(self, impact, site_index):
+        if impact != 'direct' and any(site in site_index for site in self.meta_MIMP.sites):
+            return 'network-rewiring'
+        return impact
+
+    def find_closest_sites(self, distance=7, site_filter=None, site_index=None):
+        """Get the closest site (or two sites, if equally distant)
+        not further away than given distance."""
+        if site_index is None:
+            site_index = self.get_site_index(site_filter)
+        return site_index.closest_sites(self.position, distance)
 
     @hybrid_method
     def is_close_to_some_site(self, left, right, sites=None):
@@ -1812,36 +2126,32 @@ class Mutation(BioModel):
         (site_pos - left, site_pos + right)
         site_pos is the position of a site
 
-        Algorithm is based on bisection and an assumption,
-        that sites are sorted by position in the database.
+        Sites can be given as a SiteIndex or a list of sites;
+        by default the index of all sites of the protein is used.
         """
         if sites is None:
-            sites = self.protein.sites
-        pos = self.position
-        a = 0
-        b = len(sites)
-        while a != b:
-            p = (b - a) // 2 + a
-            site_pos = sites[p].position
-            if site_pos - left <= pos <= site_pos + right:
-                return True
-            if pos > site_pos:
-                a = p + 1
-            else:
-                b = p
-        return False
+            sites = self.protein.site_index
+        elif not isinstance(sites, SiteIndex):
+            sites = SiteIndex(sites)
+        return sites.is_close(self.position, left, right)
 
     @is_close_to_some_site.expression
-    def is_close_to_some_site(self, left, right):
-        """SQL expression for is_close_to_some_site"""
-        position = self.position
-        q = exists().where(
-            and_(
-                Site.protein_id == self.protein_id,
-                Site.position.between(position - left, position + right)
+    def is_close_to_some_site(cls, left, right):
+        """SQL expression for is_close_to_some_site
+
+        (correlated EXISTS, so it can be used to filter whole sets of mutations).
+        """
+        position = cls.position
+        return (
+            exists()
+            .where(
+                and_(
+                    Site.protein_id == cls.protein_id,
+                    Site.position.between(position - left, position + right)
+                )
             )
+            .correlate(cls)
         )
-        return db.session.query(q).scalar()
 
     @property
     def short_name(self):
@@ -1857,3 +2167,578 @@ class Mutation(BioModel):
             'is_confirmed': self.is_confirmed,
             'is_ptm': self.is_ptm()
         }
+
+
+class UserDatasetMutation(BioModel):
+    """Mutations of users' datasets (see UsersMutationsDataset), stored in the
+    biological database so that queries of mutations can be joined with it.
+
+    Mutations are referred to by (protein, position, alt) rather than by id,
+    as the novel mutations from users' data are not in the database.
+    """
+    __table_args__ = (
+        db.Index('user_dataset_mutation_index', 'dataset_uri', 'protein_id', 'position', 'alt'),
+    )
+
+    dataset_uri = db.Column(db.String(256))
+    protein_id = db.Column(db.Integer)
+    position = db.Column(db.Integer)
+    alt = db.Column(db.String(1))
+
+    @classmethod
+    def store(cls, dataset_uri, keys):
+        """Replace mutations of given dataset by (protein id, position, alt) keys."""
+        cls.remove(dataset_uri)
+        db.session.bulk_insert_mappings(cls, [
+            {'dataset_uri': dataset_uri, 'protein_id': protein_id, 'position': position, 'alt': alt}
+            for protein_id, position, alt in set(keys)
+        ])
+
+    @classmethod
+    def remove(cls, dataset_uri):
+        cls.query.filter_by(dataset_uri=dataset_uri).delete()
+
+    @classmethod
+    def is_stored(cls, dataset_uri):
+        return db.session.query(
+            cls.query.filter_by(dataset_uri=dataset_uri).exists()
+        ).scalar()
+
+    @classmethod
+    def in_dataset(cls, dataset_uri, target=None):
+        """SQL clause selecting mutations belonging to given dataset."""
+        target = target or Mutation
+        return exists().where(and_(
+            cls.dataset_uri == dataset_uri,
+            cls.protein_id == target.protein_id,
+            cls.position == target.position,
+            cls.alt == target.alt
+        ))
+
+
+class MutationSiteImpact(BioModel):
+    """Precomputed proximity of a mutation to a PTM site it might affect.
+
+    There is a row for every pair of a confirmed mutation (one with details
+    from any of the sources, see Mutation.sources_mask) and a site of the
+    same protein lying no further than 7 residues away from each other.
+    Impact classes are positional ones from Mutation.impact_on_specific_ptm,
+    as 'network-rewiring' depends on MIMP predictions, not on distance.
+
+    The table is filled by mutation importers and 'mutation_site_impacts'
+    importer; changes of mutations and sites made with ORM are reflected
+    on flush (see update_mutation_site_impacts).
+    """
+    __table_args__ = (
+        db.UniqueConstraint('mutation_id', 'site_id'),
+    )
+
+    mutation_id = db.Column(
+        db.Integer,
+        db.ForeignKey('mutation.id', ondelete='cascade'),
+        index=True
+    )
+    site_id = db.Column(
+        db.Integer,
+        db.ForeignKey('site.id', ondelete='cascade'),
+        index=True
+    )
+    distance = db.Column(db.SmallInteger)
+
+    impacts = ('direct', 'proximal', 'distal')
+    impact = db.Column(db.Enum(*impacts, name='ptm_impact'))
+
+    mutation = db.relationship(
+        'Mutation',
+        backref=backref('site_impacts', passive_deletes=True)
+    )
+    site = db.relationship(
+        'Site',
+        backref=backref('mutation_impacts', passive_deletes=True)
+    )
+
+    # the widest span around a site, as in Mutation.is_ptm_distal
+    max_distance = 7
+
+    @staticmethod
+    def impact_of_distance(distance):
+        """SQL counterpart of helpers.site_index.impact_of_distance"""
+        return case(
+            [
+                (distance == 0, 'direct'),
+                (distance <= 2, 'proximal')
+            ],
+            else_='distal'
+        )
+
+    @classmethod
+    def compute(cls, *criteria):
+        """Select rows describing impacts of confirmed mutations matching given criteria.
+
+        Novel mutations (e.g. created by users' searches) are not included,
+        just as these are not tracked on flush (see changed_confirmed_mutations).
+        """
+        distance = func.abs(Site.position - Mutation.position)
+        return (
+            select([
+                Mutation.id,
+                Site.id,
+                distance,
+                cls.impact_of_distance(distance)
+            ])
+            .select_from(
+                Mutation.__table__.join(
+                    Site.__table__,
+                    and_(
+                        Site.protein_id == Mutation.protein_id,
+                        Site.position.between(
+                            Mutation.position - cls.max_distance,
+                            Mutation.position + cls.max_distance
+                        )
+                    )
+                )
+            )
+            .where(and_(Mutation.sources_mask != 0, *criteria))
+        )
+
+    @classmethod
+    def recompute(cls, *criteria, session=None):
+        """Replace impact rows of mutations matching given criteria with freshly computed ones.
+
+        Without criteria the whole table will be rebuilt.
+        """
+        session = session or db.session
+        table = cls.__table__
+
+        delete = table.delete()
+        if criteria:
+            delete = delete.where(
+                cls.mutation_id.in_(select([Mutation.id]).where(and_(*criteria)))
+            )
+        session.execute(delete, mapper=cls.__mapper__)
+
+        insert = table.insert().from_select(
+            ['mutation_id', 'site_id', 'distance', 'impact'],
+            cls.compute(*criteria)
+        )
+        session.execute(insert, mapper=cls.__mapper__)
+
+
+@db.event.listens_for(db.session, 'before_flush')
+def update_mutations_sources_masks(session, flush_context, instances):
+    """Keep Mutation.sources_mask in sync with details added or removed with ORM.
+
+    Bulk inserts bypass this hook: importers update the masks on their own.
+    """
+    details_models = tuple(Mutation.get_source_model(name) for name in Mutation.sources_bits)
+    relationships = [Mutation.source_data_field(name) for name in Mutation.sources_bits]
+    mutations = set()
+
+    for instance in session.new:
+        if isinstance(instance, Mutation):
+            mutations.add(instance)
+
+    for instance in session.dirty:
+        if isinstance(instance, Mutation):
+            state = db.inspect(instance)
+            if any(state.attrs[key].history.has_changes() for key in relationships):
+                mutations.add(instance)
+
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, details_models) and instance.mutation:
+            mutations.add(instance.mutation)
+
+    for mutation in mutations:
+        if mutation in session.deleted:
+            continue
+        mask = mutation.compute_sources_mask(ignored=session.deleted)
+        if mask != mutation.sources_mask:
+            mutation.sources_mask = mask
+
+
+def has_changes(instance, keys):
+    state = db.inspect(instance)
+    return any(
+        state.attrs[key].history.has_changes()
+        for key in keys
+    )
+
+
+def has_positional_changes(instance):
+    return has_changes(instance, ('position', 'protein_id', 'protein'))
+
+
+def changed_confirmed_mutations(session):
+    """Mutations with details from confirmed sources which were added, moved
+    or of which the sources (or PTM status) changed in the flushed session.
+
+    Novel and user-only mutations (e.g. created by users' searches) are
+    skipped, as precomputed tables are only ever read for confirmed ones.
+    """
+    mutations = set()
+
+    for instance in session.new:
+        if isinstance(instance, Mutation) and instance.sources_mask:
+            mutations.add(instance)
+
+    for instance in session.dirty:
+        if isinstance(instance, Mutation) and (
+            has_changes(instance, ('sources_mask', 'precomputed_is_ptm')) or
+            (instance.sources_mask and has_positional_changes(instance))
+        ):
+            mutations.add(instance)
+
+    return mutations
+
+
+def changed_sites(session):
+    """Sites which were added or moved (or of which types changed) in the flushed session."""
+    return {
+        instance
+        for instance in session.new
+        if isinstance(instance, Site)
+    } | {
+        instance
+        for instance in session.dirty
+        if isinstance(instance, Site) and (
+            has_positional_changes(instance) or
+            has_changes(instance, ('types_mask', ))
+        )
+    }
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def update_mutation_site_impacts(session, flush_context):
+    """Keep MutationSiteImpact in sync with mutations and sites changed with ORM.
+
+    Impacts of changed confirmed mutations are recomputed one by one, while
+    changed sites require recomputing impacts of whole proteins; novel and
+    user-only mutations are not tracked (see changed_confirmed_mutations).
+
+    Bulk inserts bypass this hook: importers recompute impacts on their own.
+    """
+    proteins_ids = {site.protein_id for site in changed_sites(session)}
+    # (mutations of proteins which are recomputed as a whole are skipped)
+    mutations_ids = [
+        mutation.id
+        for mutation in changed_confirmed_mutations(session)
+        if mutation.protein_id not in proteins_ids
+    ]
+    removed = {Mutation: set(), Site: set()}
+
+    for instance in session.deleted:
+        if isinstance(instance, (Mutation, Site)):
+            removed[type(instance)].add(instance.id)
+
+    proteins_ids.discard(None)
+
+    if removed[Mutation]:
+        session.execute(
+            MutationSiteImpact.__table__.delete().where(
+                MutationSiteImpact.mutation_id.in_(removed[Mutation])
+            ),
+            mapper=MutationSiteImpact.__mapper__
+        )
+    if removed[Site]:
+        session.execute(
+            MutationSiteImpact.__table__.delete().where(
+                MutationSiteImpact.site_id.in_(removed[Site])
+            ),
+            mapper=MutationSiteImpact.__mapper__
+        )
+
+    for proteins_chunk in chunks(list(proteins_ids), 500):
+        MutationSiteImpact.recompute(
+            Mutation.protein_id.in_(proteins_chunk),
+            session=session
+        )
+
+    for mutations_chunk in chunks(mutations_ids, 500):
+        MutationSiteImpact.recompute(
+            Mutation.id.in_(mutations_chunk),
+            session=session
+        )
+
+
+class ProteinSummary(BioModel):
+    """Precomputed counts of mutations and PTM sites of a protein.
+
+    There is a row for every protein and every combination of a source of
+    mutations and a type of sites: empty source stands for all confirmed
+    mutations and empty site type for sites of any type. The counts are
+    defined as in gene browse tables (see views.gene.prepare_subqueries).
+
+    Rows are refreshed by mutation importers for affected proteins and can
+    be rebuilt with 'protein_summary' manage.py command; changes of sites,
+    mutations (with details from confirmed sources) made with ORM remove the
+    rows of affected proteins (see invalidate_protein_summaries) so live
+    counts are used.
+    """
+    __table_args__ = (
+        db.UniqueConstraint('protein_id', 'source', 'site_type'),
+    )
+
+    protein_id = db.Column(
+        db.Integer,
+        db.ForeignKey('protein.id', ondelete='cascade'),
+        index=True
+    )
+    source = db.Column(db.String(16), default='')
+    site_type = db.Column(db.String(32), default='')
+
+    mutations_count = db.Column(db.Integer)
+    ptm_mutations_count = db.Column(db.Integer)
+    sites_count = db.Column(db.Integer)
+
+    protein = db.relationship(
+        'Protein',
+        backref=backref('summaries', lazy='dynamic', passive_deletes=True)
+    )
+
+    sources = [''] + [name for name in Mutation.source_fields if name != 'user']
+    site_types = [''] + Site.types
+
+    @staticmethod
+    def mutations_filter(source):
+        if source:
+            return Mutation.sources_mask_filter([source])
+        return Mutation.is_confirmed == True
+
+    @classmethod
+    def compute(cls, source, site_type, *criteria):
+        """Select rows of given source and site type for proteins matching criteria."""
+        mutations_filter = cls.mutations_filter(source)
+        sites_filters = [Site.type.contains(site_type)] if site_type else []
+
+        mutations = select([func.count(Mutation.id)]).where(and_(
+            Mutation.protein_id == Protein.id,
+            mutations_filter
+        ))
+
+        if site_type:
+            ptm_mutations = (
+                select([func.count(distinct(Mutation.id))])
+                .select_from(
+                    Mutation.__table__
+                    .join(MutationSiteImpact.__table__, MutationSiteImpact.mutation_id == Mutation.id)
+                    .join(Site.__table__, Site.id == MutationSiteImpact.site_id)
+                )
+                .where(and_(
+                    Mutation.protein_id == Protein.id,
+                    mutations_filter,
+                    *sites_filters
+                ))
+            )
+        else:
+            ptm_mutations = select([func.count(Mutation.id)]).where(and_(
+                Mutation.protein_id == Protein.id,
+                Mutation.precomputed_is_ptm,
+                mutations_filter
+            ))
+
+        sites = select([func.count(Site.id)]).where(and_(
+            Site.protein_id == Protein.id,
+            *sites_filters
+        ))
+
+        return (
+            select([
+                Protein.id,
+                literal(source),
+                literal(site_type),
+                mutations.as_scalar(),
+                ptm_mutations.as_scalar(),
+                sites.as_scalar()
+            ])
+            .where(and_(*criteria))
+        )
+
+    @classmethod
+    def recompute(cls, *criteria, session=None):
+        """Replace summaries of proteins matching given criteria with freshly computed ones.
+
+        Without criteria the whole table will be rebuilt.
+        """
+        session = session or db.session
+        table = cls.__table__
+
+        delete = table.delete()
+        if criteria:
+            delete = delete.where(
+                cls.protein_id.in_(select([Protein.id]).where(and_(*criteria)))
+            )
+        session.execute(delete, mapper=cls.__mapper__)
+
+        for source in cls.sources:
+            for site_type in cls.site_types:
+                insert = table.insert().from_select(
+                    [
+                        'protein_id', 'source', 'site_type',
+                        'mutations_count', 'ptm_mutations_count', 'sites_count'
+                    ],
+                    cls.compute(source, site_type, *criteria)
+                )
+                session.execute(insert, mapper=cls.__mapper__)
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def invalidate_protein_summaries(session, flush_context):
+    """Remove summaries of proteins which sites, confirmed mutations or their details were changed with ORM.
+
+    Only changes feeding the counts are considered: novel and user-only
+    mutations (and users' details, as attached by searches) are not counted,
+    so these leave the summaries intact.
+
+    Bulk inserts bypass this hook: importers recompute summaries on their own.
+    """
+    details_models = tuple(
+        Mutation.get_source_model(name)
+        for name in Mutation.sources_bits
+    )
+    proteins_ids = {
+        instance.protein_id
+        for instance in chain(changed_confirmed_mutations(session), changed_sites(session))
+    }
+
+    for instance in session.deleted:
+        if isinstance(instance, Site) or (isinstance(instance, Mutation) and instance.sources_mask):
+            proteins_ids.add(instance.protein_id)
+
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, details_models) and instance.mutation:
+            proteins_ids.add(instance.mutation.protein_id)
+
+    proteins_ids.discard(None)
+
+    if proteins_ids:
+        session.execute(
+            ProteinSummary.__table__.delete().where(
+                ProteinSummary.protein_id.in_(proteins_ids)
+            ),
+            mapper=ProteinSummary.__mapper__
+        )
+
+    for protein_id in proteins_ids:
+        key = Protein.__mapper__.identity_key_from_primary_key([protein_id])
+        protein = session.identity_map.get(key)
+        if protein:
+            protein.__dict__.pop('precomputed_counts', None)
+
+
+class PrerenderedRepresentation(BioModel):
+    """Compressed JSON of a representation of a protein (e.g. of the needle
+    plot or of the kinase network) prepared offline, under default filters.
+
+    Rows are created by 'prerender' manage.py command (see views.prerender)
+    and are only valid for the data release for which they were rendered.
+    """
+    __table_args__ = (
+        db.UniqueConstraint('protein_id', 'kind'),
+    )
+
+    protein_id = db.Column(
+        db.Integer,
+        db.ForeignKey('protein.id', ondelete='cascade'),
+        index=True
+    )
+    kind = db.Column(db.String(16))
+    release = db.Column(db.Integer)
+    content = db.deferred(db.Column(db.LargeBinary(length=2 ** 32 - 1)))
+
+    @classmethod
+    def load(cls, protein, kind, release):
+        """Representation data or None if there is none for given release."""
+        content = (
+            db.session.query(cls.content)
+            .filter_by(protein_id=protein.id, kind=kind, release=release)
+            .scalar()
+        )
+        if content is None:
+            return None
+        return json.loads(zlib.decompress(content).decode('utf-8'))
+
+    @classmethod
+    def store(cls, protein, kind, release, data):
+        representation, created = get_or_create(cls, protein_id=protein.id, kind=kind)
+        representation.release = release
+        representation.content = zlib.compress(json.dumps(data).encode('utf-8'))
+        if created:
+            db.session.add(representation)
+        return representation
+
+
+def mutation_details_loaders(strategy):
+    return [
+        getattr(Load(Mutation), strategy)(field)
+        for field in Mutation.source_data_relationships
+    ]
+
+
+# Named sets of loading strategies, defined per model (profiles are applied
+# with: query.options(*Model.loading_options(profile_name))). Mind that the
+# default (lazy) strategies are still used if a profile is not requested.
+loading_profiles = {
+    # autocomplete results and browse tables: neither sites nor
+    # heavy text columns are needed to present a protein in a list
+    'list': {
+        Gene: [
+            Load(Gene).defer(column)
+            for column in ('full_name', 'strand', 'chrom', 'entrez_id')
+        ],
+        Protein: [Load(Protein).lazyload('sites')] + [
+            Load(Protein).defer(column)
+            for column in ('summary', 'sequence', 'disorder_map')
+        ]
+    },
+    # protein views: sites with kinases and details of mutations from all
+    # sources are fetched with a few batched queries (instead of a query
+    # per site or per mutation per source)
+    'representation': {
+        Protein: [
+            Load(Protein).selectinload('sites').selectinload('kinases'),
+            Load(Protein).selectinload('sites').selectinload('kinase_groups')
+        ],
+        Site: [
+            Load(Site).selectinload('kinases'),
+            Load(Site).selectinload('kinase_groups')
+        ],
+        Mutation: mutation_details_loaders('selectinload')
+    },
+    # kinase networks: besides of the details of mutations, MIMP predictions
+    # are resolved to sites and kinases, and the kinases to their proteins
+    # (and genes, which are targeted by drugs) all in a few batched queries
+    'network': {
+        Site: [
+            Load(Site).selectinload('kinases').joinedload('protein').joinedload('gene'),
+            Load(Site).selectinload('kinase_groups').selectinload('kinases')
+        ],
+        Mutation: mutation_details_loaders('selectinload') + [
+            Load(Mutation).selectinload('meta_MIMP').joinedload('site'),
+            Load(Mutation).selectinload('meta_MIMP').joinedload('kinase').joinedload('protein').joinedload('gene'),
+            Load(Mutation).selectinload('meta_MIMP').joinedload('kinase_group').selectinload('kinases')
+        ]
+    },
+    # exporters iterating over all proteins, sites or mutations details
+    'export': {
+        Protein: [
+            Load(Protein).joinedload('gene'),
+            # proteins of kinases are needed for their refseq only
+            Load(Protein).selectinload('sites').selectinload('kinases')
+            .joinedload('protein').lazyload('sites'),
+            Load(Protein).selectinload('sites').selectinload('kinases')
+            .joinedload('protein').lazyload('gene')
+        ],
+        Site: [
+            Load(Site).selectinload('kinases'),
+            Load(Site).joinedload('protein').joinedload('gene')
+        ],
+        Mutation: mutation_details_loaders('selectinload') + [
+            Load(Mutation).joinedload('protein')
+        ]
+    }
+}
+
+loading_profiles['export'].update(
+    (details_model, [Load(details_model).joinedload('mutation')])
+    for details_model in Mutation.source_specific_data
+)
@@ -1,5 +1,8 @@
 import os
 import pickle
+from array import array
+from collections import OrderedDict
+from collections import defaultdict
 from contextlib import suppress
 from datetime import datetime
 from datetime import timedelta
@@ -13,6 +16,7 @@ from werkzeug.utils import cached_property
 
 import security
 from database import db, utc_now, utc_days_after, update
+from helpers.models import chunks
 from exceptions import ValidationError
 from models import Model
 
@@ -103,9 +107,244 @@ class AnonymousUser:
         return None
 
 
+class StoredSearchResults:
+    """Results of a MutationSearch, as saved in users' datasets.
+
+    Only identifiers of the mutations found, the query lines and
+    the user's counts are kept, in columns (arrays, one element per
+    result row); the rows are grouped by query lines, in order.
+    Protein and Mutation objects are retrieved (in bulk) only for
+    the lines requested with results().
+    """
+
+    types = ('genomic', 'proteomic')
+
+    # columns of rows and their typecodes (None for lists)
+    columns = OrderedDict([
+        ('line', 'L'),
+        ('type', 'B'),
+        ('protein_id', 'L'),
+        ('position', 'L'),
+        ('ref', None),
+        ('alt', None),
+        ('count', 'L'),
+        # the query of mutation's meta_user, index in user_queries
+        ('user_query', 'L'),
+    ])
+
+    def __init__(
+        self, query='', without_mutations=(), badly_formatted=(),
+        hidden_results_cnt=0, lines=(), user_queries=(), **columns
+    ):
+        self.query = query
+        self.without_mutations = list(without_mutations)
+        self.badly_formatted = list(badly_formatted)
+        self.hidden_results_cnt = hidden_results_cnt
+        self.lines = list(lines)
+        self.user_queries = list(user_queries)
+
+        for name, typecode in self.columns.items():
+            values = columns.get(name, ())
+            setattr(self, name, array(typecode, values) if typecode else list(values))
+
+        # items created by _hydrate, by row, and keys of mutations with details attached
+        self.hydrated = {}
+        self.keys_with_meta = set()
+
+        self.index_lines()
+
+    def index_lines(self):
+        """Find offsets of the first rows of each of the lines (and the end of the last one)."""
+        self.line_starts = [0] * (len(self.lines) + 1)
+        for line in self.line:
+            self.line_starts[line + 1] += 1
+        for i in range(len(self.lines)):
+            self.line_starts[i + 1] += self.line_starts[i]
+
+    @classmethod
+    def from_search(cls, search):
+        stored = cls(
+            query=search.query,
+            without_mutations=search.without_mutations,
+            badly_formatted=search.badly_formatted,
+            hidden_results_cnt=search.hidden_results_cnt,
+            lines=search.results.keys()
+        )
+        user_queries = {}
+
+        for i, items in enumerate(search.results.values()):
+            for item in items:
+                meta = item['mutation'].meta_user
+
+                if meta.query not in user_queries:
+                    user_queries[meta.query] = len(stored.user_queries)
+                    stored.user_queries.append(meta.query)
+
+                stored.line.append(i)
+                stored.type.append(cls.types.index(item['type']))
+                stored.protein_id.append(item['protein'].id)
+                stored.position.append(item['pos'])
+                stored.ref.append(item['ref'])
+                stored.alt.append(item['alt'])
+                stored.count.append(meta.count)
+                stored.user_query.append(user_queries[meta.query])
+
+        stored.index_lines()
+        return stored
+
+    def to_dict(self):
+        data = {
+            'query': self.query,
+            'without_mutations': self.without_mutations,
+            'badly_formatted': self.badly_formatted,
+            'hidden_results_cnt': self.hidden_results_cnt,
+            'lines': self.lines,
+            'user_queries': self.user_queries
+        }
+        for name in self.columns:
+            data[name] = getattr(self, name)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    @property
+    def query_size(self):
+        new_lines = self.query.count('\n')
+        return new_lines + 1 if new_lines else 0
+
+    @property
+    def results_count(self):
+        return len(self.line)
+
+    def keys(self):
+        """(protein id, position, alt) of mutations in consecutive rows."""
+        return zip(self.protein_id, self.position, self.alt)
+
+    @cached_property
+    def rows_by_key(self):
+        """(protein id, position, alt) => first row with such mutation"""
+        rows = {}
+        for row, key in enumerate(self.keys()):
+            rows.setdefault(key, row)
+        return rows
+
+    @cached_property
+    def rows_by_protein(self):
+        """protein id => rows with mutations of the protein"""
+        rows = defaultdict(list)
+        for row, protein_id in enumerate(self.protein_id):
+            rows[protein_id].append(row)
+        return rows
+
+    def find(self, protein_id, position, alt):
+        """Row with given mutation or None."""
+        return self.rows_by_key.get((protein_id, position, alt))
+
+    def mutations_of_proteins(self, proteins_ids):
+        """Mutations (with user's details) of given proteins."""
+        rows = sorted(
+            row
+            for protein_id in set(proteins_ids)
+            for row in self.rows_by_protein.get(protein_id, [])
+        )
+        return [item['mutation'] for item in self._hydrate(rows)]
+
+    def _hydrate(self, rows):
+        """Create result items (as in MutationSearch.results) for given rows.
+
+        Items are created once per row (and details of users' mutations
+        once per mutation), so repeated calls return the same objects
+        instead of attaching new details to the mutations.
+        """
+        hydrated = self.hydrated
+        missing = [row for row in rows if row not in hydrated]
+
+        if missing:
+            hydrated.update(zip(missing, self._create_items(missing)))
+
+        return [hydrated[row] for row in rows]
+
+    def _create_items(self, rows):
+        from models import Protein, Mutation, UserUploadedMutation
+
+        proteins_ids = {self.protein_id[row] for row in rows}
+        proteins = {}
+        for chunk in chunks(proteins_ids, 500):
+            proteins.update(
+                (protein.id, protein)
+                for protein in Protein.query.filter(Protein.id.in_(chunk))
+            )
+
+        mutations = Mutation.get_or_create_many(
+            proteins,
+            [
+                (self.protein_id[row], self.position[row], self.alt[row])
+                for row in rows
+            ]
+        )
+
+        items = []
+        with_meta = self.keys_with_meta
+
+        for row in rows:
+            key = (self.protein_id[row], self.position[row], self.alt[row])
+            mutation = mutations[key]
+
+            if key not in with_meta:
+                count = self.count[row]
+                query = self.user_queries[self.user_query[row]]
+                # details already attached to the mutation (in this session)
+                # are reused, so these do not get orphaned
+                if mutation.meta_user:
+                    mutation.meta_user.count = count
+                    mutation.meta_user.query = query
+                else:
+                    mutation.meta_user = UserUploadedMutation(count=count, query=query)
+                with_meta.add(key)
+
+            items.append({
+                'protein': proteins[key[0]],
+                'ref': self.ref[row],
+                'alt': self.alt[row],
+                'pos': self.position[row],
+                'mutation': mutation,
+                'type': self.types[self.type[row]]
+            })
+
+        return items
+
+    def results(self, offset=0, limit=None):
+        """Results for query lines from given range (as in MutationSearch.results).
+
+        Returns:
+            OrderedDict: query line => result items
+        """
+        stop = len(self.lines) if limit is None else min(offset + limit, len(self.lines))
+        if offset >= stop:
+            return OrderedDict()
+
+        rows = range(self.line_starts[offset], self.line_starts[stop])
+        items = self._hydrate(rows)
+
+        results = OrderedDict()
+        for row, item in zip(rows, items):
+            results.setdefault(self.lines[self.line[row]], []).append(item)
+        return results
+
+    def mutations(self):
+        """Mutations of all the rows."""
+        return [item['mutation'] for item in self._hydrate(range(self.results_count))]
+
+
 class UsersMutationsDataset(CMSModel):
     mutations_dir = 'user_mutations'
 
+    # files in the StoredSearchResults format start with that;
+    # older ones contain pickled MutationSearch objects
+    format_header = b'SSR2'
+
     name = db.Column(db.String(256))
     uri = db.Column(db.String(256), unique=True, index=True)
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -129,10 +368,10 @@ class UsersMutationsDataset(CMSModel):
 
     @property
     def data(self):
+        """Saved results (StoredSearchResults), None if there are none."""
         if not hasattr(self, '_data'):
             try:
                 self._data = self._load_from_file()
-                self._bind_to_session()
             except FileNotFoundError:
                 # None if associated file was deleted.
                 # Be aware of this line when debugging.
@@ -141,10 +380,15 @@ class UsersMutationsDataset(CMSModel):
 
     @data.setter
     def data(self, data):
+        if data is not None and not isinstance(data, StoredSearchResults):
+            data = StoredSearchResults.from_search(data)
         self._data = data
         uri = self._save_to_file(data, self.uri)
         self.uri = uri
 
+        from models import UserDatasetMutation
+        UserDatasetMutation.store(uri, data.keys() if data else [])
+
         # to be refactored after November 3, when all datasets
         # will already have the following properties defined:
         if data:
@@ -156,10 +400,14 @@ class UsersMutationsDataset(CMSModel):
 
         Current session won't be committed if commit=False is provided.
         """
+        from models import UserDatasetMutation
+
         # hard delete of data is the first priority
         with suppress(FileNotFoundError):
             os.remove(self._path)
 
+        UserDatasetMutation.remove(self.uri)
+
         # soft delete associated entry
         update(self, store_until=utc_now())
         if commit:
@@ -203,7 +451,9 @@ class UsersMutationsDataset(CMSModel):
                 delete=False
             )
 
-        pickle.dump(data, db_file, protocol=4)
+        db_file.write(self.format_header)
+        pickle.dump(data.to_dict() if data else None, db_file, protocol=4)
+        db_file.close()
 
         uri_code = os.path.basename(db_file.name)[:-3]
 
@@ -219,8 +469,30 @@ class UsersMutationsDataset(CMSModel):
     def _load_from_file(self):
 
         with open(self._path, 'rb') as f:
+            if f.read(len(self.format_header)) != self.format_header:
+                f.seek(0)
+                # a pickled MutationSearch
+                search = pickle.load(f)
+                return StoredSearchResults.from_search(search) if search else None
+
             data = pickle.load(f)
-        return data
+
+        return StoredSearchResults.from_dict(data) if data else None
+
+    @property
+    def has_legacy_format(self):
+        try:
+            with open(self._path, 'rb') as f:
+                return f.read(len(self.format_header)) != self.format_header
+        except FileNotFoundError:
+            return False
+
+    def convert_legacy_format(self):
+        """Re-save the data in the current format (if stored in the legacy one)."""
+        if not self.has_legacy_format:
+            return False
+        self.data = self.data
+        return True
 
     @hybrid_property
     def is_expired(self):
@@ -238,45 +510,66 @@ class UsersMutationsDataset(CMSModel):
     @property
     def query_size(self):
         if self.query_count is None:
-            new_lines = self.data.query.count('\n')
-            return new_lines + 1 if new_lines else 0
+            return self.data.query_size
         return self.query_count
 
     @property
     def mutations(self):
-        mutations = []
-        results = self.data.results
-        for results in results.values():
-            for result in results:
-                mutations.append(result['mutation'])
-        return mutations
+        return self.data.mutations()
 
     @property
     def mutations_count(self):
         if self.results_count is None:
-            return len(self.mutations)
+            return self.data.results_count
         return self.results_count
 
+    def contains(self, mutation):
+        return self.data.find(mutation.protein_id, mutation.position, mutation.alt) is not None
+
     def get_mutation_details(self, protein, pos, alt):
-        for mutation in self.mutations:
-            if (
-                mutation.protein == protein and
-                mutation.position == pos and
-                mutation.alt == alt
-            ):
-                return mutation.meta_user
-
-    def _bind_to_session(self):
-        results = self.data.results
-        proteins = {}
-        for name, results in results.items():
-            for result in results:
-                protein = result['protein']
-                if protein.refseq not in proteins:
-                    proteins[protein.refseq] = db.session.merge(result['protein'])
-
-                result['protein'] = proteins[protein.refseq]
-                result['mutation'] = db.session.merge(result['mutation'])
+        row = self.data.find(protein.id, pos, alt)
+        if row is None:
+            return None
+        return self.data._hydrate([row])[0]['mutation'].meta_user
+
+    def attach_details(self, proteins_ids=None):
+        """Attach users' details (meta_user) to mutations of this dataset (of given
+        proteins only, if provided), adding novel mutations to the session.
+
+        Filters and representations of users' mutations expect these.
+        """
+        if proteins_ids is None:
+            return self.data.mutations()
+        return self.data.mutations_of_proteins(proteins_ids)
+
+    def index_mutations(self):
+        """Store UserDatasetMutation rows of this dataset if these are missing
+        (i.e. for datasets saved before these were introduced).
+
+        The change is not committed. Returns True if the rows were stored.
+        The data are loaded only if the rows are missing and any are expected.
+        """
+        from models import UserDatasetMutation
+
+        # results_count is not known for the oldest datasets
+        if self.results_count == 0 or UserDatasetMutation.is_stored(self.uri):
+            return False
+
+        if not self.data or not self.data.results_count:
+            return False
+
+        UserDatasetMutation.store(self.uri, self.data.keys())
+        return True
+
+    def mutations_filter(self):
+        """SQL clause selecting mutations from this dataset.
+
+        The mutations are joined with UserDatasetMutation rows, stored when
+        the dataset is saved; the rows of datasets saved before these were
+        introduced have to be stored first (see index_mutations).
+        """
+        from models import UserDatasetMutation
+        return UserDatasetMutation.in_dataset(self.uri)
 
 
 class User(CMSModel):
@@ -0,0 +1,178 @@
+import os
+import shutil
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from hashlib import sha1
+from os.path import abspath
+from os.path import dirname
+from os.path import join
+from threading import Lock
+
+
+DATA_RELEASE_COUNTER = 'data_release'
+DATA_RELEASE_TIME_SETTING = 'data_release_time'
+DATA_RELEASE_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def get_data_release():
+    """Version of the biological data, bumped whenever imports change it.
+
+    It is stored (as a Count) in the CMS database, so all the workers
+    see the same value without touching the biological database.
+    """
+    from database import db
+    from models import Count
+    return (
+        db.session.query(Count.value)
+        .filter(Count.name == DATA_RELEASE_COUNTER)
+        .scalar()
+    ) or 0
+
+
+def get_data_release_time():
+    """When the data release was bumped last time (naive UTC datetime) or None."""
+    from database import db
+    from models import Setting
+    value = (
+        db.session.query(Setting.value)
+        .filter(Setting.name == DATA_RELEASE_TIME_SETTING)
+        .scalar()
+    )
+    if not value:
+        return None
+    return datetime.strptime(value, DATA_RELEASE_TIME_FORMAT)
+
+
+def bump_data_release():
+    """Mark the biological data as changed, invalidating cached responses.
+
+    The change has to be committed by the caller.
+    """
+    from database import db, get_or_create, response_cache
+    from helpers.filters import FilterManager
+    from models import Count, Setting
+
+    release, created = get_or_create(Count, name=DATA_RELEASE_COUNTER)
+    release.value = (release.value or 0) + 1
+
+    if created:
+        db.session.add(release)
+
+    release_time, created = get_or_create(Setting, name=DATA_RELEASE_TIME_SETTING)
+    release_time.value = datetime.utcnow().strftime(DATA_RELEASE_TIME_FORMAT)
+
+    if created:
+        db.session.add(release_time)
+
+    # entries of old releases would never be read again; free the disk space
+    response_cache.clear()
+
+    # choices of filters (e.g. disease names) might have changed too
+    FilterManager.clear_parsed_states()
+
+    return release.value
+
+
+class ResponseCache:
+    """Two-tier cache of serialised responses (bytes) of expensive views.
+
+    Entries are looked up in a small, in-process LRU first, and then in
+    a directory (one compressed file per entry) shared by all workers.
+    Writes are atomic (to a temporary file first, then renamed),
+    so concurrent readers never see a partial entry.
+
+    The cache is not aware of changes in the data: the keys have to
+    include everything a response depends on - including the data
+    release (see get_data_release), so imports invalidate old entries.
+    """
+
+    def __init__(self, path=None, capacity=128):
+        self.memory = OrderedDict()
+        self.lock = Lock()
+        self.path = None
+        self.is_enabled = False
+        self.capacity = capacity
+        if path:
+            self.open(path)
+
+    def open(self, path=None, capacity=None):
+        """Enable the cache; without a path only the in-process tier is used."""
+        self.clear_memory()
+
+        if capacity is not None:
+            self.capacity = capacity
+
+        if path:
+            base_dir = abspath(dirname(__file__))
+            self.path = join(base_dir, path)
+            os.makedirs(self.path, exist_ok=True)
+        else:
+            self.path = None
+
+        self.is_enabled = True
+
+    def close(self):
+        self.clear_memory()
+        self.is_enabled = False
+
+    @staticmethod
+    def make_key(*parts):
+        return sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return join(self.path, key[:2], key)
+
+    def _remember(self, key, value):
+        with self.lock:
+            self.memory[key] = value
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.capacity:
+                self.memory.popitem(last=False)
+
+    def get(self, key):
+        """Return cached value or None if there is no such entry."""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+
+        if not self.path:
+            return None
+
+        try:
+            with open(self._entry_path(key), 'rb') as f:
+                value = zlib.decompress(f.read())
+        except (FileNotFoundError, zlib.error):
+            return None
+
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        self._remember(key, value)
+
+        if not self.path:
+            return
+
+        path = self._entry_path(key)
+        os.makedirs(dirname(path), exist_ok=True)
+
+        temp_path = '%s.%s.tmp' % (path, os.getpid())
+
+        with open(temp_path, 'wb') as f:
+            f.write(zlib.compress(value))
+
+        os.replace(temp_path, path)
+
+    def clear_memory(self):
+        with self.lock:
+            self.memory.clear()
+
+    def clear(self):
+        """Remove all entries, from both tiers."""
+        self.clear_memory()
+
+        if self.path:
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.makedirs(self.path, exist_ok=True)
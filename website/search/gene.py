@@ -48,6 +48,9 @@ class GeneMatch:
 
 class GeneOrProteinSearch(ABC):
 
+    # can the look up be answered from in-memory prefix index (see index_entries)?
+    indexable = False
+
     def __init__(self, options=None):
         self.options = options
 
@@ -65,6 +68,21 @@ class GeneOrProteinSearch(ABC):
     def search(self, phrase, sql_filters=None, limit=None):
         pass
 
+    def prepare_phrase(self, phrase):
+        """Adjust the phrase to the searched feature.
+
+        Returns None if the phrase cannot match the feature at all.
+        """
+        return phrase
+
+    def index_entries(self):
+        """Values of the feature for the prefix index of indexable engines.
+
+        Returns:
+            iterable of (value, gene id, isoform id or None) tuples
+        """
+        raise NotImplementedError
+
     @property
     def base_query(self):
         return Gene.query
@@ -85,9 +103,22 @@ class GeneSearch(GeneOrProteinSearch):
         """Name of the feature analysed by this GeneSearch."""
         return ''
 
+    indexable = True
+
     def get_feature(self, gene):
         return getattr(gene, self.feature)
 
+    def index_entries(self):
+        # only genes with preferred isoforms are searchable (see search)
+        query = (
+            db.session.query(self.get_feature(Gene), Gene.id)
+            .filter(Gene.preferred_isoform_id.isnot(None))
+        )
+        return (
+            (value, gene_id, None)
+            for value, gene_id in query
+        )
+
     def search(self, phrase, sql_filters=None, limit=None):
         """Perform look up for a gene using provided phrase.
 
@@ -152,6 +183,13 @@ class ProteinSearch(GeneOrProteinSearch):
     The matched isoforms are recorded in GeneMatch object.
     """
 
+    def isoforms_features(self):
+        """Query for (value, gene id, isoform id) of isoforms, used by index_entries."""
+        raise NotImplementedError
+
+    def index_entries(self):
+        return self.isoforms_features().filter(Protein.gene_id.isnot(None))
+
     def create_query(
             self, limit, filters, sql_filters, entities=(Gene, Protein),
             add_joins=lambda query: query
@@ -220,6 +258,10 @@ class ProteinSearch(GeneOrProteinSearch):
 
 class ProteinNameSearch(ProteinSearch):
     name = 'protein_name'
+    indexable = True
+
+    def isoforms_features(self):
+        return db.session.query(Protein.full_name, Protein.gene_id, Protein.id)
 
     def search(self, phrase, sql_filters=None, limit=None):
 
@@ -248,13 +290,25 @@ class RefseqGeneSearch(ProteinSearch):
 
     name = 'refseq'
     pretty_name = 'RefSeq'
+    indexable = True
 
-    def search(self, phrase, sql_filters=None, limit=None):
-
+    def prepare_phrase(self, phrase):
         if phrase.isnumeric():
             phrase = 'NM_' + phrase
 
         if not (phrase.startswith('NM_') or phrase.startswith('nm_')):
+            return None
+
+        return phrase
+
+    def isoforms_features(self):
+        return db.session.query(Protein.refseq, Protein.gene_id, Protein.id)
+
+    def search(self, phrase, sql_filters=None, limit=None):
+
+        phrase = self.prepare_phrase(phrase)
+
+        if not phrase:
             return []
 
         filters = [Protein.refseq.like(phrase + '%')]
@@ -271,7 +325,10 @@ class RefseqGeneSearch(ProteinSearch):
 class SummarySearch(ProteinSearch):
     """Look up a gene by summary of isoforms.
 
-    This is full-text search and may be expensive.
+    This is full-text search and may be expensive, unless the inverted
+    index of summaries was built: then all words of the phrase (the last
+    one as a prefix) need to occur in a summary and the genes are chosen
+    by relevance of summaries.
 
     Targets: Protein.summary
     """
@@ -282,11 +339,70 @@ class SummarySearch(ProteinSearch):
         super().__init__(options)
         self.minimal_length = minimal_length
 
+    def index_documents(self):
+        """Summaries for the text index: (isoform id, gene id, summary) tuples."""
+        return (
+            db.session.query(Protein.id, Protein.gene_id, Protein.summary)
+            .filter(Protein.gene_id.isnot(None))
+        )
+
+    def search_in_index(self, phrase, limit=None):
+        from database import search_index
+
+        found = search_index[self.name].search(phrase, limit)
+
+        if not found:
+            return []
+
+        genes = {
+            gene.id: gene
+            for gene in self.query.filter(Gene.id.in_([gene_id for gene_id, _, _ in found]))
+        }
+        isoforms = {
+            isoform.id: isoform
+            for isoform in Protein.query.filter(
+                Protein.id.in_([
+                    isoform_id
+                    for _, _, isoforms_ids in found
+                    for isoform_id in isoforms_ids
+                ])
+            )
+        }
+
+        matches = []
+
+        for gene_id, relevance, isoforms_ids in found:
+            matched_isoforms = [isoforms[i] for i in isoforms_ids if i in isoforms]
+            if gene_id not in genes or not matched_isoforms:
+                continue
+            match = GeneMatch.from_feature(
+                genes[gene_id],
+                self,
+                self.relevance_score(relevance),
+                matched_isoforms=matched_isoforms
+            )
+            matches.append(match)
+
+        return matches
+
+    @staticmethod
+    def relevance_score(relevance):
+        """Turn relevance of a summary (more is better) into a score (less is better).
+
+        The score is below 1, so exact matches of other features come first.
+        """
+        return 1 / (1 + relevance)
+
     def search(self, phrase, sql_filters=None, limit=None):
+        from database import search_index
 
         if len(phrase) < self.minimal_length:
             return []
 
+        # the index cannot evaluate SQL filters
+        if not sql_filters and self.name in search_index:
+            return self.search_in_index(phrase, limit)
+
         filters = [Protein.summary.ilike('%' + phrase + '%')]
 
         query = self.create_query(limit, filters, sql_filters)
@@ -307,10 +423,24 @@ class UniprotSearch(ProteinSearch):
     """
 
     name = 'uniprot'
+    indexable = True
+
+    def prepare_phrase(self, phrase):
+        if len(phrase) < 3:
+            return None
+        return phrase
+
+    def isoforms_features(self):
+        return (
+            db.session.query(UniprotEntry.accession, Protein.gene_id, Protein.id)
+            .select_from(Protein)
+            .join(ProteinReferences)
+            .join(UniprotEntry)
+        )
 
     def search(self, phrase, sql_filters=None, limit=None):
 
-        if len(phrase) < 3:
+        if not self.prepare_phrase(phrase):
             return []
 
         filters = [UniprotEntry.accession.like(phrase + '%')]
@@ -362,3 +492,97 @@ search_feature_engines = [
     SummarySearch
 ]
 
+
+
+def search_in_index(phrase, features, engines, limit=None):
+    """Look up genes in the in-memory prefix index, instead of the database.
+
+    Only the finally matched genes (and isoforms) are loaded
+    from the database, with two queries.
+
+    Args:
+        features: names of indexable features, all present in search_index
+        engines: mapping of engine name => engine instance
+
+    Returns:
+        list of GeneMatch objects (one per feature and gene)
+    """
+    from database import search_index
+
+    found = []
+
+    for feature in features:
+        engine = engines[feature]
+        prepared_phrase = engine.prepare_phrase(phrase)
+        if not prepared_phrase:
+            continue
+        for gene_id, score, isoforms_ids in search_index[feature].search(prepared_phrase, limit):
+            found.append((engine, gene_id, score, isoforms_ids))
+
+    if not found:
+        return []
+
+    genes_ids = {gene_id for _, gene_id, _, _ in found}
+    all_isoforms_ids = {
+        isoform_id
+        for _, _, _, isoforms_ids in found
+        for isoform_id in isoforms_ids
+    }
+
+    query = Gene.query
+    if engines:
+        # engines share loading options
+        query = next(iter(engines.values())).query
+
+    genes = {
+        gene.id: gene
+        for gene in query.filter(Gene.id.in_(genes_ids))
+    }
+    isoforms = (
+        {
+            isoform.id: isoform
+            for isoform in Protein.query.filter(Protein.id.in_(all_isoforms_ids))
+        }
+        if all_isoforms_ids else {}
+    )
+
+    return [
+        GeneMatch.from_feature(
+            genes[gene_id], engine, score,
+            matched_isoforms=[isoforms[isoform_id] for isoform_id in isoforms_ids if isoform_id in isoforms]
+        )
+        for engine, gene_id, score, isoforms_ids in found
+        # the index might be a bit older than the database
+        if gene_id in genes
+    ]
+
+
+def rebuild_search_index():
+    """Build prefix indices of all indexable features (see search_in_index),
+    inverted index of summaries and text and fuzzy indices from search.text."""
+    from flask import current_app
+    from database import search_index
+    from .index import PrefixIndex, TextIndex
+    from .text import build_fuzzy_indices, build_text_indices
+
+    path = current_app.config.get('SEARCH_INDEX_PATH')
+    if not path:
+        print('SEARCH_INDEX_PATH is not set: the search index will not be built')
+        return
+
+    print('Building search index...')
+    indices = {}
+
+    for engine_class in search_feature_engines:
+        engine = engine_class()
+        if engine.indexable:
+            indices[engine.name] = PrefixIndex(engine.index_entries())
+            print('%s: %s entries indexed' % (engine.pretty_name, len(indices[engine.name])))
+
+    summary_search = SummarySearch()
+    indices[summary_search.name] = TextIndex(summary_search.index_documents())
+
+    indices.update(build_text_indices())
+    indices.update(build_fuzzy_indices())
+
+    search_index.build(path, indices)
@@ -0,0 +1,509 @@
+"""In-memory indices answering search bar look-ups without the database.
+
+The indices are built offline (from the relational database) and saved
+into a single file, which is loaded by each of the workers and reloaded
+when a newer version is written (e.g. after an import of new data).
+"""
+import os
+import pickle
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from collections import defaultdict
+from heapq import nsmallest
+from math import log
+from os.path import abspath
+from os.path import dirname
+from os.path import join
+from time import time
+
+from Levenshtein import distance
+from Levenshtein import ratio
+
+
+# a character greater than any other: key + MAX_CHAR bounds the keys starting with key
+MAX_CHAR = '\U0010ffff'
+
+
+class PrefixIndex:
+    """Sorted array of values of a single feature (e.g. gene symbols or
+    RefSeq ids of isoforms), each pointing to a gene (and an isoform).
+
+    Values starting with a phrase (case-insensitive, as LIKE 'phrase%'
+    in the database) occupy a contiguous range of the array, found with
+    binary search. Matches are scored with the edit distance to the phrase
+    (as in search.gene engines), so the shortest values are the best
+    candidates: for long ranges (e.g. all RefSeq ids starting with 'NM_')
+    the shortest entries are precomputed, so such ranges never need to
+    be walked through during the search.
+    """
+
+    def __init__(self, entries, shortest_count=64, long_range=256):
+        """
+        Args:
+            entries: iterable of (value, gene id, isoform id or None)
+            shortest_count: how many of the shortest entries to keep for long ranges
+            long_range: ranges of more entries than this are considered long
+        """
+        entries = sorted(
+            (
+                (value.lower(), value, gene_id, isoform_id)
+                for value, gene_id, isoform_id in entries
+                if value and gene_id
+            ),
+            key=lambda entry: entry[:3]
+        )
+
+        self.keys = [entry[0] for entry in entries]
+        self.values = [entry[1] for entry in entries]
+        self.genes = [entry[2] for entry in entries]
+        self.isoforms = [entry[3] for entry in entries]
+
+        self.shortest_count = shortest_count
+        self.long_range = long_range
+
+        # positions of entries, by gene, needed to list all matched isoforms
+        self.entries_by_gene = defaultdict(list)
+        for position, isoform_id in enumerate(self.isoforms):
+            if isoform_id is not None:
+                self.entries_by_gene[self.genes[position]].append(position)
+        self.entries_by_gene = dict(self.entries_by_gene)
+
+        self.shortest = {}
+        self._precompute_shortest()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _by_length(self, position):
+        return len(self.values[position]), position
+
+    def _range(self, key, lo=0, hi=None):
+        if hi is None:
+            hi = len(self.keys)
+        start = bisect_left(self.keys, key, lo, hi)
+        end = bisect_left(self.keys, key + MAX_CHAR, start, hi)
+        return start, end
+
+    def _precompute_shortest(self):
+        """Find the shortest entries for each prefix matching a long range.
+
+        A prefix can match a long range only if all its shorter prefixes
+        do, so only long ranges have to be divided further.
+        """
+        keys = self.keys
+        ranges = [(0, len(keys), 0)]
+
+        while ranges:
+            lo, hi, depth = ranges.pop()
+
+            # skip keys equal to the common prefix, they have no next character
+            while lo < hi and len(keys[lo]) <= depth:
+                lo += 1
+
+            while lo < hi:
+                prefix = keys[lo][:depth + 1]
+                start, end = self._range(prefix, lo, hi)
+
+                if end - start > self.long_range:
+                    self.shortest[prefix] = nsmallest(
+                        self.shortest_count, range(start, end),
+                        key=self._by_length
+                    )
+                    ranges.append((start, end, depth + 1))
+
+                lo = end
+
+    def search(self, phrase, limit=None):
+        """Find genes with values starting with given phrase.
+
+        The candidates for common prefixes are restricted to the
+        shortest entries (as long as the limit is not too high).
+
+        Returns:
+            list of (gene id, score, ids of matched isoforms) tuples,
+            best (with the lowest edit distance) first
+        """
+        key = phrase.lower()
+        start, end = self._range(key)
+
+        if start == end:
+            return []
+
+        candidates = None
+
+        if limit and limit <= self.shortest_count and end - start > self.long_range:
+            candidates = self.shortest.get(key)
+
+        if candidates is None:
+            candidates = sorted(range(start, end), key=self._by_length)
+
+        phrase_length = len(phrase)
+        scores = {}
+        worst_accepted = None
+        checked_bound = None
+
+        for position in candidates:
+            value = self.values[position]
+
+            # edit distance is at least the difference of lengths;
+            # once it cannot improve the results, the search is over
+            bound = len(value) - phrase_length
+
+            if limit and len(scores) >= limit:
+                if bound != checked_bound:
+                    worst_accepted = nsmallest(limit, scores.values())[-1]
+                    checked_bound = bound
+                if bound >= worst_accepted:
+                    break
+
+            score = distance(value, phrase)
+            gene_id = self.genes[position]
+
+            if gene_id not in scores or scores[gene_id] > score:
+                scores[gene_id] = score
+
+        best = sorted(scores.items(), key=lambda gene_score: gene_score[1])
+
+        if limit:
+            best = best[:limit]
+
+        return [
+            (gene_id, score, self.matched_isoforms(gene_id, key))
+            for gene_id, score in best
+        ]
+
+    def matched_isoforms(self, gene_id, key):
+        return [
+            self.isoforms[position]
+            for position in self.entries_by_gene.get(gene_id, [])
+            if self.keys[position].startswith(key)
+        ]
+
+
+def words(text):
+    return re.findall(r'\w+', text.lower())
+
+
+class TextIndex:
+    """Inverted index of words of texts, e.g. of protein summaries or disease names.
+
+    All the words of a phrase have to occur in a text for it to match;
+    the last word is treated as a prefix, so the phrases being typed
+    match as well. Matches are ranked with Okapi BM25.
+
+    Texts belong to groups (e.g. summaries of isoforms belong to genes);
+    results are aggregated by group, as the prefix index does with genes.
+    Postings are kept in compact arrays: there might be millions of them.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, documents):
+        """
+        Args:
+            documents: iterable of (document id, group id, text)
+        """
+        self.documents = []
+        self.groups = []
+        self.lengths = array('I')
+
+        postings = defaultdict(lambda: (array('I'), array('H')))
+
+        for document_id, group_id, text in documents:
+            if not text:
+                continue
+
+            position = len(self.documents)
+            text_words = words(text)
+
+            self.documents.append(document_id)
+            self.groups.append(group_id)
+            self.lengths.append(len(text_words))
+
+            for word, count in Counter(text_words).items():
+                positions, counts = postings[word]
+                positions.append(position)
+                counts.append(min(count, 2 ** 16 - 1))
+
+        self.postings = dict(postings)
+        self.vocabulary = sorted(self.postings)
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 1
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _matching_words(self, word, is_prefix):
+        if not is_prefix:
+            return [word] if word in self.postings else []
+
+        start = bisect_left(self.vocabulary, word)
+        end = bisect_left(self.vocabulary, word + MAX_CHAR, start)
+        return self.vocabulary[start:end]
+
+    def _word_scores(self, word, is_prefix):
+        """BM25 scores of documents containing given word (or a word with such prefix)."""
+        scores = {}
+        documents_count = len(self.documents)
+
+        for matched_word in self._matching_words(word, is_prefix):
+            positions, counts = self.postings[matched_word]
+            frequency = len(positions)
+            idf = log(1 + (documents_count - frequency + 0.5) / (frequency + 0.5))
+
+            for position, count in zip(positions, counts):
+                length_norm = 1 - self.b + self.b * self.lengths[position] / self.average_length
+                score = idf * count * (self.k1 + 1) / (count + self.k1 * length_norm)
+
+                # of the words with the same prefix, the best one counts
+                if scores.get(position, 0) < score:
+                    scores[position] = score
+
+        return scores
+
+    def search(self, phrase, limit=None):
+        """Find groups of texts containing all words of given phrase.
+
+        Returns:
+            list of (group id, relevance, ids of matched documents) tuples,
+            the most relevant (with the highest relevance) first
+        """
+        phrase_words = words(phrase)
+
+        if not phrase_words:
+            return []
+
+        scores = None
+
+        for i, word in enumerate(phrase_words):
+            word_scores = self._word_scores(word, is_prefix=i == len(phrase_words) - 1)
+
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {
+                    position: score + word_scores[position]
+                    for position, score in scores.items()
+                    if position in word_scores
+                }
+
+            if not scores:
+                return []
+
+        relevance = {}
+        documents = defaultdict(list)
+
+        # shorter texts first, if equally relevant
+        for position in sorted(scores, key=lambda position: (-scores[position], self.lengths[position])):
+            group_id = self.groups[position]
+            if group_id not in relevance:
+                if limit and len(relevance) == limit:
+                    continue
+                relevance[group_id] = scores[position]
+            documents[group_id].append(self.documents[position])
+
+        return [
+            (group_id, group_relevance, documents[group_id])
+            for group_id, group_relevance in relevance.items()
+        ]
+
+
+def trigrams(text):
+    """Set of (space padded) three-letter fragments of given text."""
+    padded = '  ' + text + ' '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Fuzzy look-up of texts similar to a phrase, e.g. of disease names.
+
+    Texts sharing the most trigrams with the phrase (by Jaccard index)
+    are the candidates; these are re-ranked by Levenshtein ratio of the
+    lowercase text and phrase, as the levenshtein_ratio SQL function did.
+    """
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries: iterable of (id, text)
+        """
+        self.ids = []
+        self.texts = []
+        self.trigrams_counts = array('I')
+
+        postings = defaultdict(lambda: array('I'))
+
+        for entry_id, text in entries:
+            if not text:
+                continue
+            position = len(self.ids)
+            text = text.lower()
+            text_trigrams = trigrams(text)
+
+            self.ids.append(entry_id)
+            self.texts.append(text)
+            self.trigrams_counts.append(len(text_trigrams))
+
+            for trigram in text_trigrams:
+                postings[trigram].append(position)
+
+        self.postings = dict(postings)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, phrase, limit=None, candidates_count=100, allowed_ids=None):
+        """Find texts most similar to given phrase.
+
+        Args:
+            allowed_ids: if given, only the texts of these ids are considered
+
+        Returns:
+            list of (id, Levenshtein ratio) tuples, the most similar first
+        """
+        phrase = phrase.lower()
+        phrase_trigrams = trigrams(phrase)
+
+        shared = Counter()
+        for trigram in phrase_trigrams:
+            shared.update(self.postings.get(trigram, ()))
+
+        if allowed_ids is not None:
+            shared = Counter({
+                position: count
+                for position, count in shared.items()
+                if self.ids[position] in allowed_ids
+            })
+
+        def jaccard(position):
+            common = shared[position]
+            return common / (len(phrase_trigrams) + self.trigrams_counts[position] - common)
+
+        candidates = nsmallest(
+            max(candidates_count, limit or 0), shared,
+            key=lambda position: (-jaccard(position), position)
+        )
+
+        ranked = sorted(
+            (
+                (self.ids[position], ratio(self.texts[position], phrase))
+                for position in candidates
+            ),
+            key=lambda id_and_ratio: -id_and_ratio[1]
+        )
+
+        return ranked[:limit] if limit else ranked
+
+
+def fuzzy_index_name(column):
+    """Name of the fuzzy index of given model attribute (e.g. Disease.name)."""
+    return 'fuzzy:%s.%s' % (column.class_.__name__, column.key)
+
+
+class SearchIndex:
+    """Collection of named indices, saved into (and loaded from) a single file.
+
+    Each worker keeps the indices in memory; a newer version of the file
+    (e.g. rebuilt after an import) is picked up within refresh_interval.
+    """
+
+    version = 1
+    refresh_interval = 60
+
+    def __init__(self, path=None):
+        self.is_open = False
+        self.indices = {}
+        self.path = None
+        if path:
+            self.open(path)
+
+    @staticmethod
+    def _create_path(path):
+        base_dir = abspath(join(dirname(__file__), '..'))
+        path = join(base_dir, path)
+        os.makedirs(dirname(path), exist_ok=True)
+        return path
+
+    def open(self, path):
+        """Load the indices; does nothing if these were not built yet."""
+        self.close()
+        self.path = self._create_path(path)
+        return self._load()
+
+    def _load(self):
+        self.last_check = time()
+
+        try:
+            modification_time = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return False
+
+        with open(self.path, 'rb') as f:
+            version, indices = pickle.load(f)
+
+        if version != self.version:
+            raise ValueError('%s is not a search index (version %s)' % (self.path, self.version))
+
+        self.indices = indices
+        self.modification_time = modification_time
+        self.is_open = True
+        return True
+
+    def close(self):
+        self.path = None
+        self.indices = {}
+        self.modification_time = None
+        self.is_open = False
+
+    def refresh(self):
+        """Reload the indices if the file was rebuilt since they were loaded."""
+        if not self.path or time() - self.last_check < self.refresh_interval:
+            return
+
+        self.last_check = time()
+
+        try:
+            modification_time = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return
+
+        if modification_time != self.modification_time:
+            self._load()
+
+    def build(self, path, indices):
+        """Save given indices (name -> index) and open them."""
+        path = self._create_path(path)
+
+        # write to a temporary file first, so the readers never see a partial index
+        temp_path = path + '.tmp'
+
+        with open(temp_path, 'wb') as f:
+            pickle.dump((self.version, indices), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temp_path, path)
+        self.open(path)
+
+    def __contains__(self, name):
+        self.refresh()
+        return self.is_open and name in self.indices
+
+    def __getitem__(self, name):
+        return self.indices[name]
+
+    def fuzzy_ranking(self, column, phrase, candidates_count=100, allowed_ids=None):
+        """Ids of entities with values of column the most similar to the phrase
+        (best first; of allowed_ids only, if given), or None if there is no
+        fuzzy index of the column."""
+        name = fuzzy_index_name(column)
+
+        if name not in self:
+            return None
+
+        return [
+            entity_id
+            for entity_id, similarity in self[name].search(
+                phrase, candidates_count=candidates_count, allowed_ids=allowed_ids
+            )
+        ]
@@ -0,0 +1,104 @@
+"""Full-text look-ups of pathways, diseases and cancers.
+
+The in-memory inverted indices (see search.index.TextIndex) are used
+if built; otherwise the callers fall back to LIKE queries.
+"""
+from collections import OrderedDict
+
+from database import db, search_index
+from models import Cancer, Disease, Pathway
+
+
+# index name: function returning (document id, group id, text) tuples
+text_sources = OrderedDict([
+    (
+        'pathway_description',
+        lambda: db.session.query(Pathway.id, Pathway.id, Pathway.description)
+    ),
+    (
+        'disease_name',
+        lambda: db.session.query(Disease.id, Disease.id, Disease.name)
+    ),
+    (
+        # cancers are looked up by codes too
+        'cancer_name',
+        lambda: (
+            (cancer_id, cancer_id, name + ' ' + code)
+            for cancer_id, name, code in db.session.query(Cancer.id, Cancer.name, Cancer.code)
+        )
+    )
+])
+
+
+# columns ranked in-process by levenshtein_sorted (gene symbols and
+# names are ranked by edit distance in the prefix index already)
+fuzzy_columns = [Pathway.description, Disease.name, Cancer.name]
+
+
+def build_text_indices():
+    from .index import TextIndex
+    return OrderedDict(
+        (name, TextIndex(source()))
+        for name, source in text_sources.items()
+    )
+
+
+def build_fuzzy_indices():
+    from .index import TrigramIndex, fuzzy_index_name
+    return OrderedDict(
+        (
+            fuzzy_index_name(column),
+            TrigramIndex(db.session.query(column.class_.id, column))
+        )
+        for column in fuzzy_columns
+    )
+
+
+def matching_ids(index_name, phrase, limit=None):
+    """Ids of entities with texts matching given phrase, most relevant first.
+
+    Returns None if the index was not built.
+    """
+    if index_name not in search_index:
+        return None
+
+    return [
+        group_id
+        for group_id, relevance, documents in search_index[index_name].search(phrase, limit)
+    ]
+
+
+def text_filter(index_name, id_column, phrase, fallback, max_ids=500):
+    """SQL filter selecting entities matching the phrase (by ids from the index),
+    or the fallback filter if the index was not built.
+
+    The fallback is used also if more than max_ids entities match: listing
+    all of these in the query would exceed the limit of bound variables.
+    """
+    ids = matching_ids(index_name, phrase, max_ids + 1)
+
+    if ids is None or len(ids) > max_ids:
+        return fallback
+
+    return id_column.in_(ids)
+
+
+def search_text(index_name, model, phrase, limit=None):
+    """Find instances of model matching the phrase, most relevant first.
+
+    Returns None if the index was not built.
+    """
+    ids = matching_ids(index_name, phrase, limit)
+
+    if ids is None:
+        return None
+
+    if not ids:
+        return []
+
+    by_id = {
+        instance.id: instance
+        for instance in model.query.filter(model.id.in_(ids))
+    }
+
+    return [by_id[i] for i in ids if i in by_id]
@@ -0,0 +1,230 @@
+import mmap
+import os
+import struct
+from os.path import abspath
+from os.path import dirname
+from os.path import join
+from time import time
+
+
+class SequenceStoreNotOpened(Exception):
+    pass
+
+
+def disorder_intervals(disorder_map):
+    """Transform binary disorder data into list of (start, length) spans.
+
+    The starts are 1-based, as in Protein.disorder_regions.
+    """
+    intervals = []
+    start = None
+
+    for i, residue in enumerate(disorder_map):
+        if residue == '1':
+            if start is None:
+                start = i
+        elif start is not None:
+            intervals.append((start + 1, i - start))
+            start = None
+
+    if start is not None:
+        intervals.append((start + 1, len(disorder_map) - start))
+
+    return intervals
+
+
+class SequenceStore:
+    """Read-only, memory-mapped store of protein sequences and disorder data.
+
+    All sequences are kept in a single file, as one contiguous ASCII buffer;
+    disorder maps are stored as run-length intervals (pairs of 1-based start
+    and length). Both are located with an index of offsets by protein id:
+
+        header: magic (4 bytes), version, number of index slots
+        index: (sequence offset, sequence length,
+                disorder offset, disorder intervals count) per protein id
+        disorder intervals: 32-bit unsigned integers
+        sequences: bytes
+
+    Thanks to mmap, only the pages which are actually read are loaded,
+    so there is no need to fetch the whole sequence to get a residue.
+    The store is written from scratch with build() and is not updated
+    when sequences change in the relational database; a newer version
+    of the file (e.g. rebuilt after an import) is picked up by the other
+    workers within refresh_interval.
+    """
+
+    magic = b'ADSS'
+    version = 1
+    refresh_interval = 60
+
+    header_format = '<4sIQ'
+    slot_format = '<QQQQ'
+    interval_item_size = struct.calcsize('<I')
+
+    def __init__(self, path=None):
+        self.is_open = False
+        self.path = None
+        self.modification_time = None
+        if path:
+            self.open(path)
+
+    @staticmethod
+    def _create_path(path):
+        base_dir = abspath(dirname(__file__))
+        path = join(base_dir, path)
+        os.makedirs(dirname(path), exist_ok=True)
+        return path
+
+    def open(self, path):
+        """Open an existing store; does nothing if the store was not built yet."""
+        self.close()
+        self.path = self._create_path(path)
+        return self._load()
+
+    def _load(self):
+        self.last_check = time()
+
+        try:
+            modification_time = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return False
+
+        if not os.path.getsize(self.path):
+            return False
+
+        if self.is_open:
+            self.buffer.close()
+            self.is_open = False
+
+        with open(self.path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.slots_count = struct.unpack_from(self.header_format, self.buffer)
+
+        if magic != self.magic or version != self.version:
+            self.buffer.close()
+            raise ValueError('%s is not a sequence store (version %s)' % (self.path, self.version))
+
+        self.index_start = struct.calcsize(self.header_format)
+        self.modification_time = modification_time
+        self.is_open = True
+        return True
+
+    def close(self):
+        if self.is_open:
+            self.buffer.close()
+        self.path = None
+        self.modification_time = None
+        self.is_open = False
+
+    def refresh(self):
+        """Reopen the store if the file was rebuilt since it was opened."""
+        if not self.path or time() - self.last_check < self.refresh_interval:
+            return
+
+        self.last_check = time()
+
+        try:
+            modification_time = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return
+
+        if modification_time != self.modification_time:
+            self._load()
+
+    def build(self, path, entries):
+        """Write a new store and open it.
+
+        Args:
+            path: where the store should be saved
+            entries: iterable of (protein id, sequence, disorder map) tuples
+        """
+        path = self._create_path(path)
+        slots = {}
+        intervals = []
+        sequences = []
+        sequences_length = 0
+
+        for protein_id, sequence, disorder_map in entries:
+            sequence = (sequence or '').encode('ascii')
+            disorder = disorder_intervals(disorder_map or '')
+
+            slots[protein_id] = (sequences_length, len(sequence), len(intervals), len(disorder))
+
+            for start, length in disorder:
+                intervals.extend((start, length))
+
+            sequences.append(sequence)
+            sequences_length += len(sequence)
+
+        slots_count = max(slots) + 1 if slots else 0
+        slot_size = struct.calcsize(self.slot_format)
+
+        intervals_start = struct.calcsize(self.header_format) + slots_count * slot_size
+        sequences_start = intervals_start + len(intervals) * self.interval_item_size
+
+        index = bytearray(slots_count * slot_size)
+
+        for protein_id, (seq_offset, seq_length, disorder_offset, disorder_count) in slots.items():
+            struct.pack_into(
+                self.slot_format, index, protein_id * slot_size,
+                sequences_start + seq_offset, seq_length,
+                intervals_start + disorder_offset * self.interval_item_size, disorder_count
+            )
+
+        # write to a temporary file first, so the readers never see a partial store
+        temp_path = path + '.tmp'
+
+        with open(temp_path, 'wb') as f:
+            f.write(struct.pack(self.header_format, self.magic, self.version, slots_count))
+            f.write(index)
+            f.write(struct.pack('<%dI' % len(intervals), *intervals))
+            for sequence in sequences:
+                f.write(sequence)
+
+        self.close()
+        os.replace(temp_path, path)
+        self.open(path)
+
+    def _slot(self, protein_id):
+        if not self.is_open:
+            raise SequenceStoreNotOpened
+        if protein_id is None or not 0 <= protein_id < self.slots_count:
+            return None
+        slot = struct.unpack_from(
+            self.slot_format, self.buffer,
+            self.index_start + protein_id * struct.calcsize(self.slot_format)
+        )
+        # sequences offsets are absolute, so 0 denotes an empty slot
+        if not slot[0]:
+            return None
+        return slot
+
+    def __contains__(self, protein_id):
+        self.refresh()
+        return self.is_open and self._slot(protein_id) is not None
+
+    def length(self, protein_id):
+        """Length of stored sequence, including the stop (*) character if any."""
+        return self._slot(protein_id)[1]
+
+    def fragment(self, protein_id, start, end=None):
+        """Fragment of the sequence; start and end follow the semantics of slicing."""
+        offset, length, _, _ = self._slot(protein_id)
+        start, end, _ = slice(start, end).indices(length)
+        if start >= end:
+            return ''
+        return self.buffer[offset + start:offset + end].decode('ascii')
+
+    def sequence(self, protein_id):
+        return self.fragment(protein_id, 0)
+
+    def disorder_regions(self, protein_id):
+        """Disorder regions as a list of (1-based start, length) spans."""
+        _, _, offset, count = self._slot(protein_id)
+        values = struct.unpack_from('<%dI' % (count * 2), self.buffer, offset)
+        return [
+            [values[i], values[i + 1]]
+            for i in range(0, len(values), 2)
+        ]
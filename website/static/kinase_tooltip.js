@@ -15,21 +15,64 @@ function get_protein_details_url(refseq)
     return href
 }
 
+function get_proteins_details_url(refseqs)
+{
+    var params = get_url_params()
+    params.refseqs = refseqs.sort().join(',')
+
+    return '/protein/details_batch?' + $.param(params)
+}
+
 function initializeKinaseTooltips(selection)
 {
+    if(!selection)
+        selection = d3.selectAll('.kinase')
+
+    // details of all kinases from the selection are fetched
+    // with a single request, on the first use of any tooltip
+    var details_request = null
+
+    function get_details(refseq)
+    {
+        if(!details_request)
+        {
+            var refseqs = []
+            selection.each(function() {
+                var kinase_refseq = $(this).data('refseq')
+                if(kinase_refseq && refseqs.indexOf(kinase_refseq) === -1)
+                    refseqs.push(kinase_refseq)
+            })
+            details_request = $.ajax({
+                url: get_proteins_details_url(refseqs)
+            })
+        }
+        function fetch_single()
+        {
+            return $.ajax({url: get_protein_details_url(refseq)})
+        }
+
+        // fall back to the details of the single kinase
+        // if it is missing or the batched request failed
+        return details_request.then(
+            function(details) {
+                if(refseq in details)
+                    return details[refseq]
+                return fetch_single()
+            },
+            fetch_single
+        )
+    }
+
     var kinase_tooltip = Tooltip()
     kinase_tooltip.init({
         id: 'kinase',
         preprocess_data: function (d, render_template_cb) {
             var context = this
-            $.ajax({
-                url: get_protein_details_url(
-                    $(this).data('refseq')
-                ),
-                success: function (data) {
+            get_details($(this).data('refseq')).done(
+                function (data) {
                     render_template_cb.call(context, data)
                 }
-            })
+            )
         },
         template: function (kinase) {
             return nunjucks.render(
@@ -41,8 +84,6 @@ function initializeKinaseTooltips(selection)
             )
         }
     })
-    if(!selection)
-        selection = d3.selectAll('.kinase')
     selection
         .call(kinase_tooltip.bind)
 
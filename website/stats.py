@@ -7,11 +7,11 @@ from statistics import median
 from database import db, get_or_create, join_unique
 from database import fast_count
 import models
-from sqlalchemy import and_, distinct, func, literal_column, case
+from sqlalchemy import and_, distinct, func
 from sqlalchemy import or_
 from flask import current_app
 from models import Count, Site, Protein, Gene, are_details_managed, The1000GenomesMutation
-from models import Mutation, InheritedMutation, MC3Mutation
+from models import Mutation, InheritedMutation, MC3Mutation, MutationSiteImpact
 from tqdm import tqdm
 
 counters = {}
@@ -127,21 +127,10 @@ class Statistics(CountStore):
 
     @staticmethod
     def get_filter_by_sources(sources):
-
-        filters = and_(
-            (
-                (
-                    Mutation.get_relationship(source).any()
-                    if are_details_managed(source) else
-                    Mutation.get_relationship(source).has()
-                )
-                for source in sources
-
-            )
+        return Mutation.sources_mask_filter(
+            [source.name for source in sources]
         )
 
-        return filters
-
     def count_by_source(self, sources):
         return Mutation.query.filter(
             self.get_filter_by_sources(sources)
@@ -292,32 +281,14 @@ class Statistics(CountStore):
 
 
 def count_mutated_sites(site_type, model=None):
-    filters = [
-        Mutation.protein_id == Protein.id,
-        Site.protein_id == Protein.id,
-        Mutation.precomputed_is_ptm
-    ]
+    filters = []
     if site_type:
-        filters.append(Site.type.like('%' + site_type + '%'))
+        filters.append(Site.type.contains(site_type))
     query = (
-        db.session.query(
-            func.count(distinct(case(
-                [
-                    (
-                        (
-                            Mutation.position.between(
-                                Site.position - 7,
-                                Site.position + 7
-                            )
-                        ),
-                        Site.id
-                    )
-                ],
-                else_=literal_column('NULL')
-            )))
-        )
+        db.session.query(func.count(distinct(Site.id)))
+        .join(MutationSiteImpact, MutationSiteImpact.site_id == Site.id)
+        .join(Mutation, Mutation.id == MutationSiteImpact.mutation_id)
         .filter(and_(*filters))
-        .join(Mutation, Site.protein_id == Mutation.protein_id)
     )
     if model:
         query = query.filter(Statistics.get_filter_by_sources([model]))
@@ -504,8 +475,10 @@ def sites_counts():
     site_types = ['']  # empty will match all sites
     site_types.extend(Site.types)
     for site_type in site_types:
-        count = Site.query.filter(Site.type.like('%' + site_type + '%')).count()
-        counts[site_type] = count
+        query = Site.query
+        if site_type:
+            query = query.filter(Site.type.contains(site_type))
+        counts[site_type] = query.count()
     return {'PTM sites': counts}
 
 
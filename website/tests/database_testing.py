@@ -1,8 +1,12 @@
+from shutil import rmtree
+from tempfile import mkdtemp
+
 from flask_testing import TestCase
 from app import create_app, scheduler
 from database import db
 from database import bdb
 from database import bdb_refseq
+from database import sequence_store
 from models import User
 
 
@@ -20,6 +24,17 @@ class DatabaseTest(TestCase):
     SQL_LEVENSTHEIN = False
     USE_LEVENSTHEIN_MYSQL_UDF = False
 
+    # look up suggestions sequentially: threads would share the connection
+    # to the in-memory database (see test_concurrent_suggestions instead)
+    AUTOCOMPLETE_WORKERS = 0
+
+    # each test starts with a new database (and the data release 0),
+    # so the responses would be served across the tests
+    RESPONSE_CACHE_ENABLED = False
+
+    # search the database directly (TestIndexedSearch builds its own index)
+    SEARCH_INDEX_PATH = None
+
     SECRET_KEY = 'test_key'
 
     @property
@@ -54,6 +69,9 @@ class DatabaseTest(TestCase):
         return result
 
     def create_app(self):
+        # the sequence store is rebuilt by importers; never touch the real one
+        self.sequence_store_dir = mkdtemp()
+        self.SEQUENCE_STORE_PATH = self.sequence_store_dir + '/sequences.store'
         app = create_app(config_override=self.config)
         self.app = app
         return app
@@ -96,4 +114,6 @@ class DatabaseTest(TestCase):
         db.drop_all()
         bdb.drop()
         bdb_refseq.drop()
+        sequence_store.close()
+        rmtree(self.sequence_store_dir, ignore_errors=True)
         scheduler.shutdown()
@@ -1,3 +1,5 @@
+import os
+
 import pytest
 import helpers.filters as filters
 
@@ -232,3 +234,195 @@ def test_update_request():
 
         assert manager.get_value('Model.shape') == 'rectangle:or:circle'
         assert manager.url_string() == 'Model.shape:eq:rectangle:or:circle'
+
+
+def test_parsed_states_cache():
+    filters.FilterManager.clear_parsed_states()
+
+    def create_scoped_manager(shapes):
+        return filters.FilterManager(
+            [
+                filters.Filter(
+                    Model, 'color', comparators=['eq'],
+                    default='red'
+                ),
+                filters.Filter(
+                    Model, 'shape', comparators=['in'],
+                    choices=shapes, multiple='any'
+                )
+            ],
+            state_scope=tuple(shapes)
+        )
+
+    request = FakeRequest({'filters': 'Model.shape:in:circle,square;Model.size:eq:big'})
+
+    manager = create_scoped_manager(['circle', 'triangle'])
+    skipped, rejected = manager.update_from_request(request, raise_on_forbidden=False)
+
+    assert manager.get_value('Model.shape') == ['circle']
+    assert [update.id for update in skipped] == ['Model.size']
+    assert rejected == {'Model.shape': ['square']}
+    assert len(filters.FilterManager.parsed_states) == 1
+
+    # the cached state is re-used by the following managers
+    manager = create_scoped_manager(['circle', 'triangle'])
+    skipped, rejected = manager.update_from_request(request, raise_on_forbidden=False)
+
+    assert manager.get_value('Model.shape') == ['circle']
+    assert manager.url_string() == 'Model.shape:in:circle'
+    assert [update.id for update in skipped] == ['Model.size']
+    assert rejected == {'Model.shape': ['square']}
+    assert len(filters.FilterManager.parsed_states) == 1
+
+    # but does not leak to managers with different choices
+    manager = create_scoped_manager(['circle', 'square'])
+    skipped, rejected = manager.update_from_request(request, raise_on_forbidden=False)
+
+    assert manager.get_value('Model.shape') == ['circle', 'square']
+    assert not rejected
+    assert len(filters.FilterManager.parsed_states) == 2
+
+    # and values are never shared between managers
+    manager.filters['Model.shape'].value.append('triangle')
+    manager = create_scoped_manager(['circle', 'square'])
+    manager.update_from_request(request, raise_on_forbidden=False)
+    assert manager.get_value('Model.shape') == ['circle', 'square']
+
+    # managers without scope do not use the cache
+    manager = create_manager()
+    manager.update_from_request(FakeRequest({'filters': 'Model.shape:eq:rectangle'}))
+    assert manager.url_string() == 'Model.shape:eq:rectangle'
+    assert len(filters.FilterManager.parsed_states) == 2
+
+    filters.FilterManager.clear_parsed_states()
+    assert not filters.FilterManager.parsed_states
+
+
+def legacy_apply(manager, elements):
+    """Reference implementation: a chain of generators, one per filter,
+    probing the comparator with each of the tested values."""
+    for filter_ in manager._get_non_trivial_active(type(elements[0])):
+        attr_get = filter_.attr_getter()
+        compare = filter_.get_compare_func(
+            filter_.possible_comparators[filter_.comparator],
+            filter_.get_multiple_function()
+        )
+        elements = [elem for elem in elements if compare(attr_get(elem))]
+    return elements
+
+
+class Mutation:
+
+    def __init__(self, position, impact, cancers, frequency):
+        self.position = position
+        self.impact = impact
+        self.cancers = cancers
+        self.frequency = frequency
+
+
+def create_mutations(count):
+    impacts = ['direct', 'network-rewiring', 'proximal', 'distal', 'none']
+    cancers = ['BRCA', 'COAD', 'KIRC', 'LUAD', 'OV']
+    return [
+        Mutation(
+            position=i % 700,
+            impact=impacts[i % 5],
+            cancers=[cancers[i % 5], cancers[i % 3]],
+            # missing values should be let through, as before
+            frequency=None if i % 11 == 0 else (i % 100) / 100
+        )
+        for i in range(count)
+    ]
+
+
+def create_mutations_manager():
+    return filters.FilterManager(
+        [
+            filters.Filter(
+                Mutation, 'impact', comparators=['in'],
+                choices=['direct', 'network-rewiring', 'proximal', 'distal', 'none'],
+                default=['direct', 'network-rewiring', 'proximal', 'distal'],
+                multiple='any'
+            ),
+            filters.Filter(
+                Mutation, 'cancers', comparators=['in'],
+                multiple='any'
+            ),
+            filters.Filter(
+                Mutation, 'frequency', comparators=['ge', 'lt']
+            ),
+        ]
+    )
+
+
+def test_compiled_filters():
+    mutations = create_mutations(1000)
+    manager = create_mutations_manager()
+
+    states = [
+        {},
+        {'Mutation.impact': (['direct'], None)},
+        {'Mutation.cancers': (['BRCA', 'OV'], None)},
+        {'Mutation.frequency': (0.5, 'ge')},
+        {'Mutation.frequency': (0.5, 'lt'), 'Mutation.cancers': ('KIRC', None)},
+    ]
+
+    for state in states:
+        manager.reset()
+        for filter_id, (value, comparator) in state.items():
+            manager.filters[filter_id].update(value, comparator)
+
+        assert manager.apply(mutations) == legacy_apply(manager, mutations)
+
+    # direct modifications of values have to invalidate compiled predicates
+    manager.reset()
+    assert len(manager.apply(mutations)) == 800
+    manager.filters['Mutation.impact']._value = ['none']
+    assert len(manager.apply(mutations)) == 200
+
+    # elements can be accessed with an itemgetter
+    pairs = [(mutation, None) for mutation in mutations]
+    assert manager.apply(pairs, itemgetter=lambda pair: pair[0]) == [
+        (mutation, None) for mutation in manager.apply(mutations)
+    ]
+
+
+def test_compiled_filters_per_mutation():
+    mutations = create_mutations(1000)
+    manager = create_mutations_manager()
+    manager.filters['Mutation.cancers'].update(['BRCA', 'COAD'])
+    manager.filters['Mutation.frequency'].update(0.2, 'ge')
+
+    # representations apply the filters to each mutation separately
+    legacy = [legacy_apply(manager, [mutation]) for mutation in mutations]
+    compiled = [manager.apply([mutation]) for mutation in mutations]
+
+    assert compiled == legacy
+
+
+@pytest.mark.skipif(
+    not os.environ.get('BENCHMARK'),
+    reason='benchmark; run with BENCHMARK=1 (and -s to see the timings)'
+)
+def test_compiled_filters_benchmark():
+    from time import perf_counter
+
+    mutations = create_mutations(10000)
+    manager = create_mutations_manager()
+    manager.filters['Mutation.cancers'].update(['BRCA', 'COAD'])
+    manager.filters['Mutation.frequency'].update(0.2, 'ge')
+
+    start = perf_counter()
+    legacy = [legacy_apply(manager, [mutation]) for mutation in mutations]
+    legacy_time = perf_counter() - start
+
+    start = perf_counter()
+    compiled = [manager.apply([mutation]) for mutation in mutations]
+    compiled_time = perf_counter() - start
+
+    assert compiled == legacy
+
+    print(
+        'Filtering 10k mutations one by one: %.3fs (chained), %.3fs (compiled)'
+        % (legacy_time, compiled_time)
+    )
@@ -1,5 +1,5 @@
 import pytest
-from io import StringIO
+from io import BytesIO, StringIO
 from helpers import parsers
 
 
@@ -50,4 +50,40 @@ def test_parse_tsv_file(tmpdir):
         file_name,
         parse,
         file_header=['gene', 'id', 'some column with spaces']
-    )
\ No newline at end of file
+    )
+
+
+def test_uploaded_vcf(tmpdir):
+    import gzip
+    import pickle
+    from werkzeug.datastructures import FileStorage
+
+    content = b'#header\n1 10 . A T\n1 20 . G C\n1 30 . G A\n\n1 40 . C T\n'
+    lines = content.splitlines(keepends=True)
+
+    for data in [content, gzip.compress(content)]:
+        uploaded = parsers.UploadedVCF.save(
+            FileStorage(BytesIO(data), 'test.vcf'),
+            str(tmpdir.join('uploads'))
+        )
+
+        assert uploaded
+        assert list(uploaded) == lines
+        assert len(uploaded) == 6
+
+        # only the path is passed around
+        assert list(pickle.loads(pickle.dumps(uploaded))) == lines
+
+        # lines after the first empty line are skipped
+        chunks = uploaded.split(2)
+        assert [list(chunk) for chunk in chunks] == [lines[:2], lines[2:4]]
+        assert [len(chunk) for chunk in chunks] == [2, 2]
+
+        for vcf_file in chunks + [uploaded]:
+            vcf_file.remove()
+        assert not tmpdir.join('uploads').listdir()
+        assert not uploaded
+
+    empty = parsers.UploadedVCF.save(FileStorage(BytesIO(b''), 'empty.vcf'), str(tmpdir))
+    assert not empty
+    assert empty.split(2) == []
@@ -0,0 +1,54 @@
+from helpers.progress import ProgressReporter, print_publisher
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_reporter():
+    clock = Clock()
+    published = []
+
+    reporter = ProgressReporter(1000, published.append, every=100, interval=1, clock=clock)
+
+    # published every 100 items
+    for i in range(250):
+        reporter.update()
+    assert [state['done'] for state in published] == [100, 200]
+
+    # or after a second has passed
+    clock.now = 2
+    reporter.update()
+    assert published[-1]['done'] == 251
+
+    state = published[-1]
+    assert state['progress'] == 0.251
+    assert state['rate'] == 125.5
+    assert round(state['eta']) == 6
+
+    # always when finished
+    clock.now = 2.5
+    reporter.update(749)
+    assert published[-1]['progress'] == 1
+    assert published[-1]['eta'] == 0
+
+
+def test_track(capsys):
+    clock = Clock()
+    reporter = ProgressReporter(
+        None, print_publisher('Importing', 'genes'),
+        every=2, interval=10, clock=clock
+    )
+
+    clock.now = 1
+    assert list(reporter.track('abcde')) == list('abcde')
+    assert reporter.done == 5
+
+    # total is unknown: no ETA nor progress
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == ['Importing: 2 genes, 2.00 genes/s', 'Importing: 4 genes, 4.00 genes/s']
@@ -0,0 +1,78 @@
+from helpers.site_index import SiteIndex
+
+
+class Site:
+
+    def __init__(self, position, type='phosphorylation', id=None):
+        self.position = position
+        self.type = type
+        self.id = id
+
+
+def test_impact():
+    index = SiteIndex([Site(50), Site(1)])
+
+    expected_impacts = {
+        10: 'none',
+        9: 'none',
+        8: 'distal',
+        4: 'distal',
+        3: 'proximal',
+        2: 'proximal',
+        1: 'direct',
+        0: 'proximal',
+        43: 'distal',
+        42: 'none',
+    }
+
+    for position, impact in expected_impacts.items():
+        assert index.impact(position) == impact
+
+    positions = list(expected_impacts.keys())
+    assert index.classify(positions) == [expected_impacts[pos] for pos in positions]
+
+    empty_index = SiteIndex([])
+    assert empty_index.impact(1) == 'none'
+    assert empty_index.classify([1, 2]) == ['none', 'none']
+
+
+def test_sites_lookup():
+    sites = [Site(x) for x in (57, 10, 15, 14)]
+    index = SiteIndex(sites)
+
+    assert list(index.positions) == [10, 14, 15, 57]
+
+    expected_closest_sites = {0: 0, 5: 1, 12: 2, 57: 1}
+    expected_affected_sites = {0: 0, 5: 1, 12: 3, 57: 1}
+
+    for position, expected_sites_cnt in expected_closest_sites.items():
+        assert len(index.closest_sites(position)) == expected_sites_cnt
+
+    for position, expected_sites_cnt in expected_affected_sites.items():
+        assert len(index.affected_sites(position)) == expected_sites_cnt
+
+    assert index.has_sites_in_range(15, 20)
+    assert not index.has_sites_in_range(16, 56)
+
+    assert index.is_close(8, 2, 0)
+    assert not index.is_close(8, 0, 2)
+
+    assert sites[0] in index
+    assert Site(57) not in index
+
+
+def test_of_type():
+    index = SiteIndex([
+        Site(10, 'phosphorylation'),
+        Site(20, 'acetylation,methylation'),
+        Site(30, 'methylation'),
+    ])
+
+    methylation = index.of_type('methylation')
+    assert list(methylation.positions) == [20, 30]
+    assert methylation.impact(11) == 'none'
+    assert index.impact(11) == 'proximal'
+
+    # the restricted indices are memoized
+    assert index.of_type('methylation') is methylation
+    assert index.of_type(None) is index
@@ -1,4 +1,5 @@
 import gzip
+from contextlib import contextmanager
 from tempfile import NamedTemporaryFile
 
 import pytest
@@ -40,3 +41,25 @@ def make_named_gz_file(data=None, **kwargs):
 
 
 use_fixture = pytest.fixture(autouse=True)
+
+
+class QueriesCounter:
+    count = 0
+
+
+@contextmanager
+def count_queries():
+    """Count SQL queries executed (in any database) within the context."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    counter = QueriesCounter()
+
+    def before_cursor_execute(*args, **kwargs):
+        counter.count += 1
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,262 @@
+import os
+
+from database import db
+from database_testing import DatabaseTest
+from models import Gene, Protein, ProteinReferences, UniprotEntry
+from search.index import PrefixIndex, SearchIndex, TextIndex, TrigramIndex
+from tests.miscellaneous import mock_proteins_and_genes
+
+
+def test_prefix_index():
+    index = PrefixIndex(
+        [
+            ('TP53', 1, None),
+            ('TP53BP1', 2, None),
+            ('TP63', 3, None),
+            ('TP73', 4, None),
+            ('tp5', 5, None),
+            ('BRCA1', 6, None),
+            (None, 7, None),
+        ]
+    )
+
+    assert len(index) == 6
+
+    # case insensitive, best (shortest) matches first
+    assert [gene for gene, score, isoforms in index.search('tp5')] == [5, 1, 2]
+    assert index.search('TP53')[0] == (1, 0, [])
+    assert index.search('TP53', limit=1) == [(1, 0, [])]
+    assert not index.search('TP9')
+    assert not index.search('P53')
+
+
+def test_long_ranges():
+    refseqs = [('NM_%06d' % i, i // 3, i) for i in range(1, 2000)]
+    refseqs.append(('NM_1', 5000, 5000))
+
+    index = PrefixIndex(refseqs, shortest_count=10, long_range=50)
+
+    assert 'nm_' in index.shortest
+    assert 'nm_00' in index.shortest
+    assert 'nm_00199' not in index.shortest
+
+    results = index.search('NM_', limit=3)
+    assert results[0] == (5000, 1, [5000])
+    assert len(results) == 3
+
+    # all the isoforms matched should be listed, not only the best one
+    gene, score, isoforms = index.search('NM_00001', limit=1)[0]
+    assert gene == 3 and sorted(isoforms) == [10, 11]
+
+    # without limit everything is returned
+    assert len(index.search('NM_0019')) == len({i // 3 for i in range(1900, 2000)})
+
+
+def test_text_index():
+    index = TextIndex(
+        [
+            (1, 10, 'This protein is a kinase, phosphorylating other proteins'),
+            (2, 10, 'Kinase'),
+            (3, 30, 'Receptor tyrosine kinase'),
+            (4, 40, 'Tumour suppressor'),
+            (5, 50, None),
+        ]
+    )
+
+    assert len(index) == 4
+
+    # case insensitive, grouped; the best (shortest) match first
+    assert index.search('KINASE') == [
+        (10, index.search('kinase')[0][1], [2, 1]),
+        (30, index.search('kinase')[1][1], [3]),
+    ]
+    assert [group for group, relevance, documents in index.search('kinase', limit=1)] == [10]
+
+    # all words have to match, the last one is a prefix
+    assert [group for group, relevance, documents in index.search('tyrosine kin')] == [30]
+    assert [group for group, relevance, documents in index.search('tum')] == [40]
+    assert not index.search('tyro kinase')
+    assert not index.search('suppressor kinase')
+    assert not index.search(' , ')
+
+    # the last word matches longer words too
+    assert index.search('protein')[0][2] == [1]
+
+
+def test_trigram_index():
+    index = TrigramIndex(
+        [
+            (1, 'Breast cancer'),
+            (2, 'Breast cancer, familial'),
+            (3, 'Cataract'),
+            (4, 'Lung cancer'),
+            (5, ''),
+        ]
+    )
+
+    assert len(index) == 4
+
+    # typos are tolerated
+    assert index.search('brest cancer')[0][0] == 1
+    assert index.search('katarakt', limit=1)[0][0] == 3
+
+    # the closest (by Levenshtein ratio) first
+    ranked = [entry_id for entry_id, similarity in index.search('cancer')]
+    assert ranked[:2] == [4, 1]
+
+    # only the candidates sharing the most trigrams are re-ranked
+    assert len(index.search('cancer', candidates_count=2)) == 2
+
+    # the candidates may be restricted (e.g. to the entities matching a query)
+    assert [entry_id for entry_id, similarity in index.search('cancer', allowed_ids={1, 3})][0] == 1
+    assert [entry_id for entry_id, similarity in index.search('cancer', candidates_count=1, allowed_ids={1})] == [1]
+    assert not index.search('cancer', allowed_ids=set())
+
+
+def test_search_index(tmpdir):
+    path = str(tmpdir.join('search.index'))
+
+    search_index = SearchIndex(path)
+    assert not search_index.is_open
+    assert 'gene_symbol' not in search_index
+
+    search_index.build(path, {'gene_symbol': PrefixIndex([('TP53', 1, None)])})
+    assert 'gene_symbol' in search_index
+
+    reopened = SearchIndex(path)
+    assert reopened['gene_symbol'].search('TP')[0][0] == 1
+
+    # a rebuilt index is reloaded by other processes
+    search_index.build(path, {'gene_symbol': PrefixIndex([('TP63', 2, None)])})
+    # (make sure that the modification time differs)
+    os.utime(path, (1, 1))
+    reopened.last_check = 0
+    assert reopened['gene_symbol'].search('TP') != [(2, 2, [])]
+    assert 'gene_symbol' in reopened
+    assert reopened['gene_symbol'].search('TP') == [(2, 2, [])]
+
+
+class TestIndexedSearch(DatabaseTest):
+
+    SEARCH_INDEX_PATH = '.test_databases/search.index'
+
+    def test_search_proteins(self):
+        from search.gene import rebuild_search_index
+        from views.search import search_proteins, search_bar_search_engines
+        from database import search_index
+
+        mock_proteins_and_genes(15)
+
+        uniprot = UniprotEntry(accession='P04637')
+        references = ProteinReferences(uniprot_entries=[uniprot])
+        protein = Protein(refseq='NM_000546', external_references=references)
+        gene = Gene(name='TP53', isoforms=[protein], preferred_isoform=protein)
+        db.session.add_all([gene, references, protein, uniprot])
+        db.session.commit()
+
+        queries = ['Gene', 'gene_1', 'NM_0001', '0003', 'Full name of gene 1', 'P0463', 'TP', 'nothing']
+
+        def search_all():
+            return {
+                query: [
+                    (
+                        match.gene.name,
+                        match.best_score,
+                        sorted(isoform.refseq for isoform in match.matched_isoforms)
+                    )
+                    for match in search_proteins(query, 20, engines=search_bar_search_engines)
+                ]
+                for query in queries
+            }
+
+        search_index.close()
+        from_database = search_all()
+
+        rebuild_search_index()
+        assert search_index.is_open
+        from_index = search_all()
+
+        for query in queries:
+            assert sorted(from_index[query]) == sorted(from_database[query])
+        assert from_index['Gene'][0][0].startswith('Gene_')
+        assert from_index['P0463'][0][0] == 'TP53'
+        assert not from_index['nothing']
+
+    def test_text_search(self):
+        from search.gene import rebuild_search_index, SummarySearch
+        from search.text import search_text, text_filter
+        from models import Disease, Pathway
+
+        mock_proteins_and_genes(2)
+        protein = Protein.query.filter_by(refseq='NM_0001').one()
+        protein.summary = 'This is an important protein for the FooBar pathway'
+
+        db.session.add_all([
+            Disease(name='Breast cancer'),
+            Disease(name='Cancer of breast, familial'),
+            Disease(name='Cataract'),
+            Pathway(description='Positive regulation of kinase activity'),
+        ])
+        db.session.commit()
+
+        rebuild_search_index()
+
+        search = SummarySearch().search
+
+        for accepted in ['FooBar', 'foobar', 'foobar pathway', 'important prot']:
+            results = search(accepted)
+            assert len(results) == 1
+            assert results[0].name == 'Gene_1'
+            assert [isoform.refseq for isoform in results[0].matched_isoforms] == ['NM_0001']
+
+        assert not search('cancer')
+
+        # shorter summaries are more relevant and these should come first
+        Protein.query.filter_by(refseq='NM_0000').one().summary = 'A pathway'
+        db.session.commit()
+        rebuild_search_index()
+
+        results = sorted(search('pathway'), key=lambda match: match.best_score)
+        assert [match.name for match in results] == ['Gene_0', 'Gene_1']
+
+        diseases = search_text('disease_name', Disease, 'breast canc')
+        assert [disease.name for disease in diseases] == ['Breast cancer', 'Cancer of breast, familial']
+        assert len(search_text('disease_name', Disease, 'breast', 1)) == 1
+
+        pathways = Pathway.query.filter(
+            text_filter('pathway_description', Pathway.id, 'kinase', fallback=None)
+        ).all()
+        assert [pathway.description for pathway in pathways] == ['Positive regulation of kinase activity']
+
+        # too many matches to list the ids: the fallback is used
+        assert text_filter('pathway_description', Pathway.id, 'kinase', fallback=None, max_ids=0) is None
+
+    def test_levenshtein_sorted(self):
+        from search.gene import rebuild_search_index
+        from database import levenshtein_sorted
+        from models import Disease
+
+        names = ['Cancer of breast, familial', 'Cataract', 'Breast cancer', 'Lung cancer']
+        db.session.add_all([Disease(name=name) for name in names])
+        db.session.commit()
+
+        def sorted_names(phrase):
+            query = levenshtein_sorted(Disease.query, Disease.name, phrase)
+            return [disease.name for disease in query]
+
+        # no index, no SQL function: the order is left unchanged
+        assert sorted_names('breast cancer') == names
+
+        rebuild_search_index()
+
+        assert sorted_names('breast cancer')[0] == 'Breast cancer'
+        assert sorted_names('brest canser')[0] == 'Breast cancer'
+        assert sorted_names('catarct')[0] == 'Cataract'
+
+        # works with filtered queries too
+        query = Disease.query.filter(Disease.name.like('%cancer%'))
+        assert levenshtein_sorted(query, Disease.name, 'lung').first().name == 'Lung cancer'
+
+        # the entities are ranked among the ones selected by the query
+        query = Disease.query.filter(Disease.name != 'Breast cancer')
+        assert levenshtein_sorted(query, Disease.name, 'breast cancer').first().name == 'Lung cancer'
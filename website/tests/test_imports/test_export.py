@@ -12,6 +12,7 @@ from models import InheritedMutation, Disease
 from models import ClinicalData
 from models import Site, Kinase
 from database import db
+from tests.miscellaneous import count_queries
 from miscellaneous import make_named_temp_file
 from manage import ProteinRelated
 
@@ -101,3 +102,40 @@ class TestExport(DatabaseTest):
                 'gene	refseq	mutation position	mutation alt	mutation summary	site position	site residue\n',
                 'SOMEGENE\tNM_0001\t1\tE\tCAN\t1\tA\n'
             ]
+
+    def test_network_export_queries(self):
+
+        def add_targets(first, last):
+            for i in range(first, last):
+                kinase = Kinase(
+                    name='Kinase %s' % i,
+                    protein=Protein(refseq='NM_1%s' % i, gene=Gene(name='KINASE%s' % i))
+                )
+                site = Site(position=1, residue='A', kinases=[kinase])
+                protein = Protein(refseq='NM_2%s' % i, gene=Gene(name='TARGET%s' % i), sites=[site])
+                db.session.add(protein)
+            db.session.commit()
+            db.session.expunge_all()
+
+        def count_export_queries():
+            filename = make_named_temp_file()
+            namespace = Namespace(exporters=['site_specific_network_of_kinases_and_targets'], paths=[filename])
+
+            with count_queries() as counter:
+                ProteinRelated.export(namespace)
+            db.session.expunge_all()
+
+            with open(filename) as f:
+                return counter.count, len(f.readlines())
+
+        with self.app.app_context():
+            add_targets(0, 2)
+            queries_for_two, lines = count_export_queries()
+            assert lines == 2 + 1
+
+            add_targets(2, 8)
+            queries_for_eight, lines = count_export_queries()
+            assert lines == 8 + 1
+
+        # the 'export' loading profile does not issue queries per protein
+        assert queries_for_two == queries_for_eight
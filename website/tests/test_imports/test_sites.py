@@ -9,6 +9,7 @@ gene	position	residue	enzymes	pmid	type
 NM_003955	6	K		12459551,LT_LIT.1	ubiquitination
 NM_003955	204	Y	JAK2,LCK	12783885,LT_LIT.1,LT_LIT.2,LT_LIT.3,MS_LIT.1	phosphorylation
 NM_003955	221	Y	JAK2,LCK	12783885,15173187,LT_LIT.1,LT_LIT.2,LT_LIT.3	phosphorylation
+NM_003955	225	N		12783885	glycosylation
 """
 
 
@@ -23,6 +24,7 @@ class TestImport(DatabaseTest):
 
         sites = load_sites(filename)
 
+        # the site of unknown type is skipped (and reported)
         assert len(sites) == 3
         sites = {site.position: site for site in sites}
 
@@ -81,3 +81,133 @@ class DatasetTest(ModelTest):
 
         assert dataset.is_expired
         assert dataset.data is None
+
+    def test_stored_results(self):
+        import pickle
+        from database import bdb_refseq
+        from models import Protein, StoredSearchResults
+        from views.search import MutationSearch
+
+        protein = Protein(refseq='NM_007', id=7, sequence='XXXXXXXXXXXXV')
+        db.session.add(protein)
+        db.session.commit()
+
+        bdb_refseq.add('TP7 X13V', 'NM_007')
+        bdb_refseq.add('TP7 X12V', 'NM_007')
+
+        search = MutationSearch(text_query='TP7 X13V\nTP7 X12V\nTP7 X13V\nbad')
+
+        dataset = UsersMutationsDataset(name='test', data=search)
+        db.session.add(dataset)
+        db.session.commit()
+
+        def check(data):
+            assert isinstance(data, StoredSearchResults)
+            assert data.lines == ['TP7 X13V', 'TP7 X12V']
+            assert data.badly_formatted == ['bad']
+            assert data.query_size == 4
+            assert data.results_count == 2
+
+            # only the requested lines are retrieved
+            results = data.results(1, 1)
+            assert list(results) == ['TP7 X12V']
+            mutation = results['TP7 X12V'][0]['mutation']
+            assert (mutation.protein, mutation.position, mutation.alt) == (protein, 12, 'V')
+            assert mutation.meta_user.count == 1
+
+            results = data.results()
+            assert list(results) == ['TP7 X13V', 'TP7 X12V']
+            item = results['TP7 X13V'][0]
+            assert (item['ref'], item['pos'], item['alt'], item['type']) == ('X', 13, 'V', 'proteomic')
+            assert item['mutation'].meta_user.count == 2
+
+        del dataset._data
+        check(dataset.data)
+        assert not dataset.has_legacy_format
+        assert dataset.mutations_count == 2
+        assert dataset.get_mutation_details(protein, 13, 'V').count == 2
+        assert dataset.get_mutation_details(protein, 14, 'V') is None
+
+        # repeated look-ups reuse the items and the details of mutations
+        meta = dataset.data.results()['TP7 X13V'][0]['mutation'].meta_user
+        assert dataset.get_mutation_details(protein, 13, 'V') is meta
+        assert dataset.data.results(0, 1)['TP7 X13V'][0]['mutation'].meta_user is meta
+
+        # datasets with pickled searches are still readable, and can be converted
+        with open(dataset._path, 'wb') as f:
+            pickle.dump(search, f, protocol=4)
+
+        del dataset._data
+        assert dataset.has_legacy_format
+        check(dataset.data)
+
+        assert dataset.convert_legacy_format()
+        assert not dataset.has_legacy_format
+        assert not dataset.convert_legacy_format()
+
+        del dataset._data
+        check(dataset.data)
+
+    def test_dataset_mutations_index(self):
+        from database import bdb_refseq
+        from models import Mutation, Protein, UserDatasetMutation
+        from views.search import MutationSearch
+
+        proteins = [
+            Protein(refseq='NM_007', id=7, sequence='XXXXXXXXXXXXV'),
+            Protein(refseq='NM_008', id=8, sequence='XXXXXXXXXXXXV')
+        ]
+        db.session.add_all(proteins)
+        db.session.commit()
+
+        bdb_refseq.add('TP7 X13V', 'NM_007')
+        bdb_refseq.add('TP8 X12V', 'NM_008')
+
+        search = MutationSearch(text_query='TP7 X13V\nTP8 X12V\nTP7 X13V')
+
+        dataset = UsersMutationsDataset(name='test', data=search)
+        db.session.add(dataset)
+        db.session.commit()
+
+        data = dataset.data
+        assert data.find(7, 13, 'V') == 0
+        assert data.find(7, 12, 'V') is None
+        assert data.rows_by_protein[7] == [0, 2]
+
+        # only mutations of the requested proteins are retrieved
+        mutations = data.mutations_of_proteins([8])
+        assert [(m.protein_id, m.position, m.alt) for m in mutations] == [(8, 12, 'V')]
+
+        assert UserDatasetMutation.is_stored(dataset.uri)
+
+        def dataset_mutations():
+            query = Mutation.query.filter(dataset.mutations_filter())
+            return {(m.protein_id, m.position) for m in query}
+
+        # novel mutations get to the database only once details are attached
+        assert dataset_mutations() == {(8, 12)}
+        dataset.attach_details([7])
+        assert dataset_mutations() == {(7, 13), (8, 12)}
+
+        other = Mutation(protein=proteins[0], position=12, alt='V')
+        db.session.add(other)
+        db.session.commit()
+
+        assert dataset_mutations() == {(7, 13), (8, 12)}
+        assert dataset.contains(data.mutations_of_proteins([7])[0])
+        assert not dataset.contains(other)
+
+        # datasets saved before the index was introduced match nothing...
+        UserDatasetMutation.remove(dataset.uri)
+        db.session.commit()
+        assert not UserDatasetMutation.is_stored(dataset.uri)
+        assert dataset_mutations() == set()
+
+        # ...until indexed (on first use, or by the background job)
+        assert dataset.index_mutations()
+        assert not dataset.index_mutations()
+        db.session.commit()
+        assert dataset_mutations() == {(7, 13), (8, 12)}
+
+        dataset.remove()
+        assert not UserDatasetMutation.is_stored(dataset.uri)
@@ -1,6 +1,10 @@
 from database import db
 from .model_testing import ModelTest
+from tests.miscellaneous import count_queries
 from models import Mutation
+from models import MC3Mutation
+from models import ExomeSequencingMutation
+from models import MutationSiteImpact
 from models import Protein
 from models import Site
 
@@ -41,6 +45,10 @@ class MutationTest(ModelTest):
             assert mutation.impact_on_ptm() == impact
             assert mutation.impact_on_specific_ptm(site) == impact
 
+        # the same impacts when classifying all mutations at once
+        listed = list(mutations.keys())
+        assert Mutation.impacts_on_ptm(listed, protein.site_index) == [mutations[m] for m in listed]
+
         # case 2: there are some sites but all will be excluded by a site filter
 
         def site_filter(sites):
@@ -85,3 +93,219 @@ class MutationTest(ModelTest):
         for mutation, expected_sites_cnt in expected_affected_sites.items():
             sites_found = mutation.get_affected_ptm_sites()
             assert len(sites_found) == expected_sites_cnt
+
+    def test_site_impacts(self):
+
+        mutations = [
+            Mutation(position=x, meta_MC3=[MC3Mutation()])
+            for x in (1, 12, 30)
+        ]
+        sites = [Site(position=x) for x in (10, 14)]
+
+        protein = Protein(refseq='NM_00003', mutations=mutations, sites=sites)
+        db.session.add(protein)
+        db.session.commit()
+
+        def impacts():
+            return {
+                (impact.mutation.position, impact.site.position): (impact.distance, impact.impact)
+                for impact in MutationSiteImpact.query
+            }
+
+        assert impacts() == {
+            (12, 10): (2, 'proximal'),
+            (12, 14): (2, 'proximal')
+        }
+
+        # impacts should be updated when sites or mutations are changed with ORM
+        protein.sites.append(Site(position=30))
+        mutations[0].position = 7
+        db.session.commit()
+
+        assert impacts() == {
+            (7, 10): (3, 'distal'),
+            (7, 14): (7, 'distal'),
+            (12, 10): (2, 'proximal'),
+            (12, 14): (2, 'proximal'),
+            (30, 30): (0, 'direct')
+        }
+
+        db.session.delete(sites[0])
+        db.session.commit()
+
+        assert set(impacts()) == {(7, 14), (12, 14), (30, 30)}
+
+        # impacts of confirmed mutations are updated one by one; novel mutations
+        # (e.g. created by users' searches) are not included at all
+        protein.mutations.append(Mutation(position=15, meta_MC3=[MC3Mutation()]))
+        protein.mutations.append(Mutation(position=16))
+        db.session.commit()
+
+        assert set(impacts()) == {(7, 14), (12, 14), (15, 14), (30, 30)}
+
+        # even when the impacts of the whole protein are recomputed
+        protein.sites.append(Site(position=18))
+        db.session.commit()
+
+        assert set(impacts()) == {(7, 14), (12, 14), (12, 18), (15, 14), (15, 18), (30, 30)}
+
+        # and the same rows are rebuilt from scratch
+        MutationSiteImpact.query.delete()
+        MutationSiteImpact.recompute()
+
+        assert set(impacts()) == {(7, 14), (12, 14), (12, 18), (15, 14), (15, 18), (30, 30)}
+
+    def test_sources_mask(self):
+        mutations = {
+            'mc3': Mutation(position=1, meta_MC3=[MC3Mutation()]),
+            'both': Mutation(
+                position=2,
+                meta_MC3=[MC3Mutation()],
+                meta_ESP6500=ExomeSequencingMutation(maf_all=0.02)
+            ),
+            'none': Mutation(position=3)
+        }
+        protein = Protein(refseq='NM_00004', mutations=list(mutations.values()))
+        db.session.add(protein)
+        db.session.commit()
+
+        mc3_bit = Mutation.sources_bits['MC3']
+        esp_bit = Mutation.sources_bits['ESP6500']
+
+        assert mutations['mc3'].sources_mask == mc3_bit
+        assert mutations['both'].sources_mask == mc3_bit | esp_bit
+        assert mutations['none'].sources_mask == 0
+
+        def selected(sources, require_all=True):
+            return set(
+                Mutation.query.filter(
+                    Mutation.sources_mask_filter(sources, require_all=require_all)
+                )
+            )
+
+        assert selected(['MC3']) == {mutations['mc3'], mutations['both']}
+        assert selected(['MC3', 'ESP6500']) == {mutations['both']}
+        assert selected(['ESP6500', '1KGenomes'], require_all=False) == {mutations['both']}
+        assert set(Mutation.query.filter(Mutation.is_confirmed)) == {mutations['mc3'], mutations['both']}
+
+        # masks should follow details removed with ORM
+        db.session.delete(mutations['both'].meta_ESP6500)
+        db.session.commit()
+
+        assert mutations['both'].sources_mask == mc3_bit
+
+        # and can be recomputed in bulk
+        Mutation.query.update({Mutation.sources_mask: 0})
+        Mutation.update_sources_masks()
+        db.session.commit()
+
+        assert mutations['mc3'].sources_mask == mc3_bit
+        assert mutations['both'].sources_mask == mc3_bit
+        assert mutations['none'].sources_mask == 0
+
+    def test_representation_loading_profile(self):
+
+        mutations = [
+            Mutation(
+                position=i,
+                meta_MC3=[MC3Mutation()],
+                meta_ESP6500=ExomeSequencingMutation(maf_all=0.01)
+            )
+            for i in range(1, 11)
+        ]
+        protein = Protein(refseq='NM_00005', mutations=mutations)
+        db.session.add(protein)
+        db.session.commit()
+
+        details_fields = list(Mutation.source_data_relationships)
+
+        def count_details_queries(options):
+            db.session.expunge_all()
+            with count_queries() as counter:
+                for mutation in Mutation.query.options(*options):
+                    for field in details_fields:
+                        getattr(mutation, field)
+            return counter.count
+
+        lazy = count_details_queries([])
+        batched = count_details_queries(Mutation.loading_options('representation'))
+
+        # one query per mutation per source vs one query per source
+        assert lazy >= len(mutations) * len(details_fields)
+        assert batched <= 1 + len(details_fields)
+
+    def test_ptm_proximity_expressions(self):
+        from sqlalchemy.dialects import mysql
+
+        sites = [Site(position=10), Site(position=30)]
+        mutations = {
+            position: Mutation(position=position)
+            for position in (10, 12, 15, 17, 18, 50)
+        }
+        protein = Protein(refseq='NM_00006', sites=sites, mutations=list(mutations.values()))
+
+        # mutations of other proteins should not be affected by these sites
+        other = Mutation(position=10)
+        db.session.add_all([protein, Protein(refseq='NM_00007', mutations=[other])])
+        db.session.commit()
+
+        def selected(criterion):
+            return {
+                mutation.position
+                for mutation in Mutation.query.filter(criterion)
+                if mutation is not other
+            }, other in Mutation.query.filter(criterion).all()
+
+        assert selected(Mutation.is_ptm_direct) == ({10}, False)
+        assert selected(Mutation.is_ptm_proximal) == ({10, 12}, False)
+        assert selected(Mutation.is_ptm_distal) == ({10, 12, 15, 17}, False)
+        assert selected(Mutation.is_close_to_some_site(0, 8)) == ({10, 12, 15, 17, 18}, False)
+
+        # the expressions should match instance-level properties
+        for mutation in mutations.values():
+            for attribute in ('is_ptm_direct', 'is_ptm_proximal', 'is_ptm_distal'):
+                query = Mutation.query.filter(getattr(Mutation, attribute), Mutation.id == mutation.id)
+                assert (query.count() == 1) == getattr(mutation, attribute)
+
+        # precomputed values take precedence
+        mutations[50].precomputed_is_ptm = True
+        mutations[10].precomputed_is_ptm = False
+        db.session.commit()
+
+        assert selected(Mutation.is_ptm_distal) == ({12, 15, 17, 50}, False)
+        assert Mutation.query.filter_by(is_ptm_distal=True).count() == 4
+
+        # the expressions should compile to correlated EXISTS in MySQL as well
+        query = Mutation.query.filter(Mutation.is_ptm_distal)
+        sql = str(query.statement.compile(dialect=mysql.dialect()))
+        assert 'EXISTS (SELECT' in sql
+        assert 'FROM site' in sql and 'FROM site, mutation' not in sql
+
+    def test_get_or_create_many(self):
+        proteins = [Protein(refseq='NM_0000%s' % i) for i in range(3)]
+        existing = [
+            Mutation(protein=proteins[0], position=5, alt='A'),
+            Mutation(protein=proteins[1], position=7, alt='A'),
+        ]
+        db.session.add_all(proteins + existing)
+        db.session.commit()
+
+        by_id = {protein.id: protein for protein in proteins}
+        first, second, third = [protein.id for protein in proteins]
+
+        keys = [
+            (first, 5, 'A'), (first, 5, 'C'), (first, 7, 'A'),
+            (second, 7, 'A'), (second, 5, 'A'), (third, 5, 'A')
+        ]
+
+        # small chunks: each protein has to be queried separately
+        mutations = Mutation.get_or_create_many(by_id, keys, chunk_size=3)
+
+        assert set(mutations) == set(keys)
+        assert mutations[first, 5, 'A'] is existing[0]
+        assert mutations[second, 7, 'A'] is existing[1]
+
+        # the positions of one protein do not match the mutations of the other
+        created = [key for key, mutation in mutations.items() if mutation.id is None]
+        assert set(created) == set(keys) - {(first, 5, 'A'), (second, 7, 'A')}
+        assert mutations[first, 7, 'A'].protein is proteins[0]
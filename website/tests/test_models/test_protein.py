@@ -1,6 +1,8 @@
 from database import db
 from .model_testing import ModelTest
 from models import Protein, Site, Gene
+from models import Mutation, MC3Mutation
+from models import ProteinSummary
 
 
 class ProteinTest(ModelTest):
@@ -47,3 +49,68 @@ class ProteinTest(ModelTest):
 
         for i in range(1, 5):
             assert not proteins[i].is_preferred_isoform
+
+    def test_summary(self):
+        protein = Protein(
+            refseq='NM_0001',
+            sequence='A' * 50,
+            sites=[
+                Site(position=10, type='phosphorylation'),
+                Site(position=40, type='methylation')
+            ],
+            mutations=[
+                Mutation(position=11, alt='V', precomputed_is_ptm=True, meta_MC3=[MC3Mutation()]),
+                Mutation(position=25, precomputed_is_ptm=False, meta_MC3=[MC3Mutation()]),
+                # not confirmed
+                Mutation(position=40, precomputed_is_ptm=True)
+            ]
+        )
+        db.session.add(protein)
+        db.session.commit()
+
+        # no precomputed counts yet - live counts are used
+        assert protein.get_summary() is None
+        assert protein.confirmed_mutations_count == 2
+
+        ProteinSummary.recompute()
+        db.session.commit()
+
+        def counts(source='', site_type=''):
+            summary = protein.get_summary(source, site_type)
+            return summary.mutations_count, summary.ptm_mutations_count, summary.sites_count
+
+        assert counts() == (2, 1, 2)
+        assert counts('MC3') == (2, 1, 2)
+        assert counts('ClinVar') == (0, 0, 2)
+        assert counts('', 'phosphorylation') == (2, 1, 1)
+        assert counts('', 'methylation') == (2, 0, 1)
+
+        assert protein.to_json()['muts_count'] == 2
+        assert protein.sites_count == 2
+
+        # users' searches (attaching details to known mutations and creating
+        # novel ones) do not change the counts, so the summaries are kept
+        from database import bdb_refseq
+        from models import UsersMutationsDataset
+        from views.search import MutationSearch
+
+        bdb_refseq.add('GENE A11V', 'NM_0001')
+        bdb_refseq.add('GENE A12V', 'NM_0001')
+
+        search = MutationSearch(text_query='GENE A11V\nGENE A12V')
+        dataset = UsersMutationsDataset(name='test', data=search)
+        db.session.add(dataset)
+        db.session.commit()
+
+        dataset.data.mutations()
+        db.session.commit()
+
+        assert protein.get_summary() is not None
+        assert counts() == (2, 1, 2)
+
+        # summaries of proteins changed with ORM are dropped (and live counts used)
+        protein.mutations.append(Mutation(position=30, meta_MC3=[MC3Mutation()]))
+        db.session.commit()
+
+        assert protein.get_summary() is None
+        assert protein.confirmed_mutations_count == 3
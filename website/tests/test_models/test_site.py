@@ -44,3 +44,32 @@ class SiteTest(ModelTest):
         for position, expected_sequence in data.items():
             site = Site(position=position + 1, type='methylation', residue=p.sequence[position], protein=p)
             assert site.sequence == expected_sequence
+
+    def test_types(self):
+
+        sites = {
+            'methylation': Site(position=1, type='methylation'),
+            'both': Site(position=2, type='methylation,phosphorylation'),
+            'none': Site(position=3)
+        }
+        db.session.add_all(sites.values())
+        db.session.commit()
+
+        # order of types is normalized
+        assert sites['both'].type == 'phosphorylation,methylation'
+        assert sites['none'].type is None
+
+        def selected(clause):
+            return set(Site.query.filter(clause))
+
+        assert selected(Site.type.contains('methylation')) == {sites['methylation'], sites['both']}
+        assert selected(Site.type.in_(['phosphorylation', 'acetylation'])) == {sites['both']}
+        assert selected(Site.type == 'methylation') == {sites['methylation']}
+
+        # unknown types are not accepted, neither when creating sites...
+        with pytest.raises(ValidationError, match='glycosylation'):
+            Site(position=4, type='glycosylation,methylation')
+
+        # ...nor in filters
+        with pytest.raises(ValidationError):
+            Site.type.contains('glycosylation')
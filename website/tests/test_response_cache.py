@@ -0,0 +1,44 @@
+from response_cache import ResponseCache
+
+
+def test_response_cache(tmpdir):
+    path = str(tmpdir.join('responses'))
+
+    cache = ResponseCache(path, capacity=2)
+
+    key = cache.make_key('endpoint', ('NM_000123',), 'Mutation.sources:in:MC3', 1)
+    assert key == cache.make_key('endpoint', ('NM_000123',), 'Mutation.sources:in:MC3', 1)
+    assert key != cache.make_key('endpoint', ('NM_000123',), 'Mutation.sources:in:MC3', 2)
+
+    assert cache.get(key) is None
+
+    cache.set(key, b'{"a": 1}')
+    assert cache.get(key) == b'{"a": 1}'
+
+    # least recently used entries are dropped from memory only
+    for i in range(3):
+        cache.set(cache.make_key(i), str(i).encode())
+
+    assert key not in cache.memory
+    assert len(cache.memory) == 2
+
+    # the on-disk tier is shared: other instances (workers) can read it
+    other_worker_cache = ResponseCache(path)
+    assert other_worker_cache.get(key) == b'{"a": 1}'
+    assert other_worker_cache.get(cache.make_key(0)) == b'0'
+
+    cache.clear()
+    assert cache.get(key) is None
+    assert other_worker_cache.get(cache.make_key(1)) is None
+
+
+def test_memory_only():
+    cache = ResponseCache()
+    cache.open()
+
+    assert cache.is_enabled
+    cache.set('key', b'value')
+    assert cache.get('key') == b'value'
+
+    cache.close()
+    assert cache.get('key') is None
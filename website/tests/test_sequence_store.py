@@ -0,0 +1,72 @@
+import os
+
+from sequence_store import SequenceStore, disorder_intervals
+
+
+def test_disorder_intervals():
+    assert disorder_intervals('') == []
+    assert disorder_intervals('0000') == []
+    assert disorder_intervals('0110011') == [(2, 2), (6, 2)]
+    assert disorder_intervals('1110') == [(1, 3)]
+
+
+def test_sequence_store(tmpdir):
+    path = str(tmpdir.join('test.store'))
+
+    store = SequenceStore()
+    store.build(
+        path,
+        [
+            (1, 'MRLAG*', '110001'),
+            (4, 'ACDEFGHIK', None),
+            (2, '', '')
+        ]
+    )
+
+    assert 1 in store and 2 in store and 4 in store
+    assert 3 not in store
+    assert 5 not in store
+
+    # fragments follow slicing semantics
+    assert store.fragment(1, 0, 3) == 'MRL'
+    assert store.fragment(1, 2) == 'LAG*'
+    assert store.fragment(4, 7, 20) == 'IK'
+    assert store.fragment(4, 20, 30) == ''
+    assert store.sequence(4) == 'ACDEFGHIK'
+    assert store.sequence(2) == ''
+
+    assert store.length(1) == 6
+
+    assert store.disorder_regions(1) == [[1, 2], [6, 1]]
+    assert store.disorder_regions(4) == []
+
+    # should be readable when reopened
+    reopened = SequenceStore(path)
+    assert reopened.fragment(1, 1, 2) == 'R'
+    assert reopened.disorder_regions(1) == [[1, 2], [6, 1]]
+
+
+def test_not_built(tmpdir):
+    store = SequenceStore(str(tmpdir.join('missing.store')))
+    assert not store.is_open
+    assert 1 not in store
+
+
+def test_refresh(tmpdir):
+    path = str(tmpdir.join('test.store'))
+
+    reader = SequenceStore(path)
+    assert 1 not in reader
+
+    SequenceStore().build(path, [(1, 'MRLAG*', '')])
+
+    # a store built by the other process is picked up after refresh_interval
+    reader.refresh_interval = 0
+    assert 1 in reader
+    assert reader.sequence(1) == 'MRLAG*'
+
+    SequenceStore().build(path, [(1, 'ACD', ''), (2, 'KK', '')])
+    os.utime(path, (0, 0))
+
+    assert 2 in reader
+    assert reader.sequence(1) == 'ACD'
@@ -7,6 +7,7 @@ from models import Mutation
 from models import MC3Mutation
 from models import Cancer
 from database import db
+from tests.miscellaneous import count_queries
 
 
 def create_test_protein():
@@ -184,6 +185,59 @@ class TestNetworkView(ViewTest):
 
         assert all(expected_site_kinase_rows.values())
 
+    def test_constant_queries_count(self):
+
+        def create_hub(refseq, kinases_count):
+            hub = Protein(refseq=refseq, gene=Gene(name='Hub ' + refseq), sequence='T' * 40)
+            sites = []
+            for i in range(kinases_count):
+                kinase = create_test_kinase('Kinase %s of %s' % (i, refseq), '%s_%s' % (refseq, i))
+                kinase.protein.mutations = [Mutation(position=1, alt='A', meta_MC3=[MC3Mutation(cancer=cancer)])]
+                sites.append(Site(position=i * 3 + 1, type='phosphorylation', residue='T', kinases=[kinase]))
+            hub.sites = sites
+            hub.mutations = [
+                Mutation(
+                    position=site.position, alt='A',
+                    meta_MC3=[MC3Mutation(cancer=cancer)],
+                    meta_MIMP=[MIMPMutation(pwm=site.kinases[0].name, effect='loss', site=site, probability=0.1)]
+                )
+                for site in sites
+            ]
+            db.session.add(Drug(
+                name='Drug targeting ' + refseq,
+                target_genes=[site.kinases[0].protein.gene for site in sites],
+                groups={approved}
+            ))
+            db.session.add(hub)
+
+        cancer = Cancer(name='Ovarian', code='OV')
+        approved = DrugGroup(name='approved')
+        create_hub('NM_01', 2)
+        create_hub('NM_02', 8)
+        db.session.commit()
+
+        from website.views.filters import cached_queries
+        cached_queries.reload()
+
+        queries_counts = {}
+
+        for refseq in ['NM_01', 'NM_02']:
+            for endpoint in ('representation', 'predicted_representation'):
+                with count_queries() as counter:
+                    response = self.client.get('/network/%s/%s' % (endpoint, refseq))
+                assert response.status_code == 200
+                queries_counts[endpoint, refseq] = counter.count
+
+        representation = response.json['network']
+        assert len(representation['kinases']) == 8
+        assert all(
+            kinase['protein']['mutations_count'] == 1
+            for kinase in representation['kinases']
+        )
+
+        for endpoint in ('representation', 'predicted_representation'):
+            assert queries_counts[endpoint, 'NM_01'] == queries_counts[endpoint, 'NM_02']
+
     def test_divide_muts_by_sites(self):
         from views.network import divide_muts_by_sites
 
@@ -0,0 +1,59 @@
+from view_testing import ViewTest
+from models import Protein, Gene, PrerenderedRepresentation
+from database import db
+from test_sequence import create_test_mutations
+from test_network import create_network
+
+
+class TestPrerender(ViewTest):
+
+    def test_prerender_all(self):
+        from views.prerender import prerender_all
+
+        create_network()
+
+        protein = Protein.query.filter_by(refseq='NM_0007').one()
+        protein.gene.preferred_isoform = protein
+        db.session.commit()
+
+        # only the preferred isoforms are rendered
+        assert prerender_all() == 1
+        assert PrerenderedRepresentation.query.count() == 2
+
+        # the job resumes from where it ended
+        assert prerender_all() == 0
+
+        network = PrerenderedRepresentation.load(protein, 'network', release=0)
+
+        response = self.client.get('/network/representation/NM_0007')
+        assert response.json['network'] == network
+
+        sequence = PrerenderedRepresentation.load(protein, 'sequence', release=0)
+        assert sequence['mutation_table']
+
+    def test_serving(self):
+        g = Gene(name='SomeGene')
+        p = Protein(refseq='NM_000123', sequence='MART', gene=g)
+        p.mutations = create_test_mutations()
+        g.preferred_isoform = p
+        db.session.add(p)
+        db.session.commit()
+
+        stored = {'kinases': [], 'prerendered': True}
+        PrerenderedRepresentation.store(p, 'network', 0, stored)
+        db.session.commit()
+
+        # pre-rendered data are used for default filters only...
+        response = self.client.get('/network/representation/NM_000123')
+        assert response.json['network'] == stored
+
+        response = self.client.get('/network/representation/NM_000123?filters=Mutation.sources:in:ClinVar')
+        assert 'prerendered' not in response.json['network']
+
+        # ...and only for the current data release
+        from response_cache import bump_data_release
+        bump_data_release()
+        db.session.commit()
+
+        response = self.client.get('/network/representation/NM_000123')
+        assert 'prerendered' not in response.json['network']
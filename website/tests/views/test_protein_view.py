@@ -1,6 +1,7 @@
 from view_testing import ViewTest, relative_location
 from models import Protein
 from models import Site
+from models import Gene
 from database import db
 from test_sequence import test_protein_data, create_test_mutations
 
@@ -84,3 +85,140 @@ class TestProteinView(ViewTest):
         response = self.client.get('/protein/known_mutations/NM_000123')
         muts = response.json
         assert len(muts) == 4
+
+    def test_details_batch(self):
+
+        p = Protein(**test_protein_data())
+        p.mutations = create_test_mutations()
+        p.sites = [Site(position=3, residue='R', type='phosphorylation')]
+        other = Protein(refseq='NM_0001', gene=Gene(name='OtherGene'), sequence='MAR')
+        db.session.add_all([p, other])
+
+        filters = 'filters=Mutation.sources:in:MC3'
+
+        response = self.client.get('/protein/details_batch?refseqs=NM_000123,NM_0001,NM_404&' + filters)
+        assert response.status_code == 200
+
+        details = response.json
+        assert set(details) == {'NM_000123', 'NM_0001'}
+
+        protein_details = details['NM_000123']
+        assert protein_details['gene_name'] == 'SomeGene'
+        assert protein_details['sites_count'] == 1
+        assert protein_details['muts_count'] == 1
+        assert protein_details['ptm_muts'] == 1
+        assert set(protein_details['meta']) == {'OV', 'BRCA'}
+        assert protein_details['drugs'] == []
+
+        assert details['NM_0001']['muts_count'] == 0
+
+        # single-protein endpoint returns the same data
+        response = self.client.get('/protein/details/NM_000123?' + filters)
+        assert response.json == protein_details
+
+    def test_conditional_get(self):
+        from response_cache import bump_data_release
+
+        p = Protein(**test_protein_data())
+        p.sites = [Site(position=3, residue='R', type='phosphorylation')]
+        db.session.add(p)
+        db.session.commit()
+
+        response = self.client.get('/protein/sites/NM_000123')
+        assert response.status_code == 200
+        etag, _ = response.get_etag()
+        assert etag
+
+        headers = {'If-None-Match': '"%s"' % etag}
+
+        # the biological database is not used to answer: even a removed
+        # protein is still "not modified" until the data release changes
+        db.session.delete(p)
+        db.session.commit()
+
+        response = self.client.get('/protein/sites/NM_000123', headers=headers)
+        assert response.status_code == 304
+
+        # other arguments, other tag
+        response = self.client.get('/protein/sites/NM_000123?filters=Site.type:in:methylation', headers=headers)
+        assert response.status_code == 404
+
+        bump_data_release()
+        db.session.commit()
+
+        response = self.client.get('/protein/sites/NM_000123', headers=headers)
+        assert response.status_code == 404
+
+    def test_conditional_get_of_user(self):
+        from response_cache import bump_data_release
+
+        p = Protein(**test_protein_data())
+        db.session.add(p)
+        bump_data_release()
+        db.session.commit()
+
+        self.login('user@domain.org', 'password', create=True)
+
+        # Last-Modified does not identify the user: only ETag is used
+        response = self.client.get('/protein/sites/NM_000123')
+        assert response.status_code == 200
+        assert response.get_etag()[0]
+        assert response.last_modified is None
+
+        headers = {'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}
+        response = self.client.get('/protein/sites/NM_000123', headers=headers)
+        assert response.status_code == 200
+
+
+class TestCachedResponses(ViewTest):
+
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_PATH = '.test_databases/responses_cache'
+
+    def test_sites(self):
+        from database import response_cache
+        from response_cache import bump_data_release
+
+        response_cache.clear()
+
+        p = Protein(**test_protein_data())
+        p.sites = [Site(position=3, residue='R', type='phosphorylation')]
+        db.session.add(p)
+        db.session.commit()
+
+        def get_sites(query_string=''):
+            response = self.client.get('/protein/sites/NM_000123' + query_string)
+            assert response.status_code == 200
+            return response.json
+
+        assert len(get_sites()) == 1
+
+        p.sites.append(Site(position=4, residue='T', type='methylation'))
+        db.session.commit()
+
+        # the data are served from the cache until the release is bumped
+        assert len(get_sites()) == 1
+
+        bump_data_release()
+        db.session.commit()
+
+        assert len(get_sites()) == 2
+
+        # filters are a part of the key
+        assert len(get_sites('?filters=Site.type:in:methylation')) == 1
+
+    def test_checksum_is_a_part_of_key(self):
+        from database import response_cache
+
+        response_cache.clear()
+
+        p = Protein(**test_protein_data())
+        db.session.add(p)
+        db.session.commit()
+
+        for checksum in ['first', 'second']:
+            response = self.client.get(
+                '/sequence/representation_data/NM_000123?checksum=' + checksum
+            )
+            assert response.status_code == 200
+            assert response.json['filters']['checksum'] == checksum
@@ -1,3 +1,4 @@
+import os
 import re
 from io import BytesIO
 
@@ -57,6 +58,8 @@ def entries_with_type(response, type_name):
 
 class TestSearchView(ViewTest):
 
+    VCF_UPLOAD_FOLDER = '.test_databases/uploads'
+
     def view_module(self):
         from website.views import search
         return search
@@ -184,6 +187,148 @@ class TestSearchView(ViewTest):
         assert response.status_code == 200
         assert b'NM_007' in response.data
 
+        #
+        # compressed VCF file test
+        #
+        from gzip import compress
+
+        response = self.client.post(
+            '/search/mutations',
+            content_type='multipart/form-data',
+            data={
+                'vcf-file': (BytesIO(compress(VCF_FILE_CONTENT)), 'exemplar_vcf.vcf.gz')
+            }
+        )
+
+        assert response.status_code == 200
+        assert b'NM_007' in response.data
+
+        # the uploaded files are removed once searched
+        with self.app.test_request_context():
+            uploads = self.view_module().vcf_uploads_directory()
+        assert not os.listdir(uploads)
+
+    def test_batched_mutation_search(self):
+        from database import bdb, bdb_refseq
+        from views._commons import get_protein_muts
+        from views.search import MutationSearch, SearchViewFilters
+
+        s = Site(position=13, type='methylation')
+        p = Protein(refseq='NM_007', id=7, sites=[s], sequence='XXXXXXXXXXXXV')
+        m_in_site = Mutation(protein=p, position=13, alt='V')
+        db.session.add(p)
+        db.session.commit()
+
+        bdb.add_genomic_mut('20', 14370, 'G', 'A', m_in_site, is_ptm=True)
+        bdb_refseq.add('TP7 X13V', 'NM_007')
+        bdb_refseq.add('TP7 X50K', 'NM_007')
+
+        lines = [
+            'chr20 14370 G A',
+            'tp7 x13v',
+            'chr20 14370 G A',
+            'TP7 X50K',
+            'chr1 100 A T',
+            'not a mutation'
+        ]
+
+        def legacy_items(line):
+            data = line.split()
+            if len(data) == 4:
+                return bdb.get_genomic_muts(data[0][3:], *data[1:])
+            return get_protein_muts(*[x.upper() for x in data])
+
+        def describe(items):
+            return [
+                dict(
+                    item,
+                    mutation=(item['mutation'].protein_id, item['mutation'].position, item['mutation'].alt)
+                )
+                for item in items
+            ]
+
+        search = MutationSearch(text_query='\n'.join(lines))
+
+        assert list(search.results) == ['chr20 14370 G A', 'tp7 x13v', 'TP7 X50K']
+        for line, items in search.results.items():
+            assert describe(items) == describe(legacy_items(line))
+
+        # the same mutation found with both notations is a single object
+        genomic, proteomic = search.results['chr20 14370 G A'], search.results['tp7 x13v']
+        assert genomic[0]['mutation'] is proteomic[0]['mutation']
+        assert genomic[0]['mutation'] is m_in_site
+        assert genomic[0]['mutation'].meta_user.query == 'tp7 x13v'
+
+        assert search.without_mutations == ['chr1 100 A T']
+        assert search.badly_formatted == ['not a mutation']
+        assert search.hidden_results_cnt == 0
+
+        with self.app.test_request_context():
+            filtered = MutationSearch(text_query='\n'.join(lines), filter_manager=SearchViewFilters())
+
+        # only mutations affecting PTM sites are shown by default
+        assert list(filtered.results) == ['chr20 14370 G A', 'tp7 x13v']
+        assert filtered.hidden_results_cnt == 1
+        assert filtered.results['chr20 14370 G A'][0]['mutation'].meta_user.count == 2
+
+    def test_merge_mutation_search(self):
+        import pickle
+        from database import bdb, bdb_refseq
+        from views.search import MutationSearch, split_search
+
+        p = Protein(refseq='NM_007', id=7, sequence='XXXXXXXXXXXXV')
+        m = Mutation(protein=p, position=13, alt='V')
+        db.session.add(p)
+        db.session.commit()
+
+        bdb.add_genomic_mut('20', 14370, 'G', 'A', m)
+        bdb_refseq.add('TP7 X13V', 'NM_007')
+
+        text_query = '\n'.join([
+            'chr20 14370 G A',
+            'chr1 100 A T',
+            'TP7 X13V',
+            'not a mutation',
+            'chr20 14370 G A',
+            'chr20 14370 G A',
+        ])
+        vcf_lines = VCF_FILE_CONTENT.split(b'\n')
+
+        def describe(search):
+            return (
+                search.query,
+                search.without_mutations,
+                search.badly_formatted,
+                search.hidden_results_cnt,
+                {
+                    line: [
+                        (item['mutation'].protein_id, item['mutation'].position, item['mutation'].meta_user.count)
+                        for item in items
+                    ]
+                    for line, items in search.results.items()
+                }
+            )
+
+        whole = describe(MutationSearch(vcf_lines, text_query))
+
+        chunks = split_search(vcf_lines, text_query, chunk_size=2)
+        assert len(chunks) > 4
+
+        parts = [
+            # as if returned by separate workers
+            pickle.loads(pickle.dumps(
+                MutationSearch(vcf_chunk, text_chunk, record_lines=True)
+            ))
+            for vcf_chunk, text_chunk in chunks
+        ]
+        merged = MutationSearch.merge(parts)
+
+        assert describe(merged) == whole
+        assert merged.results['chr20 14370 G A'][0]['mutation'].meta_user.count == 3
+
+        # a mutation found in different chunks is represented by a single instance
+        assert merged.results['chr20 14370 G A\n'][0]['mutation'] is merged.results['TP7 X13V'][0]['mutation']
+
     def test_autocomplete_all_proteins(self):
         # MC3 GeneList is required as a target (a href for links) where users will be pointed
         # after clicking of cancer autocomplete suggestion
@@ -361,6 +506,59 @@ class TestSearchView(ViewTest):
 
         assert all(r == result for r in results) and result
 
+    def test_concurrent_suggestions(self):
+        from time import sleep, time
+        from collections import OrderedDict
+
+        search = self.view_module()
+
+        def provider(result, duration):
+            def suggest():
+                sleep(duration)
+                return result
+            return suggest
+
+        providers = OrderedDict([
+            ('genes', provider('genes', 0.1)),
+            ('pathways', provider('pathways', 0.1)),
+            ('diseases', provider('diseases', 3))
+        ])
+
+        # sequentially, without the time limits
+        with self.app.test_request_context():
+            self.app.config['AUTOCOMPLETE_WORKERS'] = 0
+            results = search.run_providers(OrderedDict(list(providers.items())[:2]))
+        assert results == {'genes': 'genes', 'pathways': 'pathways'}
+
+        with self.app.test_request_context():
+            self.app.config['AUTOCOMPLETE_WORKERS'] = 3
+            self.app.config['AUTOCOMPLETE_DEADLINE'] = 2
+            start = time()
+            results = search.run_providers(providers)
+            elapsed = time() - start
+
+        # the fast ones were run concurrently, the slow one was skipped
+        assert results == {'genes': 'genes', 'pathways': 'pathways'}
+        assert elapsed < 1.5
+
+        self.app.config['AUTOCOMPLETE_WORKERS'] = 0
+
+    def test_suggestions_without_gene_lists(self):
+        from models import Cancer
+
+        search = self.view_module()
+
+        db.session.add_all([Cancer(name='Breast cancer', code='BRCA'), Disease(name='Breast cancer')])
+        db.session.commit()
+
+        # matching cancers and diseases are skipped if there are no lists to link to
+        with self.app.test_request_context():
+            assert search.suggest_matching_cancers('breast') == []
+            assert search.suggest_matching_diseases('breast') == []
+
+        response = self.client.get('/search/autocomplete_all/?q=breast')
+        assert response.status_code == 200
+
     def test_save_search(self):
         self.login('user@domain.org', 'password', create=True)
 
@@ -1,5 +1,5 @@
 from view_testing import ViewTest
-from models import Protein, Disease, MIMPMutation, Kinase
+from models import Protein, Disease, MIMPMutation, Kinase, Site
 from models import Gene
 from models import Mutation
 from models import Cancer
@@ -9,6 +9,7 @@ from models import ClinicalData
 from models import The1000GenomesMutation
 from models import ExomeSequencingMutation
 from database import db
+from tests.miscellaneous import count_queries
 
 
 def test_protein_data():
@@ -152,3 +153,39 @@ class TestSequenceView(ViewTest):
 
         response = self.client.get(uri + '?filters=Mutation.sources:in:ESP6500;Mutation.populations_ESP6500:in:European American')
         assert response.json['muts_count'] == 1
+
+    def test_representation_queries(self):
+        cancer = Cancer(name='Ovarian', code='OV')
+
+        def create_protein(refseq, mutations_count):
+            protein = Protein(refseq=refseq, gene=Gene(name='Gene of ' + refseq), sequence='MART' * 10)
+            protein.mutations = [
+                Mutation(position=i, alt='K', meta_MC3=[MC3Mutation(cancer=cancer, count=1)])
+                for i in range(1, mutations_count + 1)
+            ]
+            protein.sites = [
+                Site(position=i, residue='R', kinases=[Kinase(name='Kinase %s %s' % (refseq, i))])
+                for i in range(2, mutations_count + 1, 4)
+            ]
+            db.session.add(protein)
+
+        create_protein('NM_01', 2)
+        create_protein('NM_02', 20)
+        db.session.commit()
+
+        from website.views.filters import cached_queries
+        cached_queries.reload()
+
+        queries_counts = {}
+
+        for refseq in ['NM_01', 'NM_02']:
+            with count_queries() as counter:
+                response = self.client.get('/sequence/representation_data/' + refseq)
+            assert response.status_code == 200
+            queries_counts[refseq] = counter.count
+
+        assert len(response.json['content']['mutations']) == 20
+
+        # the 'representation' loading profile fetches details of mutations
+        # and kinases of sites in batches, regardless of their number
+        assert queries_counts['NM_01'] == queries_counts['NM_02']
@@ -8,6 +8,7 @@ from .chromosome import ChromosomeView
 from .short_url import ShortAddress
 from .pathway import PathwaysView
 from .mutation import MutationView
+from . import prerender     # registers the pre-rendering Celery task
 
 
 views = [
@@ -1,10 +1,14 @@
 from collections import defaultdict
 
-from database import bdb_refseq
+from database import bdb, bdb_refseq
 from database import get_or_create
+from genomic_mappings import decode_csv, make_snv_key
 from helpers.bioinf import decode_raw_mutation
+from helpers.models import chunks
+from helpers.site_index import SiteIndex
 from models import Mutation, Drug, Gene
 from models import Protein
+from models import Site
 
 
 def iterate_affected_isoforms(gene_name, ref, pos, alt):
@@ -45,7 +49,7 @@ def iterate_affected_isoforms(gene_name, ref, pos, alt):
             isoform
             for isoform in gene.isoforms
             if (isoform.length >= pos and
-                isoform.sequence[pos - 1] == ref)
+                isoform.residue(pos) == ref)
         ]
     """
     hash_key = gene_name + ' ' + ref + str(pos) + alt
@@ -88,9 +92,166 @@ def get_protein_muts(gene_name, mut):
     return items
 
 
-def represent_mutation(mutation, data_filter, representation_type=dict):
+class MutationsLookup:
+    """Batched equivalent of bdb.get_genomic_muts and get_protein_muts.
 
-    affected_sites = mutation.get_affected_ptm_sites(data_filter)
+    Mutations to look up are registered first (with add_genomic or
+    add_proteomic, which return keys); then resolve() fetches all the
+    proteins and mutations with a few IN queries, creating the mutations
+    which are not in the database yet (as get_or_create would). Afterwards
+    items(key) returns the same items as the unbatched functions would.
+    """
+
+    # number of bound parameters in a single IN clause
+    chunk_size = 500
+
+    def __init__(self):
+        self.genomic = {}
+        self.proteomic = {}
+        self.resolved = {}
+
+    def add_genomic(self, chrom, pos, ref, alt):
+        key = ('genomic', make_snv_key(chrom, pos, ref, alt))
+        self.genomic[key] = None
+        return key
+
+    def add_proteomic(self, gene_name, mut):
+        ref, pos, alt = decode_raw_mutation(mut)
+        key = ('proteomic', gene_name, ref, pos, alt)
+        self.proteomic[key] = None
+        return key
+
+    def __len__(self):
+        """Number of distinct mutations to look up."""
+        return len(self.genomic) + len(self.proteomic)
+
+    def _fetch_proteins(self, column, values):
+        proteins = {}
+        for chunk in chunks(values, self.chunk_size):
+            for protein in Protein.query.filter(column.in_(chunk)):
+                proteins[getattr(protein, column.key)] = protein
+        return proteins
+
+    def resolve(self, progress=None):
+        """Fetch everything registered so far.
+
+        Args:
+            progress: function called after each mutation was looked up
+        """
+        for key in self.genomic:
+            snv = key[1]
+            self.genomic[key] = [decode_csv(item) for item in bdb[snv]]
+            if progress:
+                progress()
+
+        for key in self.proteomic:
+            kind, gene_name, ref, pos, alt = key
+            self.proteomic[key] = bdb_refseq[gene_name + ' ' + ref + str(pos) + alt]
+            if progress:
+                progress()
+
+        proteins_by_id = self._fetch_proteins(Protein.id, {
+            item['protein_id']
+            for items in self.genomic.values()
+            for item in items
+        })
+        proteins_by_refseq = self._fetch_proteins(Protein.refseq, {
+            refseq
+            for refseqs in self.proteomic.values()
+            for refseq in refseqs
+        })
+
+        for key, items in self.genomic.items():
+            for item in items:
+                item['protein'] = proteins_by_id[item['protein_id']]
+
+        for key, refseqs in self.proteomic.items():
+            # sorted as if retrieved from the database using the index on refseq
+            self.proteomic[key] = sorted(
+                (proteins_by_refseq[refseq] for refseq in refseqs if refseq in proteins_by_refseq),
+                key=lambda isoform: isoform.refseq
+            )
+
+        proteins = dict(proteins_by_id)
+        proteins.update(
+            (protein.id, protein)
+            for protein in proteins_by_refseq.values()
+        )
+
+        mutations = Mutation.get_or_create_many(
+            proteins,
+            [
+                (item['protein_id'], item['pos'], item['alt'])
+                for items in self.genomic.values()
+                for item in items
+            ] + [
+                (isoform.id, key[3], key[4])
+                for key, isoforms in self.proteomic.items()
+                for isoform in isoforms
+            ],
+            self.chunk_size
+        )
+
+        for key, items in self.genomic.items():
+            for item in items:
+                item['mutation'] = mutations[item['protein_id'], item['pos'], item['alt']]
+                item['type'] = 'genomic'
+
+        for key, isoforms in self.proteomic.items():
+            kind, gene_name, ref, pos, alt = key
+            self.resolved[key] = [
+                {
+                    'protein': isoform,
+                    'ref': ref,
+                    'alt': alt,
+                    'pos': pos,
+                    'mutation': mutations[isoform.id, pos, alt],
+                    'type': 'proteomic'
+                }
+                for isoform in isoforms
+            ]
+
+        self.resolved.update(self.genomic)
+
+    def items(self, key):
+        """Items for given key (new dicts on each call, as many lines may share the key)."""
+        return [dict(item) for item in self.resolved[key]]
+
+    def mutations(self):
+        """All distinct mutations found."""
+        unique = {}
+        for items in self.resolved.values():
+            for item in items:
+                unique[id(item['mutation'])] = item['mutation']
+        return list(unique.values())
+
+
+def filtered_site_index(protein, filter_manager):
+    """Index of sites of the protein which pass the active filters.
+
+    If the sites are not filtered, or are filtered by type only,
+    the index cached on the protein is used (restricted with of_type).
+    """
+    site_filters = [
+        site_filter
+        for site_filter in filter_manager.get_active()
+        if Site in site_filter.targets
+    ]
+
+    if not site_filters:
+        return protein.site_index
+
+    if len(site_filters) == 1 and site_filters[0].id == 'Site.type':
+        site_type = site_filters[0].value
+        if isinstance(site_type, str):
+            return protein.site_index.of_type(site_type)
+
+    return SiteIndex(filter_manager.apply(protein.sites))
+
+
+def represent_mutation(mutation, data_filter, representation_type=dict, site_index=None):
+
+    affected_sites = mutation.get_affected_ptm_sites(data_filter, site_index=site_index)
 
     return representation_type(
         (
@@ -108,6 +269,7 @@ def represent_mutation(mutation, data_filter, representation_type=dict):
 
 def drugs_interacting_with_kinases(filter_manager, kinases):
     from sqlalchemy import and_
+    from sqlalchemy.orm import selectinload
 
     kinase_gene_ids = [kinase.protein.gene_id for kinase in kinases if kinase.protein]
     drugs = filter_manager.query_all(
@@ -116,7 +278,11 @@ def drugs_interacting_with_kinases(filter_manager, kinases):
             q,
             Gene.id.in_(kinase_gene_ids)
         ),
-        lambda query: query.join(Drug.target_genes)
+        # targets and groups of all the drugs are fetched at once
+        lambda query: query.join(Drug.target_genes).options(
+            selectinload(Drug.target_genes),
+            selectinload(Drug.groups)
+        )
     )
     drugs_by_kinase = defaultdict(set)
     for drug in drugs:
@@ -1,13 +1,28 @@
+from collections import Counter
+from functools import wraps
 from warnings import warn
 
 import flask
-from flask import request, flash
+from flask import request, flash, current_app
 from flask_classful import FlaskView
 from flask_login import current_user
-from sqlalchemy import and_
+from sqlalchemy import and_, distinct, func
 
+from database import db, response_cache
 from helpers.filters import FilterManager
 from models import Protein, Mutation, UsersMutationsDataset
+from models import PrerenderedRepresentation
+from response_cache import get_data_release
+
+
+def protein_filters_scope(protein, custom_datasets_ids=(), **kwargs):
+    """Everything choices and defaults of common_filters depend on,
+    identifying the filters for caching of states parsed from requests."""
+    return (
+        protein.id if protein else None,
+        tuple(sorted(custom_datasets_ids)),
+        tuple(sorted(kwargs.items()))
+    )
 
 
 class GracefulFilterManager(FilterManager):
@@ -46,6 +61,65 @@ class GracefulFilterManager(FilterManager):
             flash(message, category='warning')
 
 
+def prerendered_or_rendered(kind, render, protein, filter_manager):
+    """Get representation data of given kind, using the one pre-rendered
+    offline (see views.prerender) if all filters are set to defaults.
+
+    Args:
+        render: function (protein, filter_manager) -> representation data,
+            used when there is no suitable pre-rendered representation
+    """
+    if filter_manager.url_string() is None:
+        data = PrerenderedRepresentation.load(protein, kind, get_data_release())
+        if data is not None:
+            return data
+
+    return render(protein, filter_manager)
+
+
+def cached_response(view):
+    """Serve JSON response of a protein view from the response_cache.
+
+    Responses are cached by endpoint, arguments, filters (in canonical
+    form), the data release and the checksum of filters sent by the client
+    (which is echoed in the response, see ProteinFiltersData, and compared
+    by the client with the state of the form). Views of user's mutations
+    are not cached.
+    """
+    # note: the signature has no explicit 'self' so Flask-Classful
+    # looks up the arguments (for the URL rule) of the wrapped view
+    @wraps(view)
+    def cached_view(*args, **kwargs):
+        filter_manager = flask.g.filter_manager
+
+        if (
+            not response_cache.is_enabled or
+            filter_manager.get_value('UserMutations.sources')
+        ):
+            return view(*args, **kwargs)
+
+        key = response_cache.make_key(
+            request.endpoint,
+            args[1:],
+            sorted(kwargs.items()),
+            filter_manager.url_string(canonical=True),
+            request.args.get('checksum', ''),
+            get_data_release()
+        )
+
+        content = response_cache.get(key)
+
+        if content is None:
+            response = view(*args, **kwargs)
+            if response.status_code == 200:
+                response_cache.set(key, response.get_data())
+            return response
+
+        return current_app.response_class(content, mimetype='application/json')
+
+    return cached_view
+
+
 class AbstractProteinView(FlaskView):
 
     filter_class = None
@@ -92,11 +166,16 @@ class AbstractProteinView(FlaskView):
         return protein, filter_manager
 
 
-def get_raw_mutations(protein, filter_manager, count=False):
+def raw_mutations_filter(filter_manager, criterion, proteins_ids=None):
+    """Custom filter (for use with FilterManager queries) selecting mutations
+    which match given criterion and belong to the chosen user's dataset (if any).
 
+    If the criterion limits the mutations to some proteins, their ids should
+    be given too, so only the mutations of these are read from the dataset.
+    """
     custom_dataset = filter_manager.get_value('UserMutations.sources')
 
-    mutation_filters = [Mutation.protein == protein]
+    mutation_filters = [criterion]
 
     if custom_dataset:
         dataset = UsersMutationsDataset.query.filter_by(
@@ -105,27 +184,75 @@ def get_raw_mutations(protein, filter_manager, count=False):
 
         filter_manager.filters['Mutation.sources']._value = 'user'
 
-        mutation_filters.append(
-            Mutation.id.in_([m.id for m in dataset.mutations])
+        # datasets saved before UserDatasetMutation was introduced are
+        # indexed on first use (before novel mutations get to the session)
+        if dataset.index_mutations():
+            db.session.commit()
+
+        # the details of user's mutations are used by the filters
+        # (and novel mutations have to be added to the session)
+        dataset.attach_details(proteins_ids)
+
+        mutation_filters.append(dataset.mutations_filter())
+
+    def custom_filter(q):
+        return and_(q, and_(*mutation_filters))
+
+    return custom_filter
+
+
+def count_by_protein(filter_manager, target, custom_filter=None):
+    """Count objects of type 'target' (mutations or sites) matching criteria
+    of currently active filters, separately for each protein.
+
+    This is a grouped counterpart of FilterManager.query_count: if all the
+    filters can be expressed in SQL, a single GROUP BY query is issued.
+
+    Returns:
+        Counter: protein id -> count
+    """
+    query, to_apply_manually = filter_manager.build_query(target, custom_filter)
+
+    if to_apply_manually:
+        return Counter(
+            element.protein_id
+            for element in filter_manager.apply(query, to_apply_manually)
         )
 
-    getter = filter_manager.query_count if count else filter_manager.query_all
+    return Counter(dict(
+        query
+        .with_entities(target.protein_id, func.count(distinct(target.id)))
+        .group_by(target.protein_id)
+    ))
+
+
+def get_raw_mutations(protein, filter_manager, count=False, loading_profile='representation'):
 
-    raw_mutations = getter(
+    custom_filter = raw_mutations_filter(filter_manager, Mutation.protein == protein, [protein.id])
+
+    if count:
+        return filter_manager.query_count(Mutation, custom_filter)
+
+    return filter_manager.query_all(
         Mutation,
-        lambda q: and_(q, and_(*mutation_filters))
+        custom_filter,
+        lambda query: query.options(*Mutation.loading_options(loading_profile))
     )
 
-    return raw_mutations
-
 
 class ProteinRepresentation:
 
+    # which relationships of mutations and sites should be loaded eagerly
+    loading_profile = 'representation'
+
     def __init__(self, protein, filter_manager, include_kinases_from_groups=False):
         self.protein = protein
         self.filter_manager = filter_manager
         self.include_kinases_from_groups = include_kinases_from_groups
-        self.protein_mutations = get_raw_mutations(protein, filter_manager)
+        self.protein_mutations = get_raw_mutations(
+            protein, filter_manager,
+            loading_profile=self.loading_profile
+        )
         self.json_data = None
 
     def get_sites_and_kinases(self, only_sites_with_kinases=True):
@@ -151,7 +278,8 @@ class ProteinRepresentation:
                     q,
                     Site.protein == self.protein,
                     *additional_criteria
-                )
+                ),
+                lambda query: query.options(*Site.loading_options(self.loading_profile))
             )
         ]
 
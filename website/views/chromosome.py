@@ -5,8 +5,9 @@ from flask import jsonify
 from database import bdb
 from models import Mutation
 from helpers.filters import FilterManager
+from helpers.views import conditional_get
 from .filters import common_filters
-from ._commons import represent_mutation
+from ._commons import filtered_site_index, represent_mutation
 from operator import attrgetter
 from collections import OrderedDict
 
@@ -22,24 +23,47 @@ def represent_mutations(mutations, filter_manager):
 
     data_filter = filter_manager.apply
 
+    mutations = list(mutations)
+
+    # mutations may come from different proteins: keep one index per protein
+    # and classify mutations of each protein at once
+    mutations_by_protein = OrderedDict()
+    for mutation in mutations:
+        mutations_by_protein.setdefault(mutation.protein, []).append(mutation)
+
+    site_indices = {}
+    impacts = {}
+
+    for protein, protein_mutations in mutations_by_protein.items():
+        site_index = filtered_site_index(protein, filter_manager)
+        site_indices[protein] = site_index
+        impacts.update(zip(
+            protein_mutations,
+            Mutation.impacts_on_ptm(protein_mutations, site_index)
+        ))
+
     response = []
 
     for mutation in mutations:
 
+        protein = mutation.protein
+        site_index = site_indices[protein]
+
         needle = represent_mutation(
             mutation,
             data_filter,
-            representation_type=OrderedDict
+            representation_type=OrderedDict,
+            site_index=site_index
         )
 
-        needle['protein'] = mutation.protein.refseq
-        needle['gene'] = mutation.protein.gene.name
+        needle['protein'] = protein.refseq
+        needle['gene'] = protein.gene.name
 
         # place protein refseq id on the beginning
         needle.move_to_end('protein', last=False)
         needle.move_to_end('gene', last=False)
 
-        needle['ptm_impact'] = mutation.impact_on_ptm(data_filter)
+        needle['ptm_impact'] = impacts[mutation]
 
         if source_name:
             field = get_source_data(mutation)
@@ -61,7 +85,7 @@ def represent_mutations(mutations, filter_manager):
             metadata['MIMP'] = mimp.to_json()
 
         closest_sites = mutation.find_closest_sites(
-            site_filter=data_filter
+            site_index=site_index
         )
         needle['closest_sites'] = [
             '%s %s' % (site.position, site.residue)
@@ -86,6 +110,7 @@ class ChromosomeView(FlaskView):
         filter_manager.update_from_request(request)
         return filters, filter_manager
 
+    @conditional_get
     def mutation(self, chrom, dna_pos, dna_ref, dna_alt):
         """Rest API endpoint.
         Stop codon mutations are not considered."""
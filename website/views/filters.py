@@ -5,8 +5,9 @@ from models import Site
 from models import The1000GenomesMutation
 from models import ExomeSequencingMutation
 from models import ClinicalData
-from database import has_or_any
 from helpers.filters import Filter
+from helpers.filters import FilterManager
+from helpers.filters import is_iterable_but_not_str
 from helpers.widgets import FilterWidget
 
 
@@ -94,9 +95,13 @@ def source_filter_to_sqlalchemy(source_filter, target):
 
 
 def source_to_sa_filter(source_name, target=Mutation):
-    field_name = Mutation.source_fields[source_name]
-    field = getattr(target, field_name)
-    return has_or_any(field)
+    return Mutation.sources_mask_filter([source_name], target=target)
+
+
+def site_type_filter_to_sqlalchemy(site_type_filter, target):
+    """Adapt site type filter to SQLAlchemy clause (selecting sites of any of chosen types)"""
+    value = site_type_filter.value
+    return target.type.in_(value if is_iterable_but_not_str(value) else [value])
 
 
 class UserMutations:
@@ -134,6 +139,9 @@ class CachedQueries:
         }
         self.dataset_labels = create_dataset_labels()
 
+        # choices of filters might have changed
+        FilterManager.clear_parsed_states()
+
 
 cached_queries = CachedQueries()
 
@@ -172,7 +180,7 @@ def common_filters(
         Filter(
             Site, 'type', comparators=['in'],
             choices=Site.types,
-            as_sqlalchemy=True
+            as_sqlalchemy=site_type_filter_to_sqlalchemy
         )
     ] + source_dependent_filters(protein)
 
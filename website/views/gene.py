@@ -7,21 +7,22 @@ from sqlalchemy.sql.elements import TextClause
 
 from models import Protein, Cancer, InheritedMutation, Disease, ClinicalData
 from models import Mutation
+from models import MutationSiteImpact
+from models import ProteinSummary
 from models import Gene
 from models import Site
 from models import GeneList
 from models import GeneListEntry
 from sqlalchemy import func, text
 from sqlalchemy import distinct
-from sqlalchemy import case
-from sqlalchemy import literal_column
 from database import db
 from helpers.views import AjaxTableView
 from helpers.filters import FilterManager, joined_query
 from helpers.filters import Filter
+from helpers.filters import is_iterable_but_not_str
 from helpers.widgets import FilterWidget
 from .filters import source_filter_to_sqlalchemy, create_dataset_labels, source_dependent_filters, \
-    create_dataset_specific_widgets
+    create_dataset_specific_widgets, site_type_filter_to_sqlalchemy
 
 from sqlalchemy import and_
 import sqlalchemy
@@ -55,15 +56,71 @@ def select_filters(filters, models):
     return selected
 
 
-def prepare_subqueries(sql_filters, required_joins):
+# filters which are reflected by rows of ProteinSummary (or work on top of these)
+summarized_filters = {'Mutation.sources', 'Site.type', 'Gene.has_ptm_muts', 'Gene.is_known_kinase'}
+
+
+def get_summary_key(filter_manager):
+    """Return (source, site_type) of ProteinSummary rows corresponding to
+
+    the state of given filter manager, or None if ad hoc filters are active.
+    """
+    active = filter_manager._get_non_trivial_active()
+
+    if any(filter_.id not in summarized_filters for filter_ in active):
+        return None
+
+    key = []
+    for filter_id, choices in (
+        ('Mutation.sources', ProteinSummary.sources),
+        ('Site.type', ProteinSummary.site_types)
+    ):
+        value = filter_manager.get_value(filter_id) or ''
+        if is_iterable_but_not_str(value):
+            if len(value) > 1:
+                return None
+            value = value[0] if value else ''
+        if value not in choices:
+            return None
+        key.append(value)
+
+    return tuple(key)
+
+
+def prepare_summary_subqueries(source, site_type):
+    """Return sub-queries selecting precomputed counts from ProteinSummary,
+
+    in the same order as prepare_subqueries (not labelled though).
+    """
+    def precomputed(column):
+        return (
+            db.session.query(column)
+            .filter(
+                ProteinSummary.protein_id == Protein.id,
+                ProteinSummary.source == source,
+                ProteinSummary.site_type == site_type
+            )
+        )
+
+    return (
+        precomputed(ProteinSummary.mutations_count),
+        precomputed(ProteinSummary.ptm_mutations_count),
+        precomputed(ProteinSummary.sites_count)
+    )
+
+
+def prepare_subqueries(sql_filters, required_joins, summary_key=None):
     """Return three sub-queries suitable for use in protein queries which are:
         - mutations count (muts_cnt),
         - PTM mutations count (ptm_muts_cnt),
         - sites count (ptm_sites_cnt)
 
     Returned sub-queries are labelled as shown in parentheses above.
-    """
 
+    If summary_key (see get_summary_key) is given, the counts are read from
+    ProteinSummary; these are computed on the fly only for proteins which
+    do not have precomputed counts.
+    """
     any_site_filters = select_filters(sql_filters, [Site])
     any_muts_filters = select_filters(sql_filters, [Mutation, InheritedMutation, ClinicalData, Disease, Cancer])
 
@@ -80,28 +137,11 @@ def prepare_subqueries(sql_filters, required_joins):
 
     if any_site_filters:
         ptm_muts = (
-            db.session.query(
-                func.count(distinct(case(
-                    [
-                        (
-                            (
-                                Site.position.between(
-                                    Mutation.position - 7,
-                                    Mutation.position + 7
-                                )
-                            ),
-                            Mutation.id
-                        )
-                    ],
-                    else_=literal_column('NULL')
-                )))
-            )
-            .filter(and_(
-                Mutation.protein_id == Protein.id,
-                Site.protein_id == Protein.id,
-                Mutation.precomputed_is_ptm
-            ))
-            .join(Site, Site.protein_id == Mutation.protein_id)
+            db.session.query(func.count(distinct(Mutation.id)))
+            .select_from(Mutation)
+            .filter(Mutation.protein_id == Protein.id)
+            .join(MutationSiteImpact, MutationSiteImpact.mutation_id == Mutation.id)
+            .join(Site, Site.id == MutationSiteImpact.site_id)
         )
         ptm_muts = (
             joined_query(ptm_muts, required_joins)
@@ -126,18 +166,26 @@ def prepare_subqueries(sql_filters, required_joins):
         muts = muts.filter(Mutation.is_confirmed == True)
         ptm_muts = ptm_muts.filter(Mutation.is_confirmed == True)
 
-    muts = muts.label('muts_cnt')
-    ptm_muts = ptm_muts.label('ptm_muts_cnt')
-
     sites = (
         db.session.query(func.count(Site.id))
         .filter(
             Site.protein_id == Protein.id,
         )
         .filter(and_(*select_filters(sql_filters, [Site])))
-    ).label('ptm_sites_cnt')
+    )
+
+    counts = [muts, ptm_muts, sites]
 
-    return muts, ptm_muts, sites
+    if summary_key:
+        counts = [
+            func.coalesce(precomputed.as_scalar(), live.as_scalar())
+            for precomputed, live in zip(prepare_summary_subqueries(*summary_key), counts)
+        ]
+
+    return tuple(
+        count.label(label)
+        for count, label in zip(counts, ('muts_cnt', 'ptm_muts_cnt', 'ptm_sites_cnt'))
+    )
 
 
 class GeneViewFilters(FilterManager):
@@ -154,7 +202,7 @@ class GeneViewFilters(FilterManager):
             Filter(
                 Site, 'type', comparators=['in'],
                 choices=Site.types,
-                as_sqlalchemy=True
+                as_sqlalchemy=site_type_filter_to_sqlalchemy
             ),
             Filter(
                 Gene, 'has_ptm_muts',
@@ -212,7 +260,8 @@ def make_widgets(filter_manager, include_dataset_specific=False):
 
 def ajax_query(sql_filters, joins):
 
-    muts, ptm_muts, sites = prepare_subqueries(sql_filters, joins)
+    summary_key = get_summary_key(GeneViewFilters())
+    muts, ptm_muts, sites = prepare_subqueries(sql_filters, joins, summary_key)
 
     protein_filters = select_filters(sql_filters, [Protein])
 
@@ -236,7 +285,8 @@ def ajax_query(sql_filters, joins):
 
 def ajax_query_count(sql_filters, joins):
 
-    muts, ptm_muts, sites = prepare_subqueries(sql_filters, joins)
+    summary_key = get_summary_key(GeneViewFilters())
+    muts, ptm_muts, sites = prepare_subqueries(sql_filters, joins, summary_key)
     protein_filters = select_filters(sql_filters, [Protein])
     textutal_filters = select_textual_filters(sql_filters)
 
@@ -295,7 +345,8 @@ class GeneView(FlaskView):
         gene_list = GeneList.query.filter_by(name=list_name).first_or_404()
 
         def query_constructor(sql_filters, joins):
-            muts, ptm_muts, sites = prepare_subqueries(sql_filters, joins)
+            summary_key = get_summary_key(GeneViewFilters())
+            muts, ptm_muts, sites = prepare_subqueries(sql_filters, joins, summary_key)
 
             textutal_filters = select_textual_filters(sql_filters)
             textutal_filters.append(text('muts_cnt > 0'))
@@ -321,7 +372,8 @@ class GeneView(FlaskView):
             )
 
         def count_query_constructor(sql_filters, joins):
-            muts, ptm_muts, sites = prepare_subqueries(sql_filters, joins)
+            summary_key = get_summary_key(GeneViewFilters())
+            muts, ptm_muts, sites = prepare_subqueries(sql_filters, joins, summary_key)
 
             textutal_filters = select_textual_filters(sql_filters)
             textutal_filters.append(text('muts_cnt > 0'))
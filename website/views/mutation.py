@@ -48,7 +48,7 @@ class MutationView(FlaskView):
         user_datasets = []
 
         for dataset in current_user.datasets:
-            if mutation in dataset.mutations:
+            if dataset.contains(mutation):
                 datasets.append({
                     'filter': 'UserMutations.sources:in:' + dataset.uri,
                     'name': dataset.name,
@@ -8,10 +8,14 @@ from flask import url_for
 from flask_login import current_user
 
 from helpers.filters import Filter
+from helpers.views import conditional_get
 from helpers.widgets import FilterWidget
 from models import Mutation
 from views._commons import drugs_interacting_with_kinases
-from views.abstract_protein import AbstractProteinView, get_raw_mutations, GracefulFilterManager, ProteinRepresentation
+from views.abstract_protein import AbstractProteinView, GracefulFilterManager, ProteinRepresentation
+from views.abstract_protein import protein_filters_scope
+from views.abstract_protein import cached_response, count_by_protein, raw_mutations_filter
+from views.abstract_protein import prerendered_or_rendered
 from .filters import common_filters, ProteinFiltersData
 from .filters import create_widgets
 
@@ -40,7 +44,7 @@ class NetworkViewFilters(GracefulFilterManager):
             js_toggle('collide_drugs'),
         ]
 
-        super().__init__(filters)
+        super().__init__(filters, state_scope=protein_filters_scope(protein, **kwargs))
         self.update_from_request(request)
 
 
@@ -73,22 +77,32 @@ def divide_muts_by_sites(mutations, sites):
 
 class NetworkRepresentation(ProteinRepresentation):
 
+    loading_profile = 'network'
+
     def __init__(self, protein, filter_manager, include_kinases_from_groups=False):
 
         super().__init__(protein, filter_manager, include_kinases_from_groups)
 
         sites, kinases, kinase_groups = self.get_sites_and_kinases()
 
-        kinases_counts = dict()
-        for kinase in kinases:
-            if kinase.protein:
-
-                count = get_raw_mutations(kinase.protein, filter_manager, count=True)
+        # KINASES NOT MAPPED TO PROTEINS ARE NOT SHOWN
+        mapped_kinases = [kinase for kinase in kinases if kinase.protein]
 
-                # related discussion: #72
-                kinases_counts[kinase] = count
+        # mutations of all kinases are counted with a single grouped query
+        mutations_counts = count_by_protein(
+            filter_manager, Mutation,
+            raw_mutations_filter(
+                filter_manager,
+                Mutation.protein_id.in_([kinase.protein.id for kinase in mapped_kinases]),
+                [kinase.protein.id for kinase in mapped_kinases]
+            )
+        ) if mapped_kinases else {}
 
-                # KINASES NOT MAPPED TO PROTEINS ARE NOT SHOWN
+        # related discussion: #72
+        kinases_counts = {
+            kinase: mutations_counts[kinase.protein.id]
+            for kinase in mapped_kinases
+        }
 
         protein_kinases_names = [kinase.name for kinase in kinases]
 
@@ -162,19 +176,30 @@ class NetworkRepresentation(ProteinRepresentation):
     def prepare_site(self, site):
         site_mutations = self.muts_by_site[site]
 
-        mutations = [
-            {
+        mutations = []
+        mimp_losses = []
+        mimp_losses_family = []
+        mimp_gains = []
+        mimp_gains_family = []
+
+        for mutation in site_mutations:
+            mutations.append({
                 'ref': mutation.ref,
                 'pos': mutation.position,
                 'alt': mutation.alt,
                 'impact': mutation.impact_on_specific_ptm(site)
-            }
-            for mutation in site_mutations
-        ]
+            })
+            for mimp in mutation.meta_MIMP:
+                if mimp.is_gain:
+                    mimp_gains.append(mimp.pwm)
+                    mimp_gains_family.append(mimp.pwm_family)
+                else:
+                    mimp_losses.append(mimp.pwm)
+                    mimp_losses_family.append(mimp.pwm_family)
 
         site_kinases = self.get_site_kinases(site)
         site_kinase_groups = self.get_site_kinase_groups(site)
-        # TODO: do not iterate over mutations times mimp four times
+
         return {
             'position': site.position,
             'residue': site.residue,
@@ -185,30 +210,10 @@ class NetworkRepresentation(ProteinRepresentation):
             'sequence': site.sequence,
             'mutations_count': len(site_mutations),
             'mutations': mutations,
-            'mimp_losses': [
-                mimp.pwm
-                for mutation in site_mutations
-                for mimp in mutation.meta_MIMP
-                if mimp.is_loss
-            ],
-            'mimp_losses_family': [
-                mimp.pwm_family
-                for mutation in site_mutations
-                for mimp in mutation.meta_MIMP
-                if mimp.is_loss
-            ],
-            'mimp_gains_family': [
-                mimp.pwm_family
-                for mutation in site_mutations
-                for mimp in mutation.meta_MIMP
-                if mimp.is_gain
-            ],
-            'mimp_gains': [
-                mimp.pwm
-                for mutation in site_mutations
-                for mimp in mutation.meta_MIMP
-                if mimp.is_gain
-            ],
+            'mimp_losses': mimp_losses,
+            'mimp_losses_family': mimp_losses_family,
+            'mimp_gains_family': mimp_gains_family,
+            'mimp_gains': mimp_gains,
             'impact': self.most_significant_impact(set(
                 mutation['impact']
                 for mutation in mutations
@@ -309,6 +314,17 @@ class PredictedNetworkRepresentation(NetworkRepresentation):
         })
 
 
+def render_network(protein, filter_manager):
+    return NetworkRepresentation(protein, filter_manager).as_json()
+
+
+def network_as_json(protein, filter_manager, include_mimp_gain_kinases=False):
+    """Network representation data, served pre-rendered where possible."""
+    if include_mimp_gain_kinases:
+        return create_representation(protein, filter_manager, True).as_json()
+    return prerendered_or_rendered('network', render_network, protein, filter_manager)
+
+
 def create_representation(protein, filter_manager, include_mimp_gain_kinases=False):
     if include_mimp_gain_kinases:
         representation = PredictedNetworkRepresentation(protein, filter_manager)
@@ -408,34 +424,36 @@ class NetworkView(AbstractProteinView):
             headers={'Content-disposition': 'attachment; filename="%s"' % filename}
         )
 
+    @conditional_get
     def predicted_representation(self, refseq):
         """Representation (of predicted network) exposed to an API user"""
         return self.representation(refseq, include_mimp_gain_kinases=True)
 
+    @conditional_get
+    @cached_response
     def representation(self, refseq, include_mimp_gain_kinases=False):
         """Representation (of network) exposed to an API user"""
 
         protein, filter_manager = self.get_protein_and_manager(refseq)
 
-        representation = create_representation(protein, filter_manager, include_mimp_gain_kinases)
-
-        response = {'network': representation.as_json()}
+        response = {'network': network_as_json(protein, filter_manager, include_mimp_gain_kinases)}
 
         return jsonify(response)
 
+    @conditional_get
     def predicted_data(self, refseq):
         return self.data(refseq, include_mimp_gain_kinases=True)
 
+    @conditional_get
+    @cached_response
     def data(self, refseq, include_mimp_gain_kinases=False):
         """Internal endpoint used for network rendering and asynchronous updates"""
 
         protein, filter_manager = self.get_protein_and_manager(refseq)
 
-        representation = create_representation(protein, filter_manager, include_mimp_gain_kinases)
-
         response = {
             'content': {
-                'network': representation.as_json(),
+                'network': network_as_json(protein, filter_manager, include_mimp_gain_kinases),
                 'clone_by_site': filter_manager.get_value('JavaScript.clone_by_site'),
                 'show_sites': filter_manager.get_value('JavaScript.show_sites'),
                 'collide_drugs': filter_manager.get_value('JavaScript.collide_drugs'),
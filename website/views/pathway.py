@@ -7,6 +7,7 @@ from database import db, levenshtein_sorted
 from models import Pathway, GeneList, GeneListEntry, Mutation, Protein, Gene
 from sqlalchemy import or_, func, and_, text
 from helpers.views import AjaxTableView
+from search.text import text_filter
 
 
 def search_filter(query):
@@ -16,7 +17,10 @@ def search_filter(query):
             Pathway.reactome.like(query + '%')
         )
     else:
-        return Pathway.description.like('%' + query + '%')
+        return text_filter(
+            'pathway_description', Pathway.id, query,
+            fallback=Pathway.description.like('%' + query + '%')
+        )
 
 
 def search_sort(query, q, sort_column, order):
@@ -0,0 +1,115 @@
+"""Offline rendering of the heaviest representations of proteins.
+
+Needle plots and kinase networks of preferred isoforms (which are shown
+by default) are rendered under default filters and stored compressed
+as PrerenderedRepresentation; the views serve these directly when the
+filters of a request are all set to defaults.
+"""
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import func
+
+from app import celery
+from database import db
+from helpers.progress import ProgressReporter, print_publisher
+from models import Gene, Protein, PrerenderedRepresentation
+from response_cache import get_data_release
+from .network import NetworkViewFilters, render_network
+from .sequence import SequenceViewFilters, render_sequence
+
+
+# kind: (filter manager class, function rendering the representation data)
+renderers = OrderedDict([
+    ('sequence', (SequenceViewFilters, render_sequence)),
+    ('network', (NetworkViewFilters, render_network))
+])
+
+
+def proteins_to_prerender(kinds, release):
+    """Ids of preferred isoforms which lack any of representations of given kinds
+    in given release (so an interrupted job can be resumed from where it ended).
+    """
+    up_to_date = (
+        db.session.query(PrerenderedRepresentation.protein_id)
+        .filter(
+            PrerenderedRepresentation.release == release,
+            PrerenderedRepresentation.kind.in_(kinds)
+        )
+        .group_by(PrerenderedRepresentation.protein_id)
+        .having(func.count(PrerenderedRepresentation.id) == len(kinds))
+    )
+    query = (
+        db.session.query(Gene.preferred_isoform_id)
+        .filter(Gene.preferred_isoform_id.isnot(None))
+        .filter(~Gene.preferred_isoform_id.in_(up_to_date))
+        .order_by(Gene.preferred_isoform_id)
+    )
+    return [protein_id for protein_id, in query]
+
+
+def prerender(proteins_ids, kinds, release):
+    """Render and store representations of given proteins, under default filters.
+
+    Returns:
+        number of rendered proteins
+    """
+    proteins = Protein.query.filter(Protein.id.in_(proteins_ids))
+
+    for protein in proteins:
+        for kind in kinds:
+            filters_class, render = renderers[kind]
+            # filter managers read the filters from the request,
+            # an empty one gives the default values
+            with current_app.test_request_context():
+                data = render(protein, filters_class(protein))
+            PrerenderedRepresentation.store(protein, kind, release, data)
+
+    db.session.commit()
+
+    return len(proteins_ids)
+
+
+@celery.task
+def prerender_task(proteins_ids, kinds, release):
+    return prerender(proteins_ids, kinds, release)
+
+
+def prerender_all(kinds=tuple(renderers), chunk_size=50, use_celery=False):
+    """Pre-render representations of all preferred isoforms (skipping those
+    already rendered for the current data release), reporting the throughput.
+
+    With use_celery the chunks of proteins are distributed over workers.
+    """
+    release = get_data_release()
+    proteins_ids = proteins_to_prerender(kinds, release)
+    total = len(proteins_ids)
+
+    print(
+        'Pre-rendering %s representations of %s proteins (data release %s)'
+        % (', '.join(kinds), total, release)
+    )
+
+    chunks = [
+        proteins_ids[i:i + chunk_size]
+        for i in range(0, total, chunk_size)
+    ]
+
+    if use_celery:
+        # all the chunks are queued first, so the workers run in parallel
+        tasks = [prerender_task.delay(chunk, kinds, release) for chunk in chunks]
+        results = (task.get() for task in tasks)
+    else:
+        results = (prerender(chunk, kinds, release) for chunk in chunks)
+
+    reporter = ProgressReporter(
+        total,
+        print_publisher('Pre-rendering', 'proteins'),
+        every=chunk_size,
+        interval=10
+    )
+
+    for rendered_count in results:
+        reporter.update(rendered_count)
+
+    return reporter.done
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from operator import attrgetter
 
 from flask import jsonify, session
@@ -7,15 +8,97 @@ from flask import request
 from flask import url_for
 from flask_classful import route
 from sqlalchemy import and_
+from sqlalchemy.orm import joinedload, selectinload
 
-from helpers.views import AjaxTableView
-from models import Mutation, Site
+from helpers.views import AjaxTableView, conditional_get
+from models import Drug, Gene, Mutation, Site
 from models import Protein
 from .abstract_protein import AbstractProteinView, get_raw_mutations
+from .abstract_protein import cached_response, count_by_protein, raw_mutations_filter
 from .chromosome import represent_mutations
 from .sequence import SequenceViewFilters, prepare_sites
 
 
+def get_proteins_details(proteins, filter_manager):
+    """Summarise proteins for kinase tooltips: counts of sites, mutations
+    and PTM mutations (under active filters), metadata of mutations
+    from the currently selected source and drugs targeting the genes.
+
+    The data of all the proteins are retrieved together with a constant
+    number of queries: counts are grouped by protein and PTM mutations
+    are recognised with Mutation.is_ptm_distal (precomputed or checked
+    against the sites in the database) rather than one by one.
+
+    Returns:
+        dict: refseq -> details
+    """
+    if not proteins:
+        return {}
+
+    proteins_ids = [protein.id for protein in proteins]
+
+    source = filter_manager.get_value('Mutation.sources')
+    source_column = Mutation.source_fields[source]
+
+    def confirmed_mutations(*criteria):
+        def custom_filter(q):
+            return and_(
+                q,
+                Mutation.protein_id.in_(proteins_ids),
+                Mutation.is_confirmed == True,
+                *criteria
+            )
+        return custom_filter
+
+    mutations_counts = count_by_protein(filter_manager, Mutation, confirmed_mutations())
+    ptm_mutations_counts = count_by_protein(
+        filter_manager, Mutation,
+        confirmed_mutations(Mutation.is_ptm_distal)
+    )
+    sites_counts = count_by_protein(
+        filter_manager, Site,
+        lambda q: and_(q, Site.protein_id.in_(proteins_ids))
+    )
+
+    if source in ('1KGenomes', 'ESP6500'):
+        summary_getter = attrgetter('affected_populations')
+    else:
+        def summary_getter(meta_column):
+            return meta_column.summary()
+
+    # note: raw_mutations_filter may switch the sources filter to
+    # user's mutations, so it has to be used after the counts above
+    meta = defaultdict(set)
+
+    raw_mutations = filter_manager.query_all(
+        Mutation,
+        raw_mutations_filter(filter_manager, Mutation.protein_id.in_(proteins_ids), proteins_ids),
+        lambda query: query.options(selectinload(source_column))
+    )
+
+    for mutation in raw_mutations:
+        meta_column = getattr(mutation, source_column)
+        if not meta_column:
+            continue
+        meta[mutation.protein_id].update(
+            summary_getter(meta_column)
+        )
+
+    return {
+        protein.refseq: {
+            'is_preferred': protein.gene.preferred_isoform_id == protein.id,
+            'gene_name': protein.gene_name,
+            'refseq': protein.refseq,
+            'sites_count': sites_counts[protein.id],
+            'muts_count': mutations_counts[protein.id],
+            'ptm_muts': ptm_mutations_counts[protein.id],
+            'meta': list(meta[protein.id]),
+            'drugs': [drug.to_json() for drug in protein.gene.drugs]
+        }
+        for protein in proteins
+    }
+
+
 class ProteinView(AbstractProteinView):
     """Single protein view: includes needleplot and sequence"""
 
@@ -49,37 +132,40 @@ class ProteinView(AbstractProteinView):
         )
     )
 
+    @conditional_get
     def details(self, refseq):
         """Internal endpoint used for kinase tooltips"""
         protein, filter_manager = self.get_protein_and_manager(refseq)
 
-        source = filter_manager.get_value('Mutation.sources')
+        details = get_proteins_details([protein], filter_manager)
 
-        source_column = Mutation.source_fields[source]
+        return jsonify(details[protein.refseq])
 
-        json = protein.to_json(data_filter=filter_manager.apply)
+    @conditional_get
+    @route('details_batch')
+    def details_batch(self):
+        """Internal endpoint used for kinase tooltips, answering for many proteins at once.
 
-        meta = set()
+        Refseqs are expected as a comma-separated list in 'refseqs' argument;
+        the response maps each of found refseqs to its details (as in details()).
+        The result depends only on the set of refseqs and on the filters,
+        so it can be cached under (sorted refseqs, filters URL string) key.
+        """
+        refseqs = sorted(set(request.args.get('refseqs', '').split(',')) - {''})
 
-        if source in ('1KGenomes', 'ESP6500'):
-            summary_getter = attrgetter('affected_populations')
-        else:
-            def summary_getter(meta_column):
-                return meta_column.summary()
-
-        for mutation in get_raw_mutations(protein, filter_manager):
-            meta_column = getattr(mutation, source_column)
-            if not meta_column:
-                continue
-            meta.update(
-                summary_getter(meta_column)
+        proteins = (
+            Protein.query
+            .filter(Protein.refseq.in_(refseqs))
+            .options(
+                joinedload(Protein.gene).selectinload(Gene.drugs).selectinload(Drug.groups),
+                *Protein.loading_options('list')
             )
+            .all()
+        ) if refseqs else []
 
-        json['meta'] = list(meta)
-        json['drugs'] = [drug.to_json() for drug in protein.gene.drugs]
-
-        return jsonify(json)
+        return jsonify(get_proteins_details(proteins, self.filter_manager))
 
+    @conditional_get
     def mutation(self, refseq, position, alt):
         """REST API endpoint"""
         from database import get_or_create
@@ -118,6 +204,8 @@ class ProteinView(AbstractProteinView):
 
         return jsonify(parsed_mutations)
 
+    @conditional_get
+    @cached_response
     def known_mutations(self, refseq):
         """REST API endpoint"""
 
@@ -136,6 +224,8 @@ class ProteinView(AbstractProteinView):
 
         return jsonify(parsed_mutations)
 
+    @conditional_get
+    @cached_response
     def sites(self, refseq):
         """REST API endpoint"""
 
@@ -1,6 +1,12 @@
 import json
+from math import ceil
+from os import path
 from collections import defaultdict
-from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError
+from functools import partial
+from threading import Lock
+from time import time
 from urllib.parse import unquote
 
 from flask import make_response, redirect, abort
@@ -10,10 +16,13 @@ from flask import jsonify
 from flask import url_for
 from flask import flash
 from flask import current_app
+from flask import copy_current_request_context
+from celery import chord
+from celery.utils import uuid
 from flask_classful import FlaskView
 from flask_classful import route
 from flask_login import current_user
-from sqlalchemy.orm import Load
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm.exc import NoResultFound
 from werkzeug.datastructures import FileStorage
 
@@ -29,12 +38,16 @@ from models import UsersMutationsDataset
 from models import UserUploadedMutation
 from sqlalchemy import exists, or_, text
 from helpers.filters import FilterManager, quote_if_needed
+from helpers.parsers import UploadedVCF
+from helpers.progress import ProgressReporter, celery_publisher
 from helpers.filters import Filter
+from helpers.views import conditional_get
 from helpers.widgets import FilterWidget
 from views.gene import prepare_subqueries
-from ._commons import get_protein_muts
-from database import db, levenshtein_sorted, bdb
-from search.gene import GeneMatch, search_feature_engines
+from ._commons import get_protein_muts, MutationsLookup
+from database import db, levenshtein_sorted, bdb, search_index, get_engine
+from search.gene import GeneMatch, search_feature_engines, search_in_index
+from search.text import search_text, text_filter
 
 search_features = [engine.name for engine in search_feature_engines]
 
@@ -48,11 +61,7 @@ def create_engines(options=None):
 
 advanced_search_engines = create_engines()
 search_bar_search_engines = create_engines(
-    [
-
-        Load(Gene).defer('full_name').defer('strand').defer('chrom').defer('entrez_id'),
-        Load(Protein).defer('summary').defer('sequence').defer('disorder_map')
-    ]
+    Gene.loading_options('list') + Protein.loading_options('list')
 )
 
 
@@ -79,6 +88,9 @@ def search_proteins(
             the search; must be a subset of search.gene.search_features
         engines:
             mapping of engine name => engine instance of engines to use
+
+    Indexable features are looked up in the in-memory search_index
+    (if it was built and there are no SQL filters to apply).
     """
     if isinstance(features, str):
         features = [features]
@@ -99,9 +111,21 @@ def search_proteins(
                 ' sqlalchemy interface'
             )
 
-    matches = []
+    # the in-memory index cannot evaluate SQL filters
+    if sql_filters:
+        indexed_features = []
+    else:
+        indexed_features = [
+            feature
+            for feature in features
+            if engines[feature].indexable and feature in search_index
+        ]
+
+    matches = search_in_index(phrase, indexed_features, engines, limit)
 
     for feature in features:
+        if feature in indexed_features:
+            continue
         search_function = engines[feature].search
         results = search_function(phrase, sql_filters, limit=limit)
         matches.extend(results)
@@ -122,45 +146,55 @@ def search_proteins(
 
 class MutationSearch:
 
-    def __init__(self, vcf_file=None, text_query=None, filter_manager=None):
+    def __init__(self, vcf_file=None, text_query=None, filter_manager=None, record_lines=False):
         """Performs search for known and novel mutations from provided VCF file and/or text query.
 
         Stop codon mutations are not considered.
 
         Args:
-            vcf_file: a file object containing data in Variant Call Format
+            vcf_file: lines of a file in Variant Call Format (e.g. UploadedVCF)
             text_query: a string of multiple lines, where each line represents either:
                  - a genomic mutation (e.g. chr12 57490358 C A) or
                  - a protein mutation (e.g. STAT6 W737C)
                 Entries from both VCF file and text input will be merged.
             filter_manager: FilterManager instance used to filter out unwanted mutations
+            record_lines: keep outcome of each parsed line (in order), so that
+                searches of parts of a query can be merged (see merge)
         """
         self.query = ''
         self.results = {}
         self.without_mutations = []
         self.badly_formatted = []
         self.hidden_results_cnt = 0
-        self._progress = 0
-        self._total = 0
-        if vcf_file:
-            if type(vcf_file) is FileStorage:
-                # as bad as it can be, but usually the vcf file will be a list of lines already
-                vcf_file = vcf_file.readlines()
-            self._total += len(vcf_file)
-        if text_query:
-            self._total += sum(1 for _ in text_query.splitlines())
+        # (query line, items) tuples; items are None if nothing was found,
+        # or an empty list if everything found was filtered out
+        self.lines = [] if record_lines else None
+        if vcf_file and type(vcf_file) is FileStorage:
+            # as bad as it can be, but usually the vcf file will be a list of lines already
+            vcf_file = vcf_file.readlines()
+
+        publish = celery_publisher(celery.current_task) if celery.current_task else None
+        total = None
+
+        # the progress is only published by Celery tasks, which get lists of
+        # lines or chunks of uploaded files of known length (see split_search);
+        # otherwise counting the lines of an upload would need another pass
+        if publish:
+            lines_count = (
+                (len(vcf_file) if vcf_file else 0) +
+                (sum(1 for _ in text_query.splitlines()) if text_query else 0)
+            )
+            # each line is parsed, looked up and collected (an estimate,
+            # corrected when the number of look-ups is known)
+            total = 3 * lines_count
 
-        if filter_manager:
-            def data_filter(elements):
-                return filter_manager.apply(
-                    elements,
-                    itemgetter=itemgetter('mutation')
-                )
-        else:
-            def data_filter(elements):
-                return elements
+        self.reporter = ProgressReporter(total, publish)
 
-        self.data_filter = data_filter
+        self.filter_manager = filter_manager
+
+        # queries are parsed first, then resolved all at once (see MutationsLookup)
+        self.lookup = MutationsLookup()
+        self.parsed_lines = []
 
         if vcf_file:
             self.parse_vcf(vcf_file)
@@ -169,17 +203,46 @@ class MutationSearch:
             self.query += text_query
             self.parse_text(text_query)
 
+        if self.reporter.total is not None:
+            self.reporter.total = self.reporter.done + len(self.lookup) + len(self.parsed_lines)
+
+        self.lookup.resolve(progress=self.progress)
+        self.data_filter = self.create_data_filter()
+
+        for key, query_line in self.parsed_lines:
+            self.add_mutation_items(self.lookup.items(key), query_line)
+
         # when parsing is complete, quickly forget where is such complex object
         # like filter_manager so any instance of this class can be pickled.
+        self.filter_manager = None
         self.data_filter = None
+        self.lookup = None
+        self.parsed_lines = None
+        self.reporter = None
+
+    def create_data_filter(self):
+        """Filter all the mutations found at once, so each is tested only once."""
+        if not self.filter_manager:
+            def data_filter(elements):
+                return elements
+            return data_filter
+
+        accepted = {
+            id(mutation)
+            for mutation in self.filter_manager.apply(self.lookup.mutations())
+        }
+
+        def data_filter(elements):
+            return [
+                element
+                for element in elements
+                if id(element['mutation']) in accepted
+            ]
+
+        return data_filter
 
     def progress(self):
-        self._progress += 1
-        if celery.current_task:
-            celery.current_task.update_state(
-                state='PROGRESS',
-                meta={'progress': self._progress / self._total}
-            )
+        self.reporter.update()
 
     def add_mutation_items(self, items, query_line):
 
@@ -187,14 +250,22 @@ class MutationSearch:
 
         if not items:
             self.without_mutations.append(query_line)
+            if self.lines is not None:
+                self.lines.append((query_line, None))
             return False
 
         items = self.data_filter(items)
 
+        if self.lines is not None:
+            self.lines.append((query_line, items))
+
         if not items:
             self.hidden_results_cnt += 1
             return False
 
+        self.add_results(items, query_line)
+
+    def add_results(self, items, query_line):
         if query_line in self.results:
             for item in self.results[query_line]:
                 item['mutation'].meta_user.count += 1
@@ -206,9 +277,43 @@ class MutationSearch:
                 )
             self.results[query_line] = items
 
+    @classmethod
+    def merge(cls, parts):
+        """Combine searches of consecutive parts of a query (created with record_lines).
+
+        The result is the same as of a search of the whole query at once:
+        the lines are replayed in order, so that the counts of duplicated
+        lines are summed up; mutations found in many parts (which come
+        from different processes) are replaced by a single instance.
+        """
+        merged = cls()
+        mutations = {}
+
+        for part in parts:
+            merged.query += part.query
+            merged.badly_formatted.extend(part.badly_formatted)
+
+            for query_line, items in part.lines:
+                if items is None:
+                    merged.without_mutations.append(query_line)
+                    continue
+                if not items:
+                    merged.hidden_results_cnt += 1
+                    continue
+                for item in items:
+                    mutation = item['mutation']
+                    key = (mutation.protein_id, mutation.position, mutation.alt)
+                    mutation = mutations.setdefault(key, mutation)
+                    item['mutation'] = mutation
+                    item['protein'] = mutation.protein
+                merged.add_results(items, query_line)
+
+        return merged
+
     def parse_vcf(self, vcf_file):
 
         for line in vcf_file:
+            self.progress()
             line = line.decode('latin1').strip()
             if line.startswith('#'):
                 continue
@@ -228,12 +333,12 @@ class MutationSearch:
             alts = alts.split(',')
             for alt in alts:
 
-                items = bdb.get_genomic_muts(chrom, pos, ref, alt)
+                key = self.lookup.add_genomic(chrom, pos, ref, alt)
 
                 chrom = 'chr' + chrom
                 parsed_line = ' '.join((chrom, pos, ref, alt)) + '\n'
 
-                self.add_mutation_items(items, parsed_line)
+                self.parsed_lines.append((key, parsed_line))
 
                 # we don't have queries in our format for vcf files:
                 # those need to be built this way
@@ -242,22 +347,23 @@ class MutationSearch:
     def parse_text(self, text_query):
 
         for line in text_query.splitlines():
+            self.progress()
             data = line.strip().split()
             if len(data) == 4:
                 chrom, pos, ref, alt = data
                 chrom = chrom[3:]
 
-                items = bdb.get_genomic_muts(chrom, pos, ref, alt)
+                key = self.lookup.add_genomic(chrom, pos, ref, alt)
 
             elif len(data) == 2:
                 gene, mut = [x.upper() for x in data]
 
-                items = get_protein_muts(gene, mut)
+                key = self.lookup.add_proteomic(gene, mut)
             else:
                 self.badly_formatted.append(line)
                 continue
 
-            self.add_mutation_items(items, line)
+            self.parsed_lines.append((key, line))
 
 
 class Feature:
@@ -341,12 +447,167 @@ def make_widgets(filter_manager):
     }
 
 
+def vcf_uploads_directory():
+    return path.join(
+        path.dirname(path.dirname(path.realpath(__file__))),
+        current_app.config.get('VCF_UPLOAD_FOLDER', 'uploads/vcf')
+    )
+
+
+def remove_uploaded(vcf_file):
+    if isinstance(vcf_file, UploadedVCF):
+        vcf_file.remove()
+
+
 @celery.task
 def search_task(vcf_file, textarea_query, filter_manager, dataset_uri=None):
-    mutation_search = MutationSearch(vcf_file, textarea_query, filter_manager)
+    try:
+        mutation_search = MutationSearch(vcf_file, textarea_query, filter_manager)
+    finally:
+        remove_uploaded(vcf_file)
     return mutation_search, dataset_uri
 
 
+@celery.task
+def search_chunk_task(vcf_file, textarea_query, filter_manager):
+    try:
+        mutation_search = MutationSearch(vcf_file, textarea_query, filter_manager, record_lines=True)
+    finally:
+        remove_uploaded(vcf_file)
+    return mutation_search
+
+
+@celery.task
+def merge_search_task(parts, dataset_uri=None):
+    return MutationSearch.merge(parts), dataset_uri
+
+
+@celery.task
+def split_search_task(vcf_file, textarea_query, filter_manager, dataset_uri, chunk_size, task_id):
+    """Split the search (see split_search) and submit it under given task_id.
+
+    The upload is read (and decompressed) here rather than in the request;
+    it is removed once split, the chunks are removed by the search tasks.
+    """
+    chunks = []
+    try:
+        chunks = split_search(vcf_file, textarea_query, chunk_size)
+        submit_search(chunks, textarea_query, filter_manager, dataset_uri, chunk_size, task_id)
+    except Exception as error:
+        for vcf_chunk, text_chunk in chunks:
+            remove_uploaded(vcf_chunk)
+        # otherwise the search would remain pending forever
+        celery.backend.mark_as_failure(task_id, error)
+        raise
+    finally:
+        remove_uploaded(vcf_file)
+
+
+def split_search(vcf_lines, textarea_query, chunk_size):
+    """Split the input of MutationSearch into chunks of at most chunk_size lines.
+
+    Queries (str) of the parts concatenated in order give the original query.
+    An UploadedVCF is split into new files (one per chunk, with the number
+    of lines known, so that the whole upload is read just once).
+
+    Returns:
+        list of (vcf lines, text query) tuples (one of those is always None)
+    """
+    chunks = []
+
+    if isinstance(vcf_lines, UploadedVCF):
+        chunks.extend(
+            (vcf_chunk, None)
+            for vcf_chunk in vcf_lines.split(chunk_size)
+        )
+    elif vcf_lines:
+        for i, line in enumerate(vcf_lines):
+            # MutationSearch stops reading VCF at the first empty line
+            if not line.decode('latin1').strip():
+                vcf_lines = vcf_lines[:i]
+                break
+        chunks.extend(
+            (vcf_lines[i:i + chunk_size], None)
+            for i in range(0, len(vcf_lines), chunk_size)
+        )
+
+    if textarea_query:
+        lines = textarea_query.splitlines(keepends=True)
+        chunks.extend(
+            (None, ''.join(lines[i:i + chunk_size]))
+            for i in range(0, len(lines), chunk_size)
+        )
+
+    return chunks
+
+
+def submit_search(chunks, textarea_query, filter_manager, dataset_uri=None, chunk_size=1000, task_id=None):
+    """Search the chunks (see split_search) in a single task if they fit in one chunk,
+    or on many workers otherwise. Returns id of the task to track (task_id, if given)."""
+    lines_count = sum(
+        len(vcf_chunk) if vcf_chunk is not None else len(text_chunk.splitlines())
+        for vcf_chunk, text_chunk in chunks
+    )
+
+    if lines_count > chunk_size:
+        return dispatch_search(chunks, filter_manager, dataset_uri, task_id)
+
+    vcf_chunk = next((vcf_chunk for vcf_chunk, text_chunk in chunks if vcf_chunk is not None), None)
+
+    return search_task.apply_async(
+        (vcf_chunk, textarea_query, filter_manager, dataset_uri),
+        task_id=task_id
+    ).task_id
+
+
+def dispatch_search(chunks, filter_manager, dataset_uri=None, task_id=None):
+    """Search chunks on many workers, merging the results in a chord callback.
+
+    Results of the chunk tasks are saved as a group under the id of
+    the callback (returned), so their progress can be tracked.
+    """
+    task_id = task_id or uuid()
+
+    subtasks = [
+        search_chunk_task.s(vcf_lines, textarea_query, filter_manager).set(task_id=uuid())
+        for vcf_lines, textarea_query in chunks
+    ]
+
+    chord(subtasks)(merge_search_task.s(dataset_uri).set(task_id=task_id))
+
+    celery.GroupResult(
+        task_id,
+        [celery.AsyncResult(subtask.id) for subtask in subtasks]
+    ).save()
+
+    return task_id
+
+
+def chunks_progress(task_id):
+    """Mean progress (0-1) of chunks of given search, or None if it was not split."""
+    chunks = celery.GroupResult.restore(task_id)
+
+    if not chunks:
+        return None
+
+    progress = 0
+    for chunk in chunks.results:
+        if chunk.status == 'SUCCESS':
+            progress += 1
+        elif chunk.status == 'PROGRESS':
+            progress += chunk.result.get('progress', 0)
+
+    return progress / len(chunks.results)
+
+
+def forget_search(celery_task):
+    chunks = celery.GroupResult.restore(celery_task.id)
+    if chunks:
+        chunks.forget()
+        chunks.delete()
+    celery_task.forget()
+
+
 class SearchView(FlaskView):
     """Enables searching in any of registered database models."""
 
@@ -391,15 +652,24 @@ class SearchView(FlaskView):
         if dataset.owner and dataset.owner != current_user:
             current_app.login_manager.unauthorized()
 
+        data = dataset.data
+
+        # proteins and mutations are retrieved only for lines of the current page
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = current_app.config.get('DATASET_PAGE_SIZE', 500)
+        pages_count = max(ceil(len(data.lines) / page_size), 1)
+
         response = make_response(template(
             'search/dataset.html',
             mutation_types=Mutation.types,
-            results=dataset.data.results,
+            results=data.results((page - 1) * page_size, page_size),
             widgets=make_widgets(filter_manager),
-            without_mutations=dataset.data.without_mutations,
-            query=dataset.data.query,
-            badly_formatted=dataset.data.badly_formatted,
-            dataset=dataset
+            without_mutations=data.without_mutations,
+            query=data.query,
+            badly_formatted=data.badly_formatted,
+            dataset=dataset,
+            page=page,
+            pages_count=pages_count
         ))
         return response
 
@@ -429,12 +699,19 @@ class SearchView(FlaskView):
         status = celery_task.status
 
         progress = 0
+        eta = None
         if status == 'SUCCESS':
             progress = 100
         elif status == 'PROGRESS':
             progress = celery_task.result.get('progress', 0)
+            eta = celery_task.result.get('eta')
+        elif status == 'PENDING':
+            progress = chunks_progress(task_id)
+            if progress:
+                status = 'PROGRESS'
+            progress = progress or 0
 
-        return jsonify({'status': status, 'progress': int(progress * 100)})
+        return jsonify({'status': status, 'progress': int(progress * 100), 'eta': eta})
 
     def progress(self, task_id):
 
@@ -451,6 +728,12 @@ class SearchView(FlaskView):
 
         progress = celery_task.result.get('progress', 0) if status == 'PROGRESS' else 0
 
+        if status == 'PENDING':
+            progress = chunks_progress(task_id)
+            if progress:
+                status = 'PROGRESS'
+            progress = progress or 0
+
         return make_response(template(
             'search/progress.html',
             task=celery_task,
@@ -470,43 +753,60 @@ class SearchView(FlaskView):
             vcf_file = request.files.get('vcf-file', False)
             store_on_server = request.form.get('store_on_server', False)
 
-            if not use_celery:
-                mutation_search = MutationSearch(vcf_file, textarea_query, filter_manager)
-
-            if store_on_server:
-                name = request.form.get('dataset_name', None)
-                if not name:
-                    name = 'Custom Dataset'
-
-                if current_user.is_authenticated:
-                    user = current_user
-                else:
-                    user = None
-                    flash(
-                        'To browse uploaded mutations easily in the '
-                        'future, please register or log in with this form',
-                        'warning'
+            if vcf_file:
+                # the file is read as a stream; Celery workers get only the path
+                vcf_file = UploadedVCF.save(vcf_file, vcf_uploads_directory())
+            else:
+                vcf_file = None
+
+            # the upload is removed even if the search (or saving) fails,
+            # unless it was handed over to Celery (see split_search_task)
+            try:
+                if not use_celery:
+                    mutation_search = MutationSearch(vcf_file, textarea_query, filter_manager)
+
+                if store_on_server:
+                    name = request.form.get('dataset_name', None)
+                    if not name:
+                        name = 'Custom Dataset'
+
+                    if current_user.is_authenticated:
+                        user = current_user
+                    else:
+                        user = None
+                        flash(
+                            'To browse uploaded mutations easily in the '
+                            'future, please register or log in with this form',
+                            'warning'
+                        )
+
+                    dataset = UsersMutationsDataset(
+                        name=name,
+                        data=mutation_search if not use_celery else None,
+                        owner=user
                     )
 
-                dataset = UsersMutationsDataset(
-                    name=name,
-                    data=mutation_search if not use_celery else None,
-                    owner=user
-                )
+                    db.session.add(dataset)
+                    db.session.commit()
 
-                db.session.add(dataset)
-                db.session.commit()
+                if use_celery:
+                    dataset_uri = dataset.uri if store_on_server else None
 
-            if use_celery:
-                mutation_search = search_task.delay(
-                    # vcf_file is not serializable but list of lines is
-                    vcf_file.readlines() if vcf_file else None,
-                    textarea_query,
-                    filter_manager,
-                    dataset.uri if store_on_server else None
-                )
+                    chunk_size = current_app.config.get('SEARCH_CHUNK_SIZE', 1000)
+
+                    # the id is known upfront, so the search can be tracked
+                    # before the upload is split (by the worker)
+                    task_id = uuid()
 
-                return redirect(url_for('SearchView:progress', task_id=mutation_search.task_id))
+                    split_search_task.delay(
+                        vcf_file, textarea_query, filter_manager,
+                        dataset_uri, chunk_size, task_id
+                    )
+                    vcf_file = None
+
+                    return redirect(url_for('SearchView:progress', task_id=task_id))
+            finally:
+                remove_uploaded(vcf_file)
 
         elif task_id:
             celery_task = celery.AsyncResult(task_id)
@@ -535,7 +835,7 @@ class SearchView(FlaskView):
             for items in mutation_search.results.values():
                 for item in items:
                     db.session.add(item['mutation'])
-            celery_task.forget()
+            forget_search(celery_task)
         else:
             mutation_search = MutationSearch()
 
@@ -562,6 +862,7 @@ class SearchView(FlaskView):
             widgets=make_widgets(filter_manager)
         )
 
+    @conditional_get
     def autocomplete_proteins(self, limit=20):
         """Autocompletion API for search Advanced Proteins Search."""
 
@@ -603,6 +904,7 @@ class SearchView(FlaskView):
         else:
             return redirect(url_for('SearchView:proteins', proteins=query))
 
+    @conditional_get
     def autocomplete_all(self):
         """
         Supports:
@@ -629,11 +931,23 @@ class SearchView(FlaskView):
 
         query = unquote(request.args.get('q')) or ''
 
-        items = []
+        providers = OrderedDict()
 
         if ' ' in query or query.upper().startswith('CHR'):
+            providers['mutations'] = partial(autocomplete_mutation, query)
+
+        providers['genes'] = partial(autocomplete_gene, query, limit=2 if ' ' in query else 3)
+        providers['pathways'] = partial(suggest_matching_pathways, query)
+        providers['cancers'] = partial(suggest_matching_cancers, query)
+        providers['diseases'] = partial(suggest_matching_diseases, query)
+
+        results = run_providers(providers)
+
+        items = []
+
+        if 'mutations' in results:
             # TODO: use exceptions for messaging control?
-            mutation_result = autocomplete_mutation(query)
+            mutation_result = results['mutations']
             if type(mutation_result) is tuple:
                 mutations, are_there_more_muts = mutation_result
                 items.extend(mutations)
@@ -646,41 +960,162 @@ class SearchView(FlaskView):
             else:
                 items.extend(mutation_result)
 
-        if ' ' in query:
-            genes, are_there_more_genes = autocomplete_gene(query, limit=2)
-        else:
-            genes, are_there_more_genes = autocomplete_gene(query, limit=3)
+        if 'genes' in results:
+            genes, are_there_more_genes = results['genes']
 
-        items.extend(genes)
-        if are_there_more_genes:
-            items.append({
-                'type': 'see_more',
-                'name': 'Show all genes matching <i>%s</i>' % query,
-                'url': url_for('SearchView:proteins', proteins=query)
-            })
+            items.extend(genes)
+            if are_there_more_genes:
+                items.append({
+                    'type': 'see_more',
+                    'name': 'Show all genes matching <i>%s</i>' % query,
+                    'url': url_for('SearchView:proteins', proteins=query)
+                })
 
-        pathways = suggest_matching_pathways(query)
+        for provider in ['diseases', 'pathways', 'cancers']:
+            items.extend(results.get(provider, []))
 
-        cancers = suggest_matching_cancers(query)
+        return json.dumps({'entries': items})
 
-        diseases = suggest_matching_diseases(query)
-        items.extend(diseases)
 
-        items.extend(pathways)
-        items.extend(cancers)
+# how long (in seconds) can each of suggestion providers take
+suggestions_time_budgets = {
+    'mutations': 1.5,
+    'genes': 1,
+    'pathways': 0.5,
+    'cancers': 0.5,
+    'diseases': 1
+}
 
-        return json.dumps({'entries': items})
+# the pool is created lazily, so each (forked) web worker process gets its own
+providers_pool = None
+providers_pool_lock = Lock()
 
 
-def suggest_matching_cancers(query, count=2):
-    cancers = levenshtein_sorted(Cancer.query.filter(
-        or_(
-            Cancer.code.ilike(query + '%'),
-            Cancer.name.ilike('%' + query + '%'),
+def get_providers_pool(workers):
+    global providers_pool
+    with providers_pool_lock:
+        if not providers_pool:
+            providers_pool = ThreadPoolExecutor(max_workers=workers)
+    return providers_pool
+
+
+def with_queries_timeout(provider, seconds):
+    """Make the provider's queries to the biological database give up after given time.
+
+    A thread cannot be stopped from outside, so a provider which exceeded
+    its budget would otherwise keep its thread (and database connection)
+    until its queries finish. The limit is set with MySQL's max_execution_time
+    (affecting SELECT statements only); other databases are left unbounded.
+    """
+    def bounded():
+        if get_engine('bio').dialect.name != 'mysql':
+            return provider()
+
+        connection = db.session.connection(mapper=Protein.__mapper__)
+        connection.execute(text('SET SESSION max_execution_time = :ms'), ms=int(seconds * 1000))
+        try:
+            return provider()
+        finally:
+            connection.execute(text('SET SESSION max_execution_time = 0'))
+
+    return bounded
+
+
+def run_providers(providers):
+    """Run suggestion providers on a bounded pool of threads (if configured).
+
+    Each provider runs in a copy of the current request context, and
+    therefore with its own database session. Results of providers which
+    exceeded their time budget (or the AUTOCOMPLETE_DEADLINE) are skipped.
+
+    Providers still waiting for a thread are cancelled once skipped, but
+    those already running cannot be interrupted: these are only bounded by
+    the timeout of their queries (see with_queries_timeout) and keep their
+    thread (of the per-process pool) until then.
+
+    Args:
+        providers: mapping of name => function returning suggestions
+
+    Returns:
+        mapping of name => result for providers which finished in time
+    """
+    workers = current_app.config.get('AUTOCOMPLETE_WORKERS')
+
+    if not workers:
+        return {
+            name: provider()
+            for name, provider in providers.items()
+        }
+
+    deadline = current_app.config.get('AUTOCOMPLETE_DEADLINE', 2)
+    pool = get_providers_pool(workers)
+    start = time()
+
+    def budget(name):
+        return min(suggestions_time_budgets.get(name, deadline), deadline)
+
+    futures = OrderedDict(
+        (
+            name,
+            pool.submit(copy_current_request_context(
+                with_queries_timeout(provider, budget(name))
+            ))
         )
-    ), Cancer.name, query).limit(count)
+        for name, provider in providers.items()
+    )
+
+    results = {}
+
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(start + budget(name) - time(), 0))
+        except TimeoutError:
+            # do not start it at all if it was still waiting for a thread
+            # (a running provider will carry on until its queries time out)
+            future.cancel()
+        except OperationalError:
+            # the queries of the provider exceeded the time limit
+            pass
+
+    return results
+
+
+gene_lists_names = {}
+
+
+def gene_list_name(mutation_source_name):
+    """Name of the list of significant genes for given mutation source,
+    or None if there is no such list.
+
+    The lists are created only by imports, so the names are cached
+    (once found).
+    """
+    if mutation_source_name not in gene_lists_names:
+        gene_list = GeneList.query.filter_by(mutation_source_name=mutation_source_name).first()
+        if not gene_list:
+            return None
+        gene_lists_names[mutation_source_name] = gene_list.name
+    return gene_lists_names[mutation_source_name]
+
+
+def suggest_matching_cancers(query, count=2):
+    cancers = search_text('cancer_name', Cancer, query, count)
+
+    if cancers is None:
+        cancers = levenshtein_sorted(Cancer.query.filter(
+            or_(
+                Cancer.code.ilike(query + '%'),
+                Cancer.name.ilike('%' + query + '%'),
+            )
+        ), Cancer.name, query).limit(count)
+
+    cancers = list(cancers)
+
+    # cancers are suggested as links to the list of genes
+    tcga_list_name = gene_list_name(MC3Mutation.name) if cancers else None
 
-    tcga_list = GeneList.query.filter_by(mutation_source_name=MC3Mutation.name).one()
+    if not tcga_list_name:
+        return []
 
     return [
         {
@@ -689,9 +1124,9 @@ def suggest_matching_cancers(query, count=2):
             'type': 'cancer',
             'url': url_for(
                 'GeneView:list',
-                list_name=tcga_list.name,
+                list_name=tcga_list_name,
                 filters=(
-                    'Mutation.sources:in:%s' % tcga_list.mutation_source_name
+                    'Mutation.sources:in:%s' % MC3Mutation.name
                     +
                     ';Mutation.mc3_cancer_code:in:%s' % cancer.code
                 )
@@ -713,13 +1148,17 @@ def suggest_matching_diseases(q, count=3):
         potential_disease = q[:-1]
 
     if potential_disease:
-        disease = (
-            levenshtein_sorted(
-                Disease.query.filter(Disease.name.ilike('%' + potential_disease + '%')),
-                Disease.name,
-                potential_disease
-            )
-         ).first()
+        diseases = search_text('disease_name', Disease, potential_disease, 1)
+        if diseases is None:
+            disease = (
+                levenshtein_sorted(
+                    Disease.query.filter(Disease.name.ilike('%' + potential_disease + '%')),
+                    Disease.name,
+                    potential_disease
+                )
+             ).first()
+        else:
+            disease = diseases[0] if diseases else None
         if disease:
             return json_message(
                 'Do you wish to search for <i>%s</i> mutations? '
@@ -736,7 +1175,10 @@ def suggest_matching_diseases(q, count=3):
         if protein_name.isnumeric():
             protein_name = 'NM_' + protein_name
 
-        disease_like = Disease.name.ilike('%' + disease_name + '%')
+        disease_like = text_filter(
+            'disease_name', Disease.id, disease_name,
+            fallback=Disease.name.ilike('%' + disease_name + '%')
+        )
         disease = Disease.query.filter(disease_like).first()
 
         if disease:
@@ -792,13 +1234,22 @@ def suggest_matching_diseases(q, count=3):
                 for disease, gene, refseq, muts in query
             ]
 
-    diseases = levenshtein_sorted(Disease.query.filter(
-        or_(
-            Disease.name.ilike('%' + q + '%'),
-        )
-    ), Disease.name, q).limit(count)
+    diseases = search_text('disease_name', Disease, q, count)
+
+    if diseases is None:
+        diseases = levenshtein_sorted(Disease.query.filter(
+            or_(
+                Disease.name.ilike('%' + q + '%'),
+            )
+        ), Disease.name, q).limit(count)
+
+    diseases = list(diseases)
 
-    clinvar_list = GeneList.query.filter_by(mutation_source_name=InheritedMutation.name).first()
+    # diseases are suggested as links to the list of genes
+    clinvar_list_name = gene_list_name(InheritedMutation.name) if diseases else None
+
+    if not clinvar_list_name:
+        return items
 
     items += [
         {
@@ -806,9 +1257,9 @@ def suggest_matching_diseases(q, count=3):
             'type': 'disease',
             'url': url_for(
                 'GeneView:list',
-                list_name=clinvar_list.name,
+                list_name=clinvar_list_name,
                 filters=(
-                    'Mutation.sources:in:%s' % clinvar_list.mutation_source_name
+                    'Mutation.sources:in:%s' % InheritedMutation.name
                     +
                     ';Mutation.disease_name:in:%s' % quote_if_needed(disease.name)
                 )
@@ -835,10 +1286,16 @@ def suggest_matching_pathways(query, count=2):
         pathway_filter = Pathway.description.like('%' + query + '%')
         column = Pathway.description
 
-    pathways = Pathway.query.filter(pathway_filter)
-    pathways = levenshtein_sorted(pathways, column, query)
+    pathways = None
+
+    if column is Pathway.description:
+        pathways = search_text('pathway_description', Pathway, query, count + 1)
+
+    if pathways is None:
+        pathways = Pathway.query.filter(pathway_filter)
+        pathways = levenshtein_sorted(pathways, column, query)
 
-    pathways = pathways.limit(count + 1).all()
+        pathways = pathways.limit(count + 1).all()
 
     # show {count} of pathways; if we got {count} + 1 results suggest searching for all
 
@@ -927,13 +1384,10 @@ def match_aa_mutation(gene, mut, query):
         # validate if ref is correct
         valid = False
         for isoform in gene_obj.isoforms:
-            try:
-                if isoform.sequence[pos - 1] == ref:
-                    valid = True
-                    break
-            except IndexError:
-                # not in range of this isoform, nothing scary.
-                pass
+            # (if not in range of this isoform, the residue is empty)
+            if isoform.residue(pos) == ref:
+                valid = True
+                break
 
         if not valid:
             return json_message(
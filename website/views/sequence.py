@@ -13,11 +13,14 @@ from helpers.tracks import MutationsTrack
 from helpers.tracks import SequenceTrack
 from helpers.tracks import Track
 from helpers.tracks import TrackElement
+from helpers.views import conditional_get
 from models import Domain
 from models import Mutation
 from models import Site
 from views.abstract_protein import AbstractProteinView, GracefulFilterManager, ProteinRepresentation
-from ._commons import represent_mutation
+from views.abstract_protein import protein_filters_scope
+from views.abstract_protein import cached_response, prerendered_or_rendered
+from ._commons import filtered_site_index, represent_mutation
 from .filters import common_filters, ProteinFiltersData
 from .filters import create_widgets
 
@@ -86,11 +89,17 @@ class SequenceRepresentation(ProteinRepresentation):
 
         data_filter = self.filter_manager.apply
 
+        # sites are filtered and indexed once for all the mutations
+        site_index = filtered_site_index(self.protein, self.filter_manager)
+
+        mutations = list(self.protein_mutations)
+        impacts = Mutation.impacts_on_ptm(mutations, site_index)
+
         response = []
 
-        for mutation in self.protein_mutations:
+        for mutation, impact in zip(mutations, impacts):
 
-            needle = represent_mutation(mutation, data_filter)
+            needle = represent_mutation(mutation, data_filter, site_index=site_index)
 
             field = get_source_data(mutation)
             metadata = {
@@ -105,7 +114,7 @@ class SequenceRepresentation(ProteinRepresentation):
             needle['summary'] = field.summary(data_filter)
             needle['value'] = field.get_value(data_filter)
             needle['meta'] = metadata
-            needle['category'] = mutation.impact_on_ptm(data_filter)
+            needle['category'] = impact
 
             response.append(needle)
 
@@ -117,10 +126,28 @@ class SequenceViewFilters(GracefulFilterManager):
     def __init__(self, protein, **kwargs):
 
         filters = common_filters(protein, **kwargs)
-        super().__init__(filters)
+        super().__init__(filters, state_scope=protein_filters_scope(protein, **kwargs))
         self.update_from_request(request)
 
 
+def render_sequence(protein, filter_manager):
+    """Needle plot, tracks and mutation table (with templates rendered)"""
+    data = SequenceRepresentation(protein, filter_manager).as_json()
+
+    data['mutation_table'] = template(
+        'protein/mutation_table.html',
+        mutations=data['mutations'],
+        filters=filter_manager,
+        protein=protein,
+        value_type=data['value_type']
+    )
+    data['tracks'] = template(
+        'protein/tracks.html',
+        tracks=data['tracks']
+    )
+    return data
+
+
 class SequenceView(AbstractProteinView):
     """Single protein view: includes needleplot and sequence"""
 
@@ -130,23 +157,13 @@ class SequenceView(AbstractProteinView):
         """Show SearchView as default page"""
         return redirect(url_for('SearchView:default', target='proteins'))
 
+    @conditional_get
+    @cached_response
     def representation_data(self, refseq):
 
         protein, filter_manager = self.get_protein_and_manager(refseq)
 
-        data = SequenceRepresentation(protein, filter_manager).as_json()
-
-        data['mutation_table'] = template(
-            'protein/mutation_table.html',
-            mutations=data['mutations'],
-            filters=filter_manager,
-            protein=protein,
-            value_type=data['value_type']
-        )
-        data['tracks'] = template(
-            'protein/tracks.html',
-            tracks=data['tracks']
-        )
+        data = prerendered_or_rendered('sequence', render_sequence, protein, filter_manager)
 
         response = {
             'content': data,